@@ -14,13 +14,25 @@ import copy
 import csv
 import datetime
 import gzip
+import json
 import logging
 import numpy as np
-import odict
+cimport numpy as np
+from libc.limits cimport LONG_MIN
+from libc.math cimport rint, NAN
+from libc.stdlib cimport strtod
+from libc.string cimport memcmp
+from posix.time cimport clock_gettime, timespec, CLOCK_MONOTONIC
+from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_FromStringAndSize, \
+    PyBytes_GET_SIZE
 import os
 import pandas
+import Queue
+import struct
 import sys
+import threading
 import time
+import zlib
 
 col_names = \
   ['record_indicator',
@@ -46,11 +58,3149 @@ col_names = \
    'algo_ind',
    'client_id_flag']
 
+np.import_array()
+
 # Some aliases for bids and asks:
 BID = BUY = 'B'
 ASK = SELL = 'S'
 
-class LimitOrderBook(object):
+cdef inline object side_to_str(char indicator):
+    if indicator == c'B':
+        return BID
+    elif indicator == c'S':
+        return ASK
+    else:
+        raise ValueError('invalid buy/sell indicator')
+
+cdef inline object flag_to_str(char flag):
+    if flag == c'Y':
+        return 'Y'
+    else:
+        return 'N'
+
+# Number of microseconds in a day and proleptic Gregorian ordinal of the
+# first day of the epoch (1970-01-01):
+DEF US_PER_DAY = 86400000000LL
+DEF EPOCH_ORDINAL = 719163
+
+cdef inline int _digits(char *s, int n):
+    cdef int i, v = 0
+    for i in range(n):
+        if s[i] < c'0' or s[i] > c'9':
+            return -1
+        v = v*10+(s[i]-c'0')
+    return v
+
+cdef inline long long _days_from_civil(long long y, long long m, long long d):
+
+    # Number of days between 1970-01-01 and the specified date in the
+    # proleptic Gregorian calendar:
+    cdef long long era, yoe, doy, doe
+    if m <= 2:
+        y -= 1
+    era = y//400
+    yoe = y-era*400
+    doy = (153*(m+(-3 if m > 2 else 9))+2)//5+d-1
+    doe = yoe*365+yoe//4-yoe//100+doy
+    return era*146097+doe-719468
+
+cdef long long _parse_date(object date) except? -1:
+    cdef bytes b = date
+    cdef char *s = b
+    cdef int m, d, y
+    if len(b) != 10 or s[2] != c'/' or s[5] != c'/':
+        raise ValueError('invalid date: %s' % date)
+    m = _digits(s, 2)
+    d = _digits(s+3, 2)
+    y = _digits(s+6, 4)
+    if m < 1 or m > 12 or d < 1 or d > 31 or y < 0:
+        raise ValueError('invalid date: %s' % date)
+    return _days_from_civil(y, m, d)*US_PER_DAY
+
+cdef long long _parse_time(object time) except? -1:
+    cdef bytes b = time
+    cdef char *s = b
+    cdef Py_ssize_t n = len(b)
+    cdef int h, m, sec, us = 0, k
+    if n < 8 or n == 9 or n > 15 or s[2] != c':' or s[5] != c':' or \
+       (n > 8 and s[8] != c'.'):
+        raise ValueError('invalid time: %s' % time)
+    h = _digits(s, 2)
+    m = _digits(s+3, 2)
+    sec = _digits(s+6, 2)
+    if n > 8:
+        us = _digits(s+9, n-9)
+        for k in range(n-9, 6):
+            us *= 10
+    if h < 0 or h > 23 or m < 0 or m > 59 or sec < 0 or sec > 61 or us < 0:
+        raise ValueError('invalid time: %s' % time)
+    return ((h*60+m)*60+sec)*1000000LL+us
+
+def parse_timestamp(date, time):
+    """
+    Convert a transaction date and time into microseconds since the epoch.
+
+    Parameters
+    ----------
+    date : str
+        Date (MM/DD/YYYY).
+    time : str
+        Time (HH:MM:SS.XXXXXX).
+
+    Returns
+    -------
+    timestamp : int
+        Number of microseconds since 1970-01-01 00:00:00.
+
+    """
+
+    return _parse_date(date)+_parse_time(time)
+
+def parse_timestamps(trans_date, trans_time):
+    """
+    Convert arrays of transaction dates and times into microseconds since the epoch.
+
+    Parameters
+    ----------
+    trans_date : array_like
+        Dates (MM/DD/YYYY).
+    trans_time : array_like
+        Times (HH:MM:SS.XXXXXX).
+
+    Returns
+    -------
+    timestamp : numpy.ndarray
+        Array of numpy.int64 microseconds since 1970-01-01 00:00:00.
+
+    Notes
+    -----
+    The fields are parsed directly from their fixed-width representations;
+    each date is only parsed when it differs from that of the previous entry.
+
+    """
+
+    cdef object[:] dates = np.asarray(trans_date, dtype=object)
+    cdef object[:] times = np.asarray(trans_time, dtype=object)
+    cdef Py_ssize_t i, N = dates.shape[0]
+    cdef np.ndarray result
+    cdef np.int64_t[:] timestamp
+    cdef long long date_us = 0
+    cdef object date, last_date = None
+
+    if times.shape[0] != N:
+        raise ValueError('column lengths must be identical')
+    result = np.empty(N, np.int64)
+    timestamp = result
+    for i in range(N):
+        date = dates[i]
+        if date != last_date:
+            date_us = _parse_date(date)
+            last_date = date
+        timestamp[i] = date_us+_parse_time(times[i])
+    return result
+
+def ticks_per_unit(tick_size):
+    """
+    Return the number of price ticks per unit of currency.
+
+    Parameters
+    ----------
+    tick_size : float
+        Minimum price increment.
+
+    Returns
+    -------
+    n : int
+        Number of ticks per unit of currency.
+
+    """
+
+    n = int(round(1.0/tick_size))
+    if n < 1 or abs(n*tick_size-1.0) > 1e-9:
+        raise ValueError('tick size must evenly divide 1')
+    return n
+
+def price_to_ticks(price, tick_size=0.05):
+    """
+    Convert prices to integer numbers of ticks.
+
+    Parameters
+    ----------
+    price : array_like
+        Prices.
+    tick_size : float
+        Minimum price increment.
+
+    Returns
+    -------
+    ticks : numpy.ndarray
+        Array of numpy.int64 tick counts; prices that do not fall on the tick
+        grid are rounded to the nearest tick.
+
+    """
+
+    return np.rint(np.asarray(price, dtype=np.float64)*\
+                   ticks_per_unit(tick_size)).astype(np.int64)
+
+def char_codes(values):
+    """
+    Convert an array of single-character strings into an array of byte codes.
+
+    Parameters
+    ----------
+    values : array_like
+        Single-character strings such as 'B'/'S' or 'Y'/'N'.
+
+    Returns
+    -------
+    codes : numpy.ndarray
+        Array of numpy.uint8 character codes.
+
+    """
+
+    return np.ascontiguousarray(np.asarray(values, dtype='S1')).view(np.uint8)
+
+def frame_to_columns(df, tick_size=0.05):
+    """
+    Extract the typed columns used by the LOB from a DataFrame of orders.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Each row of this DataFrame instance contains a single order; the
+        columns must be named as in `col_names`.
+    tick_size : float
+        Minimum price increment used to convert limit prices to ticks.
+
+    Returns
+    -------
+    columns : dict
+        Arrays that may be passed as keyword arguments to
+        `LimitOrderBook.process_columns`.
+
+    """
+
+    return dict(order_number=np.ascontiguousarray(df['order_number'].values, dtype=np.int64),
+                trans_date=np.asarray(df['trans_date'].values, dtype=object),
+                trans_time=np.asarray(df['trans_time'].values, dtype=object),
+                timestamp=parse_timestamps(df['trans_date'].values,
+                                           df['trans_time'].values),
+                buy_sell_indicator=char_codes(df['buy_sell_indicator'].values),
+                activity_type=np.ascontiguousarray(df['activity_type'].values, dtype=np.int64),
+                expiry_date=np.asarray(df['expiry_date'].values, dtype=object),
+                volume_disclosed=np.ascontiguousarray(df['volume_disclosed'].values, dtype=np.int64),
+                volume_original=np.ascontiguousarray(df['volume_original'].values, dtype=np.int64),
+                limit_price=price_to_ticks(df['limit_price'].values, tick_size),
+                mkt_flag=char_codes(df['mkt_flag'].values),
+                io_flag=char_codes(df['io_flag'].values),
+                on_stop_flag=char_codes(df['on_stop_flag'].values),
+                trigger_price=price_to_ticks(df['trigger_price'].values, tick_size))
+
+# Positions of the fields of the order file format that are used by the LOB:
+DEF F_ORDER_NUMBER = 2
+DEF F_TRANS_DATE = 3
+DEF F_TRANS_TIME = 4
+DEF F_BUY_SELL_INDICATOR = 5
+DEF F_ACTIVITY_TYPE = 6
+DEF F_SYMBOL = 7
+DEF F_EXPIRY_DATE = 9
+DEF F_VOLUME_DISCLOSED = 12
+DEF F_VOLUME_ORIGINAL = 13
+DEF F_LIMIT_PRICE = 14
+DEF F_TRIGGER_PRICE = 15
+DEF F_MKT_FLAG = 16
+DEF F_ON_STOP_FLAG = 17
+DEF F_IO_FLAG = 18
+DEF N_FIELDS = 22
+
+def read_blocks(file_name, block_size=1<<20):
+    """
+    Read the contents of a possibly gzip-compressed file in blocks.
+
+    Parameters
+    ----------
+    file_name : str
+        File name; compression is detected from the contents of the file.
+    block_size : int
+        Number of bytes to read from the file at a time.
+
+    Returns
+    -------
+    blocks : generator
+        Generator of uncompressed blocks of data.
+
+    """
+
+    with open(file_name, 'rb') as f:
+        block = f.read(block_size)
+        if not block.startswith('\x1f\x8b'):
+            while block:
+                yield block
+                block = f.read(block_size)
+            return
+
+        # Decompress gzip data (possibly comprising several members):
+        d = zlib.decompressobj(16+zlib.MAX_WBITS)
+        while block:
+            data = d.decompress(block)
+            if data:
+                yield data
+            while d.unused_data:
+                block = d.unused_data
+                d = zlib.decompressobj(16+zlib.MAX_WBITS)
+                data = d.decompress(block)
+                if data:
+                    yield data
+            block = f.read(block_size)
+        data = d.flush()
+        if data:
+            yield data
+
+cdef long long _parse_int(char *s, Py_ssize_t n) except? -1:
+    cdef Py_ssize_t i = 0
+    cdef long long v = 0
+    cdef bint neg = False
+    if n > 0 and (s[0] == c'-' or s[0] == c'+'):
+        neg = s[0] == c'-'
+        i = 1
+    if i == n:
+        raise ValueError('invalid integer: %r' % s[:n])
+    while i < n:
+        if s[i] < c'0' or s[i] > c'9':
+            raise ValueError('invalid integer: %r' % s[:n])
+        v = v*10+(s[i]-c'0')
+        i += 1
+    return -v if neg else v
+
+cdef inline object _bytes_field(char *s, Py_ssize_t n, object last):
+
+    # Reuse the previous value of a field when it hasn't changed:
+    if last is not None and PyBytes_GET_SIZE(last) == n and \
+       memcmp(PyBytes_AS_STRING(last), s, n) == 0:
+        return last
+    return PyBytes_FromStringAndSize(s, n)
+
+cdef class OrderReader:
+    """
+    Streaming reader for order files.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of file containing orders in the format described in the
+        README. The file may be compressed with gzip. If the reader is only
+        used to parse orders received by other means (see `parse`), the name
+        is only used in error messages.
+    batch_size : int
+        Maximum number of orders in each batch.
+    tick_size : float
+        Minimum price increment used to convert limit prices to ticks.
+    symbols : bool
+        If set to True, the batches also contain a 'symbol' column for use
+        with `BookManager.process_columns`.
+    start : int
+        Number of orders at the beginning of the file to skip.
+
+    Notes
+    -----
+    Iterating over a reader yields dictionaries of column arrays that may be
+    passed as keyword arguments to `LimitOrderBook.process_columns`. Only the
+    fields used by the LOB are parsed; timestamps are computed and prices are
+    converted to ticks while the file is read.
+
+    """
+
+    cdef readonly object file_name
+    cdef readonly Py_ssize_t batch_size
+    cdef readonly double tick_size
+    cdef readonly bint symbols
+    cdef readonly Py_ssize_t start
+    cdef double _ticks_per_unit
+    cdef Py_ssize_t _n, _line
+    cdef dict _columns
+    cdef np.int64_t[:] _order_number, _activity_type, _volume_disclosed, \
+        _volume_original, _limit_price, _trigger_price, _timestamp
+    cdef np.uint8_t[:] _buy_sell_indicator, _mkt_flag, _on_stop_flag, _io_flag
+    cdef object[:] _trans_date, _trans_time, _expiry_date, _symbol
+    cdef object _last_date, _last_expiry_date, _last_symbol
+    cdef long long _date_us
+
+    def __init__(self, file_name, Py_ssize_t batch_size=65536, tick_size=0.05,
+                 symbols=False, Py_ssize_t start=0):
+        if batch_size < 1:
+            raise ValueError('batch size must be positive')
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.tick_size = tick_size
+        self.symbols = symbols
+        self.start = start
+        self._ticks_per_unit = ticks_per_unit(tick_size)
+
+    cdef _new_batch(self):
+        cdef Py_ssize_t n = self.batch_size
+        self._columns = dict(order_number=np.empty(n, np.int64),
+                             trans_date=np.empty(n, object),
+                             trans_time=np.empty(n, object),
+                             buy_sell_indicator=np.empty(n, np.uint8),
+                             activity_type=np.empty(n, np.int64),
+                             expiry_date=np.empty(n, object),
+                             volume_disclosed=np.empty(n, np.int64),
+                             volume_original=np.empty(n, np.int64),
+                             limit_price=np.empty(n, np.int64),
+                             mkt_flag=np.empty(n, np.uint8),
+                             io_flag=np.empty(n, np.uint8),
+                             on_stop_flag=np.empty(n, np.uint8),
+                             trigger_price=np.empty(n, np.int64),
+                             timestamp=np.empty(n, np.int64))
+        self._order_number = self._columns['order_number']
+        self._trans_date = self._columns['trans_date']
+        self._trans_time = self._columns['trans_time']
+        self._buy_sell_indicator = self._columns['buy_sell_indicator']
+        self._activity_type = self._columns['activity_type']
+        self._expiry_date = self._columns['expiry_date']
+        self._volume_disclosed = self._columns['volume_disclosed']
+        self._volume_original = self._columns['volume_original']
+        self._limit_price = self._columns['limit_price']
+        self._mkt_flag = self._columns['mkt_flag']
+        self._io_flag = self._columns['io_flag']
+        self._on_stop_flag = self._columns['on_stop_flag']
+        self._trigger_price = self._columns['trigger_price']
+        self._timestamp = self._columns['timestamp']
+        if self.symbols:
+            self._columns['symbol'] = np.empty(n, object)
+            self._symbol = self._columns['symbol']
+        self._n = 0
+
+    cdef dict _take_batch(self):
+        cdef dict batch = {}
+        for k, v in self._columns.iteritems():
+            batch[k] = v[:self._n]
+        self._new_batch()
+        return batch
+
+    cdef Py_ssize_t _parse(self, bytes data, Py_ssize_t pos, Py_ssize_t end) except -1:
+        """
+        Parse lines from `data` starting at `pos` until the current batch is
+        full or `end` is reached and return the position after the last
+        parsed line.
+        """
+
+        cdef char *buf = data
+        cdef char *s
+        cdef char *endptr
+        cdef char *start[N_FIELDS]
+        cdef Py_ssize_t length[N_FIELDS]
+        cdef Py_ssize_t i, nf, eol, field_start, n
+        cdef double price
+
+        while pos < end and self._n < self.batch_size:
+            eol = pos
+            while eol < end and buf[eol] != c'\n':
+                eol += 1
+            self._line += 1
+            n = eol
+            if n > pos and buf[n-1] == c'\r':
+                n -= 1
+
+            # Skip blank lines:
+            if n == pos:
+                pos = eol+1
+                continue
+
+            # Find the fields of the line:
+            nf = 0
+            field_start = pos
+            for i in range(pos, n+1):
+                if i == n or buf[i] == c',':
+                    if nf < N_FIELDS:
+                        start[nf] = buf+field_start
+                        length[nf] = i-field_start
+                    nf += 1
+                    field_start = i+1
+            if nf <= F_IO_FLAG:
+                raise ValueError('%s, line %i: expected %i fields, found %i' % \
+                                 (self.file_name, self._line, N_FIELDS, nf))
+
+            i = self._n
+            self._order_number[i] = \
+                _parse_int(start[F_ORDER_NUMBER], length[F_ORDER_NUMBER])
+            date = _bytes_field(start[F_TRANS_DATE], length[F_TRANS_DATE],
+                                self._last_date)
+            if date is not self._last_date:
+                self._date_us = _parse_date(date)
+                self._last_date = date
+            self._trans_date[i] = date
+            trans_time = PyBytes_FromStringAndSize(start[F_TRANS_TIME],
+                                                   length[F_TRANS_TIME])
+            self._trans_time[i] = trans_time
+            self._timestamp[i] = self._date_us+_parse_time(trans_time)
+            self._buy_sell_indicator[i] = start[F_BUY_SELL_INDICATOR][0] \
+                if length[F_BUY_SELL_INDICATOR] else 0
+            self._activity_type[i] = \
+                _parse_int(start[F_ACTIVITY_TYPE], length[F_ACTIVITY_TYPE])
+            self._last_expiry_date = \
+                _bytes_field(start[F_EXPIRY_DATE], length[F_EXPIRY_DATE],
+                             self._last_expiry_date)
+            self._expiry_date[i] = self._last_expiry_date
+            if self.symbols:
+                self._last_symbol = \
+                    _bytes_field(start[F_SYMBOL], length[F_SYMBOL],
+                                 self._last_symbol)
+                self._symbol[i] = self._last_symbol
+            self._volume_disclosed[i] = \
+                _parse_int(start[F_VOLUME_DISCLOSED], length[F_VOLUME_DISCLOSED])
+            self._volume_original[i] = \
+                _parse_int(start[F_VOLUME_ORIGINAL], length[F_VOLUME_ORIGINAL])
+            s = start[F_LIMIT_PRICE]
+            price = strtod(s, &endptr)
+            if length[F_LIMIT_PRICE] == 0 or endptr != s+length[F_LIMIT_PRICE]:
+                raise ValueError('%s, line %i: invalid limit price' % \
+                                 (self.file_name, self._line))
+            self._limit_price[i] = <np.int64_t>rint(price*self._ticks_per_unit)
+
+            # The trigger price is only used by stop loss orders and may be
+            # left blank:
+            s = start[F_TRIGGER_PRICE]
+            if length[F_TRIGGER_PRICE] == 0:
+                price = 0
+            else:
+                price = strtod(s, &endptr)
+                if endptr != s+length[F_TRIGGER_PRICE]:
+                    raise ValueError('%s, line %i: invalid trigger price' % \
+                                     (self.file_name, self._line))
+            self._trigger_price[i] = <np.int64_t>rint(price*self._ticks_per_unit)
+            self._mkt_flag[i] = start[F_MKT_FLAG][0] if length[F_MKT_FLAG] else 0
+            self._on_stop_flag[i] = \
+                start[F_ON_STOP_FLAG][0] if length[F_ON_STOP_FLAG] else 0
+            self._io_flag[i] = start[F_IO_FLAG][0] if length[F_IO_FLAG] else 0
+            self._n += 1
+            pos = eol+1
+        return pos
+
+    def parse(self, bytes data):
+        """
+        Parse orders from a block of lines in the order file format.
+
+        Parameters
+        ----------
+        data : str
+            Lines of orders; the last line need not be terminated by a newline.
+
+        Returns
+        -------
+        batches : list of dict
+            Batches of at most `batch_size` orders.
+
+        """
+
+        cdef Py_ssize_t pos = 0, end = len(data)
+        cdef list batches = []
+
+        if self._columns is None:
+            self._new_batch()
+        while pos < end:
+            pos = self._parse(data, pos, end)
+            if self._n == self.batch_size:
+                batches.append(self._take_batch())
+        if self._n > 0:
+            batches.append(self._take_batch())
+        return batches
+
+    def __iter__(self):
+        cdef Py_ssize_t n, skip = self.start
+
+        # Skipped orders must still be parsed to find the lines they occupy:
+        for batch in self._batches():
+            if skip > 0:
+                n = len(batch['timestamp'])
+                if skip >= n:
+                    skip -= n
+                    continue
+                batch = dict((k, v[skip:]) for k, v in batch.iteritems())
+                skip = 0
+            yield batch
+
+    def _batches(self):
+        cdef Py_ssize_t pos, end
+        cdef bytes data, rest = b''
+
+        self._new_batch()
+        self._line = 0
+        self._last_date = self._last_expiry_date = self._last_symbol = None
+        for block in read_blocks(self.file_name):
+            data = rest+block
+
+            # Only parse complete lines; the remainder is prepended to the
+            # next block:
+            end = data.rfind('\n')+1
+            pos = 0
+            while pos < end:
+                pos = self._parse(data, pos, end)
+                if self._n == self.batch_size:
+                    yield self._take_batch()
+            rest = data[end:]
+        if rest:
+            data = rest
+            pos = 0
+            while pos < len(data):
+                pos = self._parse(data, pos, len(data))
+                if self._n == self.batch_size:
+                    yield self._take_batch()
+        if self._n > 0:
+            yield self._take_batch()
+
+# Columns stored in order cache files and their types; the date and time
+# strings are stored with fixed widths:
+cache_columns = [('order_number', np.dtype(np.int64)),
+                 ('trans_date', np.dtype('S10')),
+                 ('trans_time', np.dtype('S15')),
+                 ('buy_sell_indicator', np.dtype(np.uint8)),
+                 ('activity_type', np.dtype(np.int64)),
+                 ('expiry_date', np.dtype('S10')),
+                 ('volume_disclosed', np.dtype(np.int64)),
+                 ('volume_original', np.dtype(np.int64)),
+                 ('limit_price', np.dtype(np.int64)),
+                 ('mkt_flag', np.dtype(np.uint8)),
+                 ('io_flag', np.dtype(np.uint8)),
+                 ('on_stop_flag', np.dtype(np.uint8)),
+                 ('trigger_price', np.dtype(np.int64)),
+                 ('timestamp', np.dtype(np.int64))]
+
+CACHE_MAGIC = '\x93LOBORD\x01'
+
+def _align(offset):
+    return offset+(-offset % 64)
+
+def _chunk_layout(offset, n):
+    """
+    Return the offsets of the columns of a cache chunk and the end of the chunk.
+    """
+
+    offsets = []
+    for name, dtype in cache_columns:
+        offsets.append(offset)
+        offset = _align(offset+n*dtype.itemsize)
+    return offsets, offset
+
+def file_checksum(file_name, block_size=1<<20):
+    """
+    Compute the CRC-32 checksum of the contents of a file.
+    """
+
+    crc = 0
+    with open(file_name, 'rb') as f:
+        block = f.read(block_size)
+        while block:
+            crc = zlib.crc32(block, crc)
+            block = f.read(block_size)
+    return crc & 0xffffffff
+
+def write_order_cache(file_name, cache_file_name, tick_size=0.05,
+                      chunk_size=1<<20):
+    """
+    Convert an order file into a binary cache file.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of file containing orders; it may be compressed with gzip.
+    cache_file_name : str
+        Name of cache file to create.
+    tick_size : float
+        Minimum price increment used to convert limit prices to ticks.
+    chunk_size : int
+        Maximum number of orders in each chunk of the cache file.
+
+    Returns
+    -------
+    index : dict
+        Index of the cache file contents.
+
+    Notes
+    -----
+    The cache file contains the columns returned by `OrderReader` in chunks
+    of up to `chunk_size` orders; each column of each chunk is stored
+    contiguously. A JSON index at the end of the file records the size,
+    modification time and CRC-32 checksum of the source file, the tick size,
+    and the location of each chunk. The file is written under a temporary name
+    and renamed once complete.
+
+    """
+
+    st = os.stat(file_name)
+    index = dict(version=1,
+                 source=os.path.basename(file_name),
+                 source_size=st.st_size,
+                 source_mtime=st.st_mtime,
+                 source_crc32=file_checksum(file_name),
+                 tick_size=tick_size,
+                 count=0,
+                 columns=[[name, dtype.str] for name, dtype in cache_columns],
+                 chunks=[])
+    tmp_file_name = cache_file_name+'.tmp'
+    try:
+        with open(tmp_file_name, 'wb') as f:
+            f.write(CACHE_MAGIC+struct.pack('<Q', 0))
+            offset = _align(f.tell())
+            for columns in OrderReader(file_name, chunk_size, tick_size):
+                n = len(columns['order_number'])
+                offsets, end = _chunk_layout(offset, n)
+                for (name, dtype), col_offset in zip(cache_columns, offsets):
+                    f.seek(col_offset)
+                    data = np.ascontiguousarray(columns[name], dtype)
+                    f.write(data.tostring())
+                index['chunks'].append([offset, n])
+                index['count'] += n
+                offset = end
+
+            # Write the index and its location:
+            f.seek(offset)
+            f.write(json.dumps(index))
+            f.seek(len(CACHE_MAGIC))
+            f.write(struct.pack('<Q', offset))
+    except:
+        # Don't leave a partially written cache file behind:
+        if os.path.exists(tmp_file_name):
+            os.remove(tmp_file_name)
+        raise
+    os.rename(tmp_file_name, cache_file_name)
+    return index
+
+def read_cache_index(cache_file_name):
+    """
+    Read the index of a cache file.
+
+    Parameters
+    ----------
+    cache_file_name : str
+        Name of cache file.
+
+    Returns
+    -------
+    index : dict
+        Index of the cache file contents.
+
+    """
+
+    with open(cache_file_name, 'rb') as f:
+        prelude = f.read(len(CACHE_MAGIC)+8)
+        if len(prelude) != len(CACHE_MAGIC)+8 or \
+           not prelude.startswith(CACHE_MAGIC):
+            raise ValueError('%s is not an order cache file' % cache_file_name)
+        f.seek(struct.unpack('<Q', prelude[len(CACHE_MAGIC):])[0])
+        index = json.loads(f.read())
+    if [list(c) for c in index['columns']] != \
+       [[name, dtype.str] for name, dtype in cache_columns]:
+        raise ValueError('%s has incompatible columns' % cache_file_name)
+    return index
+
+def order_cache_is_current(index, file_name, tick_size=0.05):
+    """
+    Check whether a cache file index matches an order file.
+
+    Parameters
+    ----------
+    index : dict
+        Index of cache file.
+    file_name : str
+        Name of order file.
+    tick_size : float
+        Tick size expected in the cache.
+
+    Returns
+    -------
+    result : bool
+        True if the cache was created from the current contents of the order
+        file with the same tick size. The checksum of the order file is only
+        computed if its modification time differs from that recorded in the
+        index.
+
+    """
+
+    st = os.stat(file_name)
+    if index['tick_size'] != tick_size or index['source_size'] != st.st_size:
+        return False
+    if index['source_mtime'] == st.st_mtime:
+        return True
+    return index['source_crc32'] == file_checksum(file_name)
+
+class CachedOrderReader(object):
+    """
+    Reader for order files that replays them from memory-mapped cache files.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of file containing orders in the format described in the
+        README. The file may be compressed with gzip.
+    batch_size : int
+        Maximum number of orders in each batch.
+    tick_size : float
+        Minimum price increment used to convert limit prices to ticks.
+    cache_file_name : str
+        Name of cache file. If not specified, the name of the order file with
+        the suffix '.cache' appended is used.
+    start : int
+        Number of orders at the beginning of the file to skip.
+
+    Notes
+    -----
+    Iterating over a reader yields the same batches as `OrderReader`. If the
+    cache file does not exist or was not created from the current contents of
+    the order file, it is (re)created first; if it cannot be written, the
+    order file is read directly. The numeric columns of each batch are
+    copy-on-write views of the memory-mapped cache file. Skipped orders are
+    not read from the cache file.
+
+    """
+
+    def __init__(self, file_name, batch_size=65536, tick_size=0.05,
+                 cache_file_name=None, start=0):
+        if batch_size < 1:
+            raise ValueError('batch size must be positive')
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.tick_size = tick_size
+        self.start = start
+        if cache_file_name is None:
+            cache_file_name = file_name+'.cache'
+        self.cache_file_name = cache_file_name
+        self.logger = logging.getLogger('lob')
+
+    def update(self):
+        """
+        Create or recreate the cache file if it isn't current.
+
+        Returns
+        -------
+        index : dict
+            Index of the cache file contents.
+
+        """
+
+        try:
+            index = read_cache_index(self.cache_file_name)
+        except (IOError, OSError, ValueError, KeyError):
+            index = None
+        if index is None or \
+           not order_cache_is_current(index, self.file_name, self.tick_size):
+            self.logger.warning('creating order cache %s' % self.cache_file_name)
+            index = write_order_cache(self.file_name, self.cache_file_name,
+                                      self.tick_size)
+        return index
+
+    def __iter__(self):
+        try:
+            index = self.update()
+        except (IOError, OSError) as e:
+            self.logger.warning('cannot use order cache %s: %s' % \
+                                (self.cache_file_name, e))
+            for columns in OrderReader(self.file_name, self.batch_size,
+                                       self.tick_size, start=self.start):
+                yield columns
+            return
+        if index['count'] <= self.start:
+            return
+        data = np.memmap(self.cache_file_name, np.uint8, 'c')
+        skip = self.start
+        for offset, n in index['chunks']:
+            if skip >= n:
+                skip -= n
+                continue
+            offsets, end = _chunk_layout(offset, n)
+            chunk = {}
+            for (name, dtype), col_offset in zip(cache_columns, offsets):
+                chunk[name] = data[col_offset:col_offset+n*dtype.itemsize].view(dtype)
+            first, skip = skip, 0
+            for start in xrange(first, n, self.batch_size):
+                stop = min(start+self.batch_size, n)
+                columns = {}
+                for name, dtype in cache_columns:
+                    if dtype.kind == 'S':
+                        columns[name] = chunk[name][start:stop].astype(object)
+                    else:
+                        columns[name] = chunk[name][start:stop]
+                yield columns
+
+cdef class OrderPool:
+    """
+    Storage for the orders resting in a limit order book.
+
+    Parameters
+    ----------
+    capacity : int
+        Initial number of order slots.
+
+    Notes
+    -----
+    Each field of the stored orders is kept in a separate array indexed by
+    slot number. The `prev` and `next` arrays link the slots of each price
+    level into FIFO queues and the `seq` array records the order in which the
+    slots were queued at their level; released slots are chained into a free
+    list through the `next` array. The pool doubles its capacity when it runs out
+    of free slots.
+
+    """
+
+    cdef np.ndarray _order_number, _indicator, _tick, \
+        _volume_original, _volume_disclosed, _seq, _prev, _next
+    cdef np.int64_t *order_number
+    cdef char *indicator
+    cdef np.int64_t *tick
+    cdef np.int64_t *volume_original
+    cdef np.int64_t *volume_disclosed
+    cdef np.int64_t *seq
+    cdef np.int32_t *prev
+    cdef np.int32_t *next
+    cdef np.int32_t free_head
+    cdef readonly Py_ssize_t capacity
+    cdef readonly Py_ssize_t count
+
+    def __cinit__(self, Py_ssize_t capacity=1024):
+        self._order_number = np.empty(0, np.int64)
+        self._indicator = np.empty(0, np.uint8)
+        self._tick = np.empty(0, np.int64)
+        self._volume_original = np.empty(0, np.int64)
+        self._volume_disclosed = np.empty(0, np.int64)
+        self._seq = np.empty(0, np.int64)
+        self._prev = np.empty(0, np.int32)
+        self._next = np.empty(0, np.int32)
+        self.capacity = 0
+        self.count = 0
+        self.free_head = -1
+        self.resize(max(capacity, 1))
+
+    cdef resize(self, Py_ssize_t capacity):
+        cdef Py_ssize_t i, n = self.capacity
+
+        self._order_number = self._grow(self._order_number, capacity)
+        self._indicator = self._grow(self._indicator, capacity)
+        self._tick = self._grow(self._tick, capacity)
+        self._volume_original = self._grow(self._volume_original, capacity)
+        self._volume_disclosed = self._grow(self._volume_disclosed, capacity)
+        self._seq = self._grow(self._seq, capacity)
+        self._prev = self._grow(self._prev, capacity)
+        self._next = self._grow(self._next, capacity)
+        self._attach()
+
+        # Chain the new slots onto the front of the free list:
+        for i in range(n, capacity-1):
+            self.next[i] = i+1
+        self.next[capacity-1] = self.free_head
+        self.free_head = n
+        self.capacity = capacity
+
+    cdef _attach(self):
+        """
+        Point the field pointers at the data of the slot arrays.
+        """
+
+        self.order_number = <np.int64_t *>np.PyArray_DATA(self._order_number)
+        self.indicator = <char *>np.PyArray_DATA(self._indicator)
+        self.tick = <np.int64_t *>np.PyArray_DATA(self._tick)
+        self.volume_original = <np.int64_t *>np.PyArray_DATA(self._volume_original)
+        self.volume_disclosed = <np.int64_t *>np.PyArray_DATA(self._volume_disclosed)
+        self.seq = <np.int64_t *>np.PyArray_DATA(self._seq)
+        self.prev = <np.int32_t *>np.PyArray_DATA(self._prev)
+        self.next = <np.int32_t *>np.PyArray_DATA(self._next)
+
+    cdef np.ndarray _grow(self, np.ndarray a, Py_ssize_t capacity):
+        cdef np.ndarray b = np.empty(capacity, a.dtype)
+        b[:a.shape[0]] = a
+        return b
+
+    cdef np.int32_t alloc(self, long long order_number, char indicator,
+                          long tick, long volume_original,
+                          long volume_disclosed) except -1:
+        """
+        Store an order in a free slot and return the slot number.
+        """
+
+        cdef np.int32_t slot
+        if self.free_head == -1:
+            self.resize(2*self.capacity)
+        slot = self.free_head
+        self.free_head = self.next[slot]
+        self.order_number[slot] = order_number
+        self.indicator[slot] = indicator
+        self.tick[slot] = tick
+        self.volume_original[slot] = volume_original
+        self.volume_disclosed[slot] = volume_disclosed
+        self.prev[slot] = -1
+        self.next[slot] = -1
+        self.count += 1
+        return slot
+
+    cdef void release(self, np.int32_t slot):
+        """
+        Return a slot to the free list.
+        """
+
+        self.next[slot] = self.free_head
+        self.free_head = slot
+        self.count -= 1
+
+    cpdef clear(self):
+        """
+        Release all slots.
+        """
+
+        cdef Py_ssize_t i
+        for i in range(self.capacity-1):
+            self.next[i] = i+1
+        self.next[self.capacity-1] = -1
+        self.free_head = 0
+        self.count = 0
+
+    cdef OrderPool copy(self):
+        """
+        Return a pool containing copies of all slots.
+        """
+
+        cdef OrderPool pool = OrderPool(1)
+        pool._order_number = self._order_number.copy()
+        pool._indicator = self._indicator.copy()
+        pool._tick = self._tick.copy()
+        pool._volume_original = self._volume_original.copy()
+        pool._volume_disclosed = self._volume_disclosed.copy()
+        pool._seq = self._seq.copy()
+        pool._prev = self._prev.copy()
+        pool._next = self._next.copy()
+        pool._attach()
+        pool.free_head = self.free_head
+        pool.capacity = self.capacity
+        pool.count = self.count
+        return pool
+
+# Order numbers consist of a date (YYYYMMDD) followed by an 8-digit sequence
+# number:
+DEF SEQUENCE_MODULUS = 100000000LL
+
+cdef class OrderIndex:
+    """
+    Map the numbers of the orders resting in a limit order book to their slots.
+
+    Parameters
+    ----------
+    capacity : int
+        Initial number of sequence numbers spanned by the array of slots.
+    max_size : int
+        Maximum number of sequence numbers spanned by the array of slots.
+
+    Notes
+    -----
+    The slots of orders whose date prefix is that of the first order inserted
+    after the index was cleared are stored in an array indexed by sequence
+    number; the array starts at the sequence number of that order and doubles
+    its span (and is shifted towards lower sequence numbers if necessary) when
+    a sequence number falls outside of it. The slots of orders with other
+    dates or with sequence numbers that would make the array span more than
+    `max_size` numbers are stored in a dict. Empty entries contain -1. Clearing
+    the index only resets the range of the array that has been used.
+
+    """
+
+    cdef np.ndarray _slots
+    cdef np.int32_t *slots
+    cdef readonly Py_ssize_t size
+    cdef Py_ssize_t max_size
+    cdef long long date, base
+    cdef Py_ssize_t lo, hi
+    cdef dict other
+    cdef readonly Py_ssize_t count
+
+    def __cinit__(self, Py_ssize_t capacity=65536, Py_ssize_t max_size=1<<24):
+        self._slots = np.empty(max(capacity, 1), np.int32)
+        self._slots.fill(-1)
+        self.slots = <np.int32_t *>np.PyArray_DATA(self._slots)
+        self.size = self._slots.shape[0]
+        self.max_size = max(max_size, self.size)
+        self.other = {}
+        self.date = -1
+        self.base = 0
+        self.lo = self.size
+        self.hi = 0
+        self.count = 0
+
+    cdef inline Py_ssize_t _index(self, long long order_number):
+        """
+        Return the array index of an order number or -1 if it is not spanned
+        by the array.
+        """
+
+        cdef long long i
+        if order_number//SEQUENCE_MODULUS != self.date:
+            return -1
+        i = order_number%SEQUENCE_MODULUS-self.base
+        if 0 <= i < self.size:
+            return i
+        return -1
+
+    cdef bint _span(self, long long seq) except -1:
+        """
+        Grow the array so that it spans the specified sequence number; return
+        False if the array would exceed its maximum size.
+        """
+
+        cdef long long base = min(self.base, seq)
+        cdef long long end = max(self.base+self.size, seq+1)
+        cdef Py_ssize_t size = self.size, shift
+        cdef np.ndarray slots
+        if end-base > self.max_size:
+            return False
+        while size < end-base:
+            size *= 2
+
+        # Leave room for lower sequence numbers when extending the array
+        # downwards:
+        if seq < self.base:
+            base = max(end-size, 0)
+        shift = self.base-base
+        slots = np.empty(size, np.int32)
+        slots.fill(-1)
+        slots[shift:shift+self.size] = self._slots
+        self._slots = slots
+        self.slots = <np.int32_t *>np.PyArray_DATA(slots)
+        self.size = size
+        self.base = base
+        self.lo += shift
+        self.hi += shift
+        return True
+
+    cdef np.int32_t get(self, long long order_number):
+        """
+        Return the slot of an order or -1 if the order is not in the index.
+        """
+
+        cdef Py_ssize_t i = self._index(order_number)
+        if i >= 0:
+            return self.slots[i]
+        if self.other:
+            return self.other.get(order_number, -1)
+        return -1
+
+    cdef set(self, long long order_number, np.int32_t slot):
+        """
+        Store the slot of an order.
+        """
+
+        cdef Py_ssize_t i
+        if self.date == -1:
+            self.date = order_number//SEQUENCE_MODULUS
+            self.base = order_number%SEQUENCE_MODULUS
+        i = self._index(order_number)
+        if i < 0 and order_number//SEQUENCE_MODULUS == self.date and \
+           self._span(order_number%SEQUENCE_MODULUS):
+            i = self._index(order_number)
+        if i >= 0:
+            if self.slots[i] == -1:
+                self.count += 1
+            self.slots[i] = slot
+            if i < self.lo:
+                self.lo = i
+            if i >= self.hi:
+                self.hi = i+1
+        else:
+            if order_number not in self.other:
+                self.count += 1
+            self.other[order_number] = slot
+
+    cdef remove(self, long long order_number):
+        """
+        Remove an order from the index.
+        """
+
+        cdef Py_ssize_t i = self._index(order_number)
+        if i >= 0:
+            if self.slots[i] != -1:
+                self.slots[i] = -1
+                self.count -= 1
+        elif order_number in self.other:
+            del self.other[order_number]
+            self.count -= 1
+
+    cpdef clear(self):
+        """
+        Remove all orders.
+        """
+
+        if self.lo < self.hi:
+            self._slots[self.lo:self.hi] = -1
+        self.lo = self.size
+        self.hi = 0
+        self.other.clear()
+        self.date = -1
+        self.count = 0
+
+    cdef OrderIndex copy(self):
+        """
+        Return an index containing the same entries.
+        """
+
+        cdef OrderIndex index = OrderIndex(1, self.max_size)
+        index._slots = self._slots.copy()
+        index.slots = <np.int32_t *>np.PyArray_DATA(index._slots)
+        index.size = self.size
+        index.date = self.date
+        index.base = self.base
+        index.lo = self.lo
+        index.hi = self.hi
+        index.other = self.other.copy()
+        index.count = self.count
+        return index
+
+    def __contains__(self, order_number):
+        return self.get(order_number) != -1
+
+    def __len__(self):
+        return self.count
+
+cdef class PriceLevel:
+    """
+    FIFO queues of the orders resting at a single price level.
+
+    Parameters
+    ----------
+    pool : OrderPool
+        Pool in which the orders in the queues are stored.
+    indicator : str
+        Buy ('B') or sell ('S') side of the level.
+    tick : int
+        Price associated with the level in ticks.
+
+    Notes
+    -----
+    Orders with zero disclosed volume are kept in a visible queue and orders
+    with explicitly disclosed volume in a hidden queue; each queue is ordered
+    from oldest to newest. Orders are matched from the head of the visible
+    queue first, and from the head of the hidden queue once the visible queue
+    is empty. Iterating over a level yields the numbers of all of its orders
+    from oldest to newest.
+
+    """
+
+    cdef OrderPool pool
+    cdef readonly object indicator
+    cdef readonly long tick
+    cdef readonly long volume_original_total
+    cdef readonly long volume_disclosed_total
+    cdef readonly Py_ssize_t count
+    cdef np.int32_t visible_head, visible_tail
+    cdef np.int32_t hidden_head, hidden_tail
+    cdef np.int64_t next_seq
+
+    def __cinit__(self, OrderPool pool, indicator, long tick):
+        self.pool = pool
+        self.indicator = indicator
+        self.tick = tick
+        self.volume_original_total = 0
+        self.volume_disclosed_total = 0
+        self.count = 0
+        self.visible_head = self.visible_tail = -1
+        self.hidden_head = self.hidden_tail = -1
+        self.next_seq = 0
+
+    cdef inline np.int32_t first(self):
+        """
+        Return the slot of the next order to match or -1 if the level is empty.
+        """
+
+        if self.visible_head != -1:
+            return self.visible_head
+        return self.hidden_head
+
+    cdef void append(self, np.int32_t slot):
+        """
+        Push the order in the specified slot onto the end of its queue.
+        """
+
+        cdef OrderPool pool = self.pool
+        pool.seq[slot] = self.next_seq
+        self.next_seq += 1
+        self._link(slot)
+        self.volume_original_total += pool.volume_original[slot]
+        self.volume_disclosed_total += pool.volume_disclosed[slot]
+        self.count += 1
+
+    cdef void remove(self, np.int32_t slot):
+        """
+        Unlink the order in the specified slot from its queue.
+        """
+
+        cdef OrderPool pool = self.pool
+        self._unlink(slot)
+        self.volume_original_total -= pool.volume_original[slot]
+        self.volume_disclosed_total -= pool.volume_disclosed[slot]
+        self.count -= 1
+
+    cdef void update(self, np.int32_t slot, long volume_original,
+                     long volume_disclosed):
+        """
+        Change the volumes of the order in the specified slot in place.
+
+        Notes
+        -----
+        If the change moves the order between the visible and hidden queues, it
+        is inserted into its new queue according to when it was originally
+        queued at the level.
+        """
+
+        cdef OrderPool pool = self.pool
+        cdef bint move = \
+            (pool.volume_disclosed[slot] > 0) != (volume_disclosed > 0)
+        if move:
+            self._unlink(slot)
+        self.volume_original_total += volume_original-pool.volume_original[slot]
+        self.volume_disclosed_total += volume_disclosed-pool.volume_disclosed[slot]
+        pool.volume_original[slot] = volume_original
+        pool.volume_disclosed[slot] = volume_disclosed
+        if move:
+            self._link(slot)
+
+    cdef void _link(self, np.int32_t slot):
+        cdef OrderPool pool = self.pool
+        cdef np.int32_t *head
+        cdef np.int32_t *tail
+        cdef np.int32_t after
+        if pool.volume_disclosed[slot] > 0:
+            head, tail = &self.hidden_head, &self.hidden_tail
+        else:
+            head, tail = &self.visible_head, &self.visible_tail
+
+        # Find the newest queued order that precedes the slot; this is the
+        # tail of the queue unless the slot is being moved between queues:
+        after = tail[0]
+        while after != -1 and pool.seq[after] > pool.seq[slot]:
+            after = pool.prev[after]
+        pool.prev[slot] = after
+        if after == -1:
+            pool.next[slot] = head[0]
+            head[0] = slot
+        else:
+            pool.next[slot] = pool.next[after]
+            pool.next[after] = slot
+        if pool.next[slot] == -1:
+            tail[0] = slot
+        else:
+            pool.prev[pool.next[slot]] = slot
+
+    cdef void _unlink(self, np.int32_t slot):
+        cdef OrderPool pool = self.pool
+        cdef np.int32_t *head
+        cdef np.int32_t *tail
+        if pool.volume_disclosed[slot] > 0:
+            head, tail = &self.hidden_head, &self.hidden_tail
+        else:
+            head, tail = &self.visible_head, &self.visible_tail
+        if pool.prev[slot] == -1:
+            head[0] = pool.next[slot]
+        else:
+            pool.next[pool.prev[slot]] = pool.next[slot]
+        if pool.next[slot] == -1:
+            tail[0] = pool.prev[slot]
+        else:
+            pool.prev[pool.next[slot]] = pool.prev[slot]
+
+    cdef list slots(self):
+        """
+        Return the slots of all orders in the level from oldest to newest.
+        """
+
+        cdef OrderPool pool = self.pool
+        cdef np.int32_t v = self.visible_head, h = self.hidden_head
+        cdef list result = []
+        while v != -1 or h != -1:
+            if h == -1 or (v != -1 and pool.seq[v] < pool.seq[h]):
+                result.append(v)
+                v = pool.next[v]
+            else:
+                result.append(h)
+                h = pool.next[h]
+        return result
+
+    cdef PriceLevel copy(self, OrderPool pool):
+        """
+        Return a copy of the level whose queues link the same slots of
+        another pool (e.g., a copy of the pool of the level).
+        """
+
+        cdef PriceLevel level = PriceLevel(pool, self.indicator, self.tick)
+        level.volume_original_total = self.volume_original_total
+        level.volume_disclosed_total = self.volume_disclosed_total
+        level.count = self.count
+        level.visible_head = self.visible_head
+        level.visible_tail = self.visible_tail
+        level.hidden_head = self.hidden_head
+        level.hidden_tail = self.hidden_tail
+        level.next_seq = self.next_seq
+        return level
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for slot in self.slots():
+            yield self.pool.order_number[slot]
+
+cdef class PriceLadder:
+    """
+    Price level queues on one side of a limit order book.
+
+    Parameters
+    ----------
+    indicator : str
+        Buy ('B') or sell ('S') side of the book; the best level is the
+        highest bid or lowest ask, respectively.
+    size : int
+        Number of ticks spanned by the array of levels.
+
+    Notes
+    -----
+    Levels within the span of an array centered on a reference tick are
+    stored in that array and indexed by tick; levels outside of it are
+    stored in a red-black tree. The reference tick is set to that of the first
+    level inserted into an empty ladder. The best tick is cached and updated
+    incrementally as levels are inserted and removed; after removal of the best
+    level, the array is scanned from the removed tick to the next occupied
+    one.
+
+    """
+
+    cdef readonly object indicator
+    cdef bint is_bid
+    cdef list levels
+    cdef long base, size
+    cdef Py_ssize_t window_count
+    cdef object far
+    cdef readonly Py_ssize_t count
+    cdef readonly long best
+
+    def __cinit__(self, indicator, long size=4096):
+        self.indicator = indicator
+        self.is_bid = indicator == BID
+        self.size = size
+        self.levels = [None]*size
+        self.base = 0
+        self.window_count = 0
+        self.far = rbtree.rbtree()
+        self.count = 0
+        self.best = 0
+
+    cdef PriceLevel get(self, long tick):
+        """
+        Return the level at the specified tick or None.
+        """
+
+        cdef long i = tick-self.base
+        if 0 <= i < self.size:
+            return self.levels[i]
+        return self.far.get(tick)
+
+    cdef insert(self, PriceLevel level):
+        """
+        Insert a new level.
+        """
+
+        cdef long tick = level.tick
+        cdef long i
+
+        # Center the array on the first level inserted into an empty ladder:
+        if self.count == 0:
+            self.base = tick-self.size/2
+        i = tick-self.base
+        if 0 <= i < self.size:
+            self.levels[i] = level
+            self.window_count += 1
+        else:
+            self.far[tick] = level
+        self.count += 1
+        if self.count == 1 or \
+           (self.is_bid and tick > self.best) or \
+           (not self.is_bid and tick < self.best):
+            self.best = tick
+
+    cdef remove(self, long tick):
+        """
+        Remove the level at the specified tick.
+        """
+
+        cdef long i = tick-self.base
+        if 0 <= i < self.size:
+            self.levels[i] = None
+            self.window_count -= 1
+        else:
+            del self.far[tick]
+        self.count -= 1
+        if self.count > 0 and tick == self.best:
+            self.best = self._find_best(tick)
+
+    cdef long _find_best(self, long old):
+        cdef long i, best = 0
+        cdef bint found = False
+        cdef list levels = self.levels
+
+        # All remaining levels are worse than the removed best level, so
+        # the array only needs to be scanned beyond it:
+        if self.window_count > 0:
+            if self.is_bid:
+                i = min(old-self.base, self.size)-1
+                while i >= 0:
+                    if levels[i] is not None:
+                        best = self.base+i
+                        found = True
+                        break
+                    i -= 1
+            else:
+                i = max(old-self.base+1, 0)
+                while i < self.size:
+                    if levels[i] is not None:
+                        best = self.base+i
+                        found = True
+                        break
+                    i += 1
+        if len(self.far):
+            if self.is_bid:
+                far_best = self.far.max()
+                if not found or far_best > best:
+                    best = far_best
+            else:
+                far_best = self.far.min()
+                if not found or far_best < best:
+                    best = far_best
+        return best
+
+    cpdef clear(self):
+        """
+        Remove all levels.
+        """
+
+        cdef long i
+        for i in range(self.size):
+            self.levels[i] = None
+        self.far.clear()
+        self.window_count = 0
+        self.count = 0
+
+    cdef PriceLadder copy(self, OrderPool pool):
+        """
+        Return a ladder containing copies of all levels whose queues link the
+        slots of another pool.
+        """
+
+        cdef PriceLadder ladder = PriceLadder(self.indicator, self.size)
+        cdef PriceLevel level
+        cdef long i
+        for i in range(self.size):
+            level = self.levels[i]
+            if level is not None:
+                ladder.levels[i] = level.copy(pool)
+        for tick, level in self.far.iteritems():
+            ladder.far[tick] = level.copy(pool)
+        ladder.base = self.base
+        ladder.window_count = self.window_count
+        ladder.count = self.count
+        ladder.best = self.best
+        return ladder
+
+    cdef list top(self, int k):
+        """
+        Return up to `k` levels in order of decreasing priority.
+
+        Notes
+        -----
+        The array is scanned from the best tick towards worse prices until
+        enough levels or all of the levels in the array are found. The tree
+        is traversed lazily in order of decreasing priority, so that only the
+        levels returned are visited; the levels it contains that are better
+        than all of the levels in the array precede those that are worse.
+        """
+
+        cdef list result = []
+        cdef list levels = self.levels
+        cdef long i, step, lo = self.base, hi = self.base+self.size
+        cdef Py_ssize_t found = 0
+        cdef object far_iter, tick = None
+        if self.count == 0 or k <= 0:
+            return result
+
+        if len(self.far):
+            far_iter = reversed(self.far) if self.is_bid else iter(self.far)
+            tick = next(far_iter, None)
+            while tick is not None and len(result) < k and \
+                  (tick >= hi) == self.is_bid:
+                result.append(self.far[tick])
+                tick = next(far_iter, None)
+
+        if self.window_count > 0 and len(result) < k:
+            if self.is_bid:
+                i, step = min(self.best, hi-1)-lo, -1
+            else:
+                i, step = max(self.best, lo)-lo, 1
+            while 0 <= i < self.size and len(result) < k and \
+                  found < self.window_count:
+                if levels[i] is not None:
+                    result.append(levels[i])
+                    found += 1
+                i += step
+        while tick is not None and len(result) < k:
+            result.append(self.far[tick])
+            tick = next(far_iter, None)
+        return result
+
+    def ticks(self):
+        """
+        Return the ticks of all levels in ascending order.
+        """
+
+        cdef long i
+        result = list(self.far.keys())
+        if self.window_count > 0:
+            result.extend([self.base+i for i in range(self.size) \
+                           if self.levels[i] is not None])
+            result.sort()
+        return result
+
+    def __len__(self):
+        return self.count
+
+cdef class TriggerBook:
+    """
+    Stop loss orders on one side of a limit order book awaiting their triggers.
+
+    Parameters
+    ----------
+    indicator : str
+        Buy ('B') or sell ('S') side of the book. Buy stop orders are
+        triggered when the last traded price rises to or above their trigger
+        prices; sell stop orders are triggered when it falls to or below them.
+
+    Notes
+    -----
+    The pending orders are stored in lists indexed by trigger tick in a
+    red-black tree and are kept in order of arrival within each list. The
+    orders triggered by a trade are removed from the end of the tree nearest
+    to the traded price, so releasing them costs time proportional to their
+    number rather than to the number of pending orders. An index of the
+    trigger ticks of the pending orders allows them to be cancelled or
+    modified before they are triggered.
+
+    Each order is stored as a tuple containing its arrival sequence number,
+    order number, buy/sell indicator, limit tick, original volume, disclosed
+    volume, market order flag, and IOC flag.
+
+    """
+
+    cdef readonly object indicator
+    cdef bint is_buy
+    cdef object _tree
+    cdef dict _triggers
+    cdef readonly Py_ssize_t count
+
+    def __cinit__(self, indicator):
+        self.indicator = indicator
+        self.is_buy = indicator == BUY
+        self._tree = rbtree.rbtree()
+        self._triggers = {}
+        self.count = 0
+
+    cdef add(self, long trigger, tuple order):
+        """
+        Add a pending order with the specified trigger tick.
+        """
+
+        cdef list orders = self._tree.get(trigger)
+        if orders is None:
+            self._tree[trigger] = [order]
+        else:
+            orders.append(order)
+        self._triggers[order[1]] = trigger
+        self.count += 1
+
+    cdef bint remove(self, long long order_number):
+        """
+        Remove the pending order with the specified number; return False if
+        there is no such order.
+        """
+
+        cdef list orders
+        cdef Py_ssize_t i
+        trigger = self._triggers.pop(order_number, None)
+        if trigger is None:
+            return False
+        orders = self._tree[trigger]
+        for i in range(len(orders)):
+            if orders[i][1] == order_number:
+                del orders[i]
+                break
+        if not orders:
+            del self._tree[trigger]
+        self.count -= 1
+        return True
+
+    cdef inline bint pending(self, long long order_number):
+        """
+        Check whether the order with the specified number is pending.
+        """
+
+        return self.count > 0 and order_number in self._triggers
+
+    cdef bint triggered(self, long trigger, long last_tick):
+        """
+        Check whether the last traded tick crosses the specified trigger tick.
+        """
+
+        if last_tick == NO_TICK:
+            return False
+        if self.is_buy:
+            return last_tick >= trigger
+        return last_tick <= trigger
+
+    cdef list release(self, long last_tick):
+        """
+        Remove and return the orders triggered by the last traded tick.
+        """
+
+        cdef list result = []
+        cdef tuple order
+        if self.count == 0 or last_tick == NO_TICK:
+            return result
+        while len(self._tree):
+            trigger = self._tree.min() if self.is_buy else self._tree.max()
+            if not self.triggered(trigger, last_tick):
+                break
+            for order in self._tree[trigger]:
+                del self._triggers[order[1]]
+                result.append(order)
+            del self._tree[trigger]
+        self.count -= len(result)
+        return result
+
+    cpdef clear(self):
+        """
+        Remove all pending orders.
+        """
+
+        self._tree.clear()
+        self._triggers.clear()
+        self.count = 0
+
+    cdef TriggerBook copy(self):
+        """
+        Return a trigger book containing the same pending orders.
+        """
+
+        cdef TriggerBook stops = TriggerBook(self.indicator)
+        for trigger, orders in self._tree.iteritems():
+            stops._tree[trigger] = list(orders)
+        stops._triggers = self._triggers.copy()
+        stops.count = self.count
+        return stops
+
+    def orders(self):
+        """
+        Return the trigger ticks and tuples of all pending orders in order of
+        ascending trigger tick and arrival.
+        """
+
+        return [(trigger, order) for trigger, orders in self._tree.iteritems() \
+                for order in orders]
+
+    def __contains__(self, order_number):
+        return order_number in self._triggers
+
+    def __len__(self):
+        return self.count
+
+def depth_dtype(int levels):
+    """
+    Return the record type of the depth snapshots of the specified number of
+    levels stored by `DepthRecorder` while snapshots are being taken.
+    """
+
+    return np.dtype([('timestamp', np.int64),
+                     ('bid_price', np.float64, (levels,)),
+                     ('bid_volume', np.int64, (levels,)),
+                     ('bid_orders', np.int32, (levels,)),
+                     ('ask_price', np.float64, (levels,)),
+                     ('ask_volume', np.int64, (levels,)),
+                     ('ask_orders', np.int32, (levels,))])
+
+# Names of the arrays of depth snapshots:
+depth_names = ['timestamp', 'bid_price', 'bid_volume', 'bid_orders',
+               'ask_price', 'ask_volume', 'ask_orders']
+
+def load_depth(file_name):
+    """
+    Load depth snapshots written by `DepthRecorder`.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the NumPy .npz file written when the recorder was closed or
+        of the .npy file of snapshot records written while it was open (e.g.,
+        if the process taking the snapshots was terminated).
+
+    Returns
+    -------
+    arrays : dict of numpy.ndarray
+        Arrays described in the documentation of `DepthRecorder`.
+
+    """
+
+    if os.path.splitext(file_name)[1] == '.npz':
+        data = np.load(file_name)
+        try:
+            return dict((name, data[name]) for name in depth_names)
+        finally:
+            data.close()
+    records = np.load(file_name, mmap_mode='r')
+    return dict((name, np.array(records[name].T)) for name in depth_names)
+
+cdef class DepthRecorder:
+    """
+    Periodic snapshots of the top price levels on both sides of a book.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the NumPy .npz file to which the snapshots are written when
+        the recorder is closed.
+    levels : int
+        Number of levels K recorded on each side of the book.
+    interval : float
+        Number of seconds between snapshots; snapshots are taken at multiples
+        of the interval from the first order of each day onwards. If zero,
+        snapshots are not taken on a clock.
+    every : int
+        Number of processed orders between snapshots. If zero, snapshots are
+        not taken after a fixed number of orders.
+    chunk_size : int
+        Number of snapshots buffered in memory before they are written to
+        disk.
+
+    Notes
+    -----
+    The file contains the array `timestamp` of the T snapshot times in
+    microseconds since the epoch and the K x T arrays `bid_price`,
+    `bid_volume`, `bid_orders`, `ask_price`, `ask_volume`, and `ask_orders`
+    whose rows correspond to levels in order of decreasing priority; missing
+    levels have NaN prices and zero volumes. The volumes are the total original
+    volumes of the orders at each level. Each snapshot only reads the volume
+    and order count totals that the top K levels maintain as orders are
+    added, modified, and removed.
+
+    While the recorder is open, every full chunk of snapshots is appended to
+    a .npy file of `depth_dtype` records named after the output file with the
+    suffix '.npy' whose header is rewritten with the number of snapshots after
+    every chunk, so that memory usage does not grow with the number of
+    snapshots and the snapshots written before a crash may be loaded with
+    `load_depth`. The records file is converted into the output file and
+    removed when the recorder is closed.
+
+    """
+
+    cdef readonly object file_name
+    cdef readonly object records_file_name
+    cdef readonly int levels
+    cdef readonly long long interval
+    cdef readonly long every
+    cdef readonly Py_ssize_t count
+    cdef Py_ssize_t _n, _chunk_size
+    cdef object _dtype
+    cdef object _fh
+    cdef np.ndarray _chunk
+    cdef np.int64_t[:] _timestamp
+    cdef np.float64_t[:, :] _bid_price, _ask_price
+    cdef np.int64_t[:, :] _bid_volume, _ask_volume
+    cdef np.int32_t[:, :] _bid_orders, _ask_orders
+    cdef bint _closed
+
+    def __init__(self, file_name, int levels=10, interval=0.1, long every=0,
+                 Py_ssize_t chunk_size=4096):
+        if levels < 1:
+            raise ValueError('number of levels must be positive')
+        self.file_name = file_name
+        self.records_file_name = file_name+'.npy'
+        self.levels = levels
+        self.interval = <long long>rint(interval*1e6)
+        self.every = every
+        self.count = 0
+        self._chunk_size = max(chunk_size, 1)
+        self._dtype = depth_dtype(levels)
+        self._closed = False
+
+        # The chunk is reused after it has been written:
+        self._chunk = np.empty(self._chunk_size, self._dtype)
+        self._timestamp = self._chunk['timestamp']
+        self._bid_price = self._chunk['bid_price']
+        self._bid_volume = self._chunk['bid_volume']
+        self._bid_orders = self._chunk['bid_orders']
+        self._ask_price = self._chunk['ask_price']
+        self._ask_volume = self._chunk['ask_volume']
+        self._ask_orders = self._chunk['ask_orders']
+        self._n = 0
+
+        self._fh = open(self.records_file_name, 'w+b')
+        _write_npy_header(self._fh, self._dtype, 0)
+
+    cdef _write_chunk(self):
+        """
+        Append the buffered snapshots to the records file.
+        """
+
+        if self._n == 0:
+            return
+        self._fh.seek(0, 2)
+        self._fh.write(self._chunk[:self._n].tostring())
+
+        # Update the number of snapshots in the header:
+        self._fh.seek(0)
+        _write_npy_header(self._fh, self._dtype, self.count)
+        self._fh.flush()
+        self._n = 0
+
+    cdef record(self, long long timestamp, PriceLadder bids, PriceLadder asks,
+                double ticks_per_unit):
+        """
+        Take a snapshot of the top levels of the specified ladders.
+        """
+
+        cdef Py_ssize_t i
+        cdef int j
+        cdef PriceLevel level
+        cdef list top
+
+        if self._n == self._chunk_size:
+            self._write_chunk()
+        i = self._n
+        self._timestamp[i] = timestamp
+        top = bids.top(self.levels)
+        for j in range(self.levels):
+            if j < len(top):
+                level = top[j]
+                self._bid_price[i, j] = level.tick/ticks_per_unit
+                self._bid_volume[i, j] = level.volume_original_total
+                self._bid_orders[i, j] = level.count
+            else:
+                self._bid_price[i, j] = NAN
+                self._bid_volume[i, j] = 0
+                self._bid_orders[i, j] = 0
+        top = asks.top(self.levels)
+        for j in range(self.levels):
+            if j < len(top):
+                level = top[j]
+                self._ask_price[i, j] = level.tick/ticks_per_unit
+                self._ask_volume[i, j] = level.volume_original_total
+                self._ask_orders[i, j] = level.count
+            else:
+                self._ask_price[i, j] = NAN
+                self._ask_volume[i, j] = 0
+                self._ask_orders[i, j] = 0
+        self._n += 1
+        self.count += 1
+
+    def arrays(self):
+        """
+        Return the snapshots taken so far.
+
+        Returns
+        -------
+        arrays : dict of numpy.ndarray
+            Arrays described in the class documentation.
+
+        """
+
+        if self._closed:
+            return load_depth(self.file_name)
+        self._write_chunk()
+        return load_depth(self.records_file_name)
+
+    cpdef close(self):
+        """
+        Write the snapshots to the output file.
+        """
+
+        if self._closed:
+            return
+        self._write_chunk()
+        self._fh.close()
+        self._closed = True
+
+        # The K x T arrays are written directly from the memory-mapped
+        # records:
+        records = np.load(self.records_file_name, mmap_mode='r')
+        arrays = {}
+        for name in depth_names:
+            arrays[name] = records[name].T
+        with open(self.file_name, 'wb') as f:
+            np.savez(f, **arrays)
+        arrays = records = None
+        os.remove(self.records_file_name)
+
+# Full memory barrier; the version of a shared book is updated on either side
+# of every write so that readers never see partially written snapshots:
+cdef extern from *:
+    void __sync_synchronize() nogil
+
+# Identifies files written by SharedBook:
+SHARED_BOOK_MAGIC = 'LOBBOOK1'
+
+def shared_book_dtype(int levels):
+    """
+    Return the record type of a shared book with the specified number of levels.
+
+    Notes
+    -----
+    All fields are 8 bytes wide and aligned so that the version (`seq`) may be
+    read and written atomically. The `magic` and `levels` fields identify the
+    layout and are never changed after the file is created.
+
+    """
+
+    return np.dtype([('magic', 'S8'),
+                     ('levels', np.int64),
+                     ('seq', np.int64),
+                     ('timestamp', np.int64),
+                     ('num_processed', np.int64),
+                     ('num_orders', np.int64),
+                     ('num_trades', np.int64),
+                     ('trade_volume_total', np.float64),
+                     ('trade_price_mean', np.float64),
+                     ('trade_price_std', np.float64),
+                     ('mean_order_interarrival_time', np.float64),
+                     ('bid_price', np.float64, (levels,)),
+                     ('bid_volume', np.int64, (levels,)),
+                     ('bid_orders', np.int64, (levels,)),
+                     ('ask_price', np.float64, (levels,)),
+                     ('ask_volume', np.int64, (levels,)),
+                     ('ask_orders', np.int64, (levels,))])
+
+cdef class SharedBook:
+    """
+    Top levels and daily stats of a book published in a memory-mapped file.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file in which the book is published (e.g., a file in
+        /dev/shm); an existing file is replaced.
+    levels : int
+        Number of levels K published on each side of the book.
+    every : int
+        Number of processed orders between updates; the book is also updated
+        after the last order of every batch passed to
+        `LimitOrderBook.process_columns`.
+
+    Notes
+    -----
+    The file contains a single record of type `shared_book_dtype(levels)`.
+    The level arrays are ordered and filled like those of `DepthRecorder`, so
+    the best bid and ask are the first levels; `timestamp` is the time of the
+    last order processed in microseconds since the epoch, `num_processed` is
+    the number of orders processed since publication started, and the
+    remaining scalar fields are the daily stats of the current day.
+
+    The record is protected by a sequence lock: the version `seq` is
+    incremented before and after every update, so it is odd while an update
+    is in progress. The book never waits for readers; readers copy the record
+    and retry if the version was odd or changed in the meantime (see
+    `SharedBookReader`).
+
+    """
+
+    cdef readonly object file_name
+    cdef readonly int levels
+    cdef readonly long every
+    cdef readonly long long count
+    cdef object _array
+    cdef np.int64_t[:] _seq, _timestamp, _num_processed
+    cdef np.int64_t[:] _num_orders, _num_trades
+    cdef np.float64_t[:] _trade_volume_total, _trade_price_mean
+    cdef np.float64_t[:] _trade_price_std, _mean_order_interarrival_time
+    cdef np.float64_t[:] _bid_price, _ask_price
+    cdef np.int64_t[:] _bid_volume, _ask_volume
+    cdef np.int64_t[:] _bid_orders, _ask_orders
+    cdef bint _closed
+
+    def __init__(self, file_name, int levels=10, long every=1):
+        if levels < 1:
+            raise ValueError('number of levels must be positive')
+        if every < 1:
+            raise ValueError('number of orders between updates must be positive')
+        self.file_name = file_name
+        self.levels = levels
+        self.every = every
+        self.count = 0
+        self._closed = False
+
+        # The file is initialized under a temporary name and then renamed so
+        # that readers never map a partially initialized file; readers of a
+        # replaced file keep their mapping of the old one:
+        tmp_file_name = '%s.%i.tmp' % (file_name, os.getpid())
+        a = np.memmap(tmp_file_name, shared_book_dtype(levels), 'w+',
+                      shape=(1,))
+        a['magic'] = SHARED_BOOK_MAGIC
+        a['levels'] = levels
+        a['bid_price'] = NAN
+        a['ask_price'] = NAN
+        a.flush()
+        os.rename(tmp_file_name, file_name)
+        self._array = a
+        self._seq = a['seq']
+        self._timestamp = a['timestamp']
+        self._num_processed = a['num_processed']
+        self._num_orders = a['num_orders']
+        self._num_trades = a['num_trades']
+        self._trade_volume_total = a['trade_volume_total']
+        self._trade_price_mean = a['trade_price_mean']
+        self._trade_price_std = a['trade_price_std']
+        self._mean_order_interarrival_time = a['mean_order_interarrival_time']
+        self._bid_price = a['bid_price'][0]
+        self._bid_volume = a['bid_volume'][0]
+        self._bid_orders = a['bid_orders'][0]
+        self._ask_price = a['ask_price'][0]
+        self._ask_volume = a['ask_volume'][0]
+        self._ask_orders = a['ask_orders'][0]
+
+    cdef publish(self, long long timestamp, long num_processed,
+                 PriceLadder bids, PriceLadder asks, double ticks_per_unit,
+                 dict daily_stats):
+        """
+        Update the published book after processing the specified number of
+        orders.
+        """
+
+        cdef int j
+        cdef PriceLevel level
+        cdef list top_bids = bids.top(self.levels)
+        cdef list top_asks = asks.top(self.levels)
+
+        self._seq[0] += 1
+        __sync_synchronize()
+        self._timestamp[0] = timestamp
+        self._num_processed[0] += num_processed
+        self._num_orders[0] = daily_stats['num_orders']
+        self._num_trades[0] = daily_stats['num_trades']
+        self._trade_volume_total[0] = daily_stats['trade_volume_total']
+        self._trade_price_mean[0] = daily_stats['trade_price_mean']
+        self._trade_price_std[0] = daily_stats['trade_price_std']
+        self._mean_order_interarrival_time[0] = \
+            daily_stats['mean_order_interarrival_time']
+        for j in range(self.levels):
+            if j < len(top_bids):
+                level = top_bids[j]
+                self._bid_price[j] = level.tick/ticks_per_unit
+                self._bid_volume[j] = level.volume_original_total
+                self._bid_orders[j] = level.count
+            else:
+                self._bid_price[j] = NAN
+                self._bid_volume[j] = 0
+                self._bid_orders[j] = 0
+        for j in range(self.levels):
+            if j < len(top_asks):
+                level = top_asks[j]
+                self._ask_price[j] = level.tick/ticks_per_unit
+                self._ask_volume[j] = level.volume_original_total
+                self._ask_orders[j] = level.count
+            else:
+                self._ask_price[j] = NAN
+                self._ask_volume[j] = 0
+                self._ask_orders[j] = 0
+        __sync_synchronize()
+        self._seq[0] += 1
+        self.count += 1
+
+    cpdef close(self):
+        """
+        Stop publishing; the file is left in place with the last update.
+        """
+
+        if self._closed:
+            return
+        self._closed = True
+        self._array.flush()
+
+class SharedBookReader(object):
+    """
+    Reader of a book published by `SharedBook`.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the file in which the book is published.
+
+    Notes
+    -----
+    The file is mapped read-only, so any number of processes may read it
+    without affecting the book. A book that replaces the file is not seen by
+    an existing reader; a new reader must be created.
+
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            magic, levels = struct.unpack('=8sq', f.read(16))
+        if magic != SHARED_BOOK_MAGIC:
+            raise ValueError('not a shared book file: %s' % file_name)
+        self.levels = levels
+        self._array = np.memmap(file_name, shared_book_dtype(levels), 'r',
+                                shape=(1,))
+        self._seq = self._array['seq']
+
+    @property
+    def version(self):
+        """
+        Current version of the book; even unless an update is in progress.
+        Polling the version does not copy the book.
+        """
+
+        return int(self._seq[0])
+
+    def read(self, max_tries=None):
+        """
+        Return a consistent copy of the published book.
+
+        Parameters
+        ----------
+        max_tries : int
+            Maximum number of attempts to read the book while it is being
+            updated. If None, keep trying until a consistent copy is read.
+
+        Returns
+        -------
+        record : numpy.void
+            Copy of the record described in the `SharedBook` documentation;
+            its `seq` field is the version that was read.
+
+        """
+
+        tries = 0
+        while max_tries is None or tries < max_tries:
+            tries += 1
+            seq = self._seq[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            record = np.array(self._array)[0]
+            if self._seq[0] == seq:
+                return record
+        raise RuntimeError('book is being updated')
+
+    def close(self):
+        """
+        Unmap the file.
+        """
+
+        self._seq = None
+        self._array = None
+
+# Names of the columns of the rows written by CSVEventSink:
+event_col_names = \
+  ['time',
+   'date',
+   'order_number',
+   'indicator',
+   'mkt_flag',
+   'action',
+   'is_original',
+   'price',
+   'volume_original',
+   'volume_disclosed',
+   'best_bid_price',
+   'best_bid_volume_original',
+   'best_ask_price',
+   'best_ask_volume_original']
+
+# Record type of the events written by BinaryEventSink; the transaction date
+# and time are stored as microseconds since the epoch and missing best bid/ask
+# prices are stored as NaN:
+event_dtype = np.dtype([('timestamp', np.int64),
+                        ('order_number', np.int64),
+                        ('indicator', 'S1'),
+                        ('mkt_flag', 'S1'),
+                        ('action', 'S6'),
+                        ('is_original', 'S1'),
+                        ('price', np.float64),
+                        ('volume_original', np.int64),
+                        ('volume_disclosed', np.int64),
+                        ('best_bid_price', np.float64),
+                        ('best_bid_volume_original', np.int64),
+                        ('best_ask_price', np.float64),
+                        ('best_ask_volume_original', np.int64)])
+
+def event_to_row(event):
+    """
+    Convert a dictionary containing event data into a row for output to CSV.
+    """
+
+    return [event['time'],
+            event['date'],
+            event['order_number'],
+            event['indicator'],
+            event['mkt_flag'],
+            event['action'],
+            event['is_original'],
+            event['price'],
+            event['volume_original'],
+            event['volume_disclosed'],
+            event['best_bid_price'],
+            event['best_bid_volume_original'],
+            event['best_ask_price'],
+            event['best_ask_volume_original']]
+
+# Actions of recorded events and their names in the event logs:
+cdef enum:
+    ACTION_ADD = 0
+    ACTION_MODIFY = 1
+    ACTION_CANCEL = 2
+    ACTION_TRADE = 3
+cdef tuple action_names = ('add', 'modify', 'cancel', 'trade')
+
+# Tick recorded in place of the best bid or ask price when that side of the
+# book is empty:
+cdef long NO_TICK = LONG_MIN
+
+# Event recorded by a limit order book; prices are stored as ticks. The
+# transaction date and time are passed along with the record because they
+# are Python objects:
+cdef struct EventRecord:
+    long long timestamp
+    long long order_number
+    char indicator
+    char mkt_flag
+    char io_flag
+    char is_original
+    int action
+    long tick
+    long volume_original
+    long volume_disclosed
+    long best_bid_tick
+    long best_bid_volume_original
+    long best_ask_tick
+    long best_ask_volume_original
+
+def load_events(file_name):
+    """
+    Load events written by a BinaryEventSink.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of file containing events.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Events; the columns are named as the fields of `event_dtype`.
+
+    """
+
+    return pandas.DataFrame(np.load(file_name))
+
+cdef _write_npy_header(object fh, object dtype, Py_ssize_t count):
+    """
+    Write the header of a .npy file containing `count` records of a type.
+    """
+
+    # The shape is padded to a fixed width so that the header length doesn't
+    # change when it is rewritten:
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%20d,), }" % \
+             (np.lib.format.dtype_to_descr(dtype), count)
+    header += ' '*(-(len(header)+11) % 64)+'\n'
+    fh.write('\x93NUMPY\x01\x00'+chr(len(header) & 0xff)+
+             chr(len(header) >> 8)+header)
+
+cdef Py_ssize_t _open_npy(object fh, object file_name, object dtype,
+                          object writer) except -1:
+    """
+    Return the number of complete records in a .npy file written by a sink
+    and truncate any incomplete record at its end.
+    """
+
+    cdef Py_ssize_t count
+    version = np.lib.format.read_magic(fh)
+    if version != (1, 0):
+        raise ValueError('%s: unsupported format version' % file_name)
+    shape, fortran_order, file_dtype = \
+        np.lib.format.read_array_header_1_0(fh)
+    offset = fh.tell()
+    if file_dtype != dtype or offset % 64 or len(shape) != 1:
+        raise ValueError('%s: not written by %s' % (file_name, writer))
+    count = (os.path.getsize(file_name)-offset)//dtype.itemsize
+    fh.truncate(offset+count*dtype.itemsize)
+    fh.seek(0)
+    return count
+
+cdef class EventSink:
+    """
+    Destination of the events recorded by a limit order book.
+
+    Notes
+    -----
+    Subclasses must implement `write`; `flush` and `close` do nothing unless
+    overridden.
+
+    """
+
+    cpdef write(self, dict event):
+        """
+        Write a single event.
+        """
+
+        raise NotImplementedError
+
+    cpdef flush(self):
+        """
+        Write any buffered events to the underlying file.
+        """
+
+        pass
+
+    cpdef close(self):
+        """
+        Flush buffered events and close the underlying file.
+        """
+
+        pass
+
+cdef class CSVEventSink(EventSink):
+    """
+    Event sink that writes each event as a row of a CSV file.
+
+    Parameters
+    ----------
+    file_name : str
+        Output file name. If it ends with the string '.gz', the output is
+        compressed.
+    append : bool
+        If set to True, rows are appended to the file if it exists.
+
+    Notes
+    -----
+    The columns of the rows are listed in `event_col_names`.
+
+    """
+
+    cdef object _fh, _writer
+
+    def __init__(self, file_name, append=False):
+        mode = 'a' if append else 'w'
+        if os.path.splitext(file_name)[1] == '.gz':
+            self._fh = gzip.open(file_name, mode)
+        else:
+            self._fh = open(file_name, mode)
+        self._writer = csv.writer(self._fh)
+
+    cpdef write(self, dict event):
+        self._writer.writerow(event_to_row(event))
+
+    cpdef flush(self):
+        self._fh.flush()
+
+    cpdef close(self):
+        self._fh.close()
+
+cdef class BinaryEventSink(EventSink):
+    """
+    Event sink that writes events to a NumPy .npy file.
+
+    Parameters
+    ----------
+    file_name : str
+        Output file name.
+    buffer_size : int
+        Number of events buffered in memory before they are written.
+    append : bool
+        If set to True and the file exists, events are appended to those
+        already in the file, which must have been written by a
+        `BinaryEventSink`. Any incomplete record at the end of the file is
+        discarded.
+
+    Notes
+    -----
+    Events are stored in a preallocated record buffer of type `event_dtype`
+    that is written to the file in a single block whenever it fills up. The
+    array header at the start of the file is rewritten with the number of
+    stored events after every block, so the file may be loaded with
+    `numpy.load` or `load_events` once the sink has been flushed. The number of
+    events is determined from the size of the file when appending, so a file
+    truncated to the size it had after an earlier flush may be appended to.
+
+    """
+
+    cdef object _fh
+    cdef np.ndarray _buffer
+    cdef list _actions
+    cdef np.int64_t[:] _timestamp, _order_number, _volume_original, \
+        _volume_disclosed, _best_bid_volume_original, _best_ask_volume_original
+    cdef np.uint8_t[:] _indicator, _mkt_flag, _is_original
+    cdef np.float64_t[:] _price, _best_bid_price, _best_ask_price
+    cdef Py_ssize_t _n
+    cdef readonly Py_ssize_t buffer_size
+    cdef readonly Py_ssize_t count
+
+    def __init__(self, file_name, Py_ssize_t buffer_size=65536, append=False):
+        self.buffer_size = buffer_size
+        self.count = 0
+        if append and os.path.exists(file_name) and \
+           os.path.getsize(file_name) > 0:
+            self._fh = open(file_name, 'r+b')
+            self.count = _open_npy(self._fh, file_name, event_dtype,
+                                   'BinaryEventSink')
+        else:
+            self._fh = open(file_name, 'wb')
+        self._n = 0
+        self._buffer = np.zeros(buffer_size, event_dtype)
+        self._actions = [None]*buffer_size
+        self._timestamp = self._buffer['timestamp']
+        self._order_number = self._buffer['order_number']
+        self._indicator = self._buffer['indicator'].view(np.uint8)
+        self._mkt_flag = self._buffer['mkt_flag'].view(np.uint8)
+        self._is_original = self._buffer['is_original'].view(np.uint8)
+        self._price = self._buffer['price']
+        self._volume_original = self._buffer['volume_original']
+        self._volume_disclosed = self._buffer['volume_disclosed']
+        self._best_bid_price = self._buffer['best_bid_price']
+        self._best_bid_volume_original = self._buffer['best_bid_volume_original']
+        self._best_ask_price = self._buffer['best_ask_price']
+        self._best_ask_volume_original = self._buffer['best_ask_volume_original']
+        _write_npy_header(self._fh, event_dtype, self.count)
+        self._fh.seek(0, 2)
+
+    cpdef write(self, dict event):
+        cdef Py_ssize_t i = self._n
+        self._timestamp[i] = event['timestamp']
+        self._order_number[i] = event['order_number']
+        self._indicator[i] = ord(event['indicator'])
+        self._mkt_flag[i] = ord(event['mkt_flag'])
+        self._actions[i] = event['action']
+        self._is_original[i] = ord(event['is_original'])
+        self._price[i] = event['price']
+        self._volume_original[i] = event['volume_original']
+        self._volume_disclosed[i] = event['volume_disclosed']
+        price = event['best_bid_price']
+        self._best_bid_price[i] = np.nan if price is None else price
+        self._best_bid_volume_original[i] = event['best_bid_volume_original']
+        price = event['best_ask_price']
+        self._best_ask_price[i] = np.nan if price is None else price
+        self._best_ask_volume_original[i] = event['best_ask_volume_original']
+        self._n += 1
+        if self._n == self.buffer_size:
+            self.flush()
+
+    cpdef write_records(self, np.ndarray records):
+        """
+        Write an array of events of type `event_dtype`, e.g., loaded from
+        another file written by a BinaryEventSink.
+        """
+
+        self.flush()
+        self._write_block(np.ascontiguousarray(records, event_dtype))
+
+    cdef _write_block(self, np.ndarray records):
+        self._fh.write(records.tostring())
+        self.count += records.shape[0]
+
+        # Update the number of events in the header:
+        self._fh.seek(0)
+        _write_npy_header(self._fh, event_dtype, self.count)
+        self._fh.seek(0, 2)
+        self._fh.flush()
+
+    cpdef flush(self):
+        if self._n == 0 or self._fh.closed:
+            return
+        self._buffer['action'][:self._n] = self._actions[:self._n]
+        self._write_block(self._buffer[:self._n])
+        self._n = 0
+
+    cpdef close(self):
+        if not self._fh.closed:
+            self.flush()
+            self._fh.close()
+
+cdef class TimeWindowEventSink(EventSink):
+    """
+    Event sink that only passes on the events within a time window.
+
+    Parameters
+    ----------
+    sink : EventSink
+        Sink to which events within the window are written.
+    start, end : int
+        Start and end of the window in microseconds since the epoch; events
+        with timestamps in [start, end) are written. Either may be None to
+        leave the window unbounded on that side.
+
+    """
+
+    cdef readonly EventSink sink
+    cdef long long _start, _end
+
+    def __init__(self, EventSink sink, start=None, end=None):
+        self.sink = sink
+        self._start = -(1LL << 62) if start is None else start
+        self._end = (1LL << 62) if end is None else end
+
+    cpdef write(self, dict event):
+        cdef long long t = event['timestamp']
+        if self._start <= t < self._end:
+            self.sink.write(event)
+
+    cpdef flush(self):
+        self.sink.flush()
+
+    cpdef close(self):
+        self.sink.close()
+
+class OutputThread(object):
+    """
+    Thread that writes batches of output on behalf of a limit order book.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of pending batches; `put` blocks when this many batches
+        are waiting to be written.
+
+    Notes
+    -----
+    Each submitted call is run by the thread in the order in which it was
+    submitted. If a call raises an exception, the exception is raised again by
+    the next call to `put`, `join` or `close`.
+
+    """
+
+    def __init__(self, maxsize=64):
+        self._queue = Queue.Queue(maxsize)
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run, name='lob-output')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                if func is None:
+                    break
+                if self._exc_info is None:
+                    func(*args)
+            except:
+                self._exc_info = sys.exc_info()
+            finally:
+                self._queue.task_done()
+
+    def _check(self):
+        if self._exc_info is not None:
+            exc_info, self._exc_info = self._exc_info, None
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def put(self, func, *args):
+        """
+        Submit a call to be run by the thread.
+        """
+
+        self._check()
+        self._queue.put((func, args))
+
+    def join(self):
+        """
+        Wait until all submitted calls have been run.
+        """
+
+        self._queue.join()
+        self._check()
+
+    def close(self):
+        """
+        Run all submitted calls and stop the thread.
+        """
+
+        if self._thread.is_alive():
+            self._queue.put((None, ()))
+            self._thread.join()
+        self._check()
+
+class ThreadedRowWriter(object):
+    """
+    Batch CSV rows and write them with an output thread.
+
+    Parameters
+    ----------
+    writer : csv.writer
+        Writer used by the output thread.
+    thread : OutputThread
+        Output thread.
+    batch_size : int
+        Number of rows submitted to the thread at once.
+
+    """
+
+    def __init__(self, writer, thread, batch_size=4096):
+        self._writer = writer
+        self._thread = thread
+        self._batch_size = batch_size
+        self._rows = []
+
+    def writerow(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Submit the buffered rows to the output thread.
+        """
+
+        if self._rows:
+            self._thread.put(self._writer.writerows, self._rows)
+            self._rows = []
+
+cdef class ThreadedEventSink(EventSink):
+    """
+    Event sink that passes batches of events to another sink in an output thread.
+
+    Parameters
+    ----------
+    sink : EventSink
+        Sink that writes the events.
+    thread : OutputThread
+        Output thread.
+    batch_size : int
+        Number of events submitted to the thread at once.
+
+    Notes
+    -----
+    Each event is copied when it is written because the limit order book
+    reuses event dictionaries.
+
+    """
+
+    cdef readonly EventSink sink
+    cdef object _thread
+    cdef list _events
+    cdef Py_ssize_t _batch_size
+
+    def __init__(self, EventSink sink, thread, Py_ssize_t batch_size=4096):
+        self.sink = sink
+        self._thread = thread
+        self._batch_size = batch_size
+        self._events = []
+
+    def _write_events(self, events):
+        cdef EventSink sink = self.sink
+        for event in events:
+            sink.write(event)
+
+    cdef _submit(self):
+        if self._events:
+            self._thread.put(self._write_events, self._events)
+            self._events = []
+
+    cpdef write(self, dict event):
+        self._events.append(dict(event))
+        if len(self._events) >= self._batch_size:
+            self._submit()
+
+    cpdef flush(self):
+        self._submit()
+        self._thread.put(self.sink.flush)
+        self._thread.join()
+
+    cpdef close(self):
+        self._submit()
+        self._thread.put(self.sink.close)
+        self._thread.join()
+
+# Record type of the fills written by FillSink; each record describes the
+# match of an arriving (aggressor) order with an order resting in the book
+# (the passive order). The side is that of the aggressor ('B' or 'S') and the
+# passive order is hidden ('Y') if it has a nonzero disclosed volume:
+fill_dtype = np.dtype([('timestamp', np.int64),
+                       ('aggressor_order_number', np.int64),
+                       ('passive_order_number', np.int64),
+                       ('price', np.float64),
+                       ('volume', np.int64),
+                       ('aggressor_side', 'S1'),
+                       ('passive_hidden', 'S1')])
+
+def load_fills(file_name):
+    """
+    Load fills written by a FillSink.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of file containing fills.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Fills; the columns are named as the fields of `fill_dtype`.
+
+    """
+
+    return pandas.DataFrame(np.load(file_name))
+
+cdef class FillSink:
+    """
+    Destination of the fills of a limit order book in a NumPy .npy file.
+
+    Parameters
+    ----------
+    file_name : str
+        Output file name.
+    buffer_size : int
+        Number of fills buffered in memory before they are written.
+    append : bool
+        If set to True and the file exists, fills are appended to those
+        already in the file, which must have been written by a `FillSink`.
+        Any incomplete record at the end of the file is discarded.
+    thread : OutputThread
+        If specified, full buffers are written by this thread.
+
+    Notes
+    -----
+    Fills are stored in a preallocated record buffer of type `fill_dtype`
+    that is written to the file in a single block whenever it fills up; when
+    an output thread is used, the full buffer is handed to the thread and a
+    new one is allocated. As with `BinaryEventSink`, the array header is
+    rewritten after every block, so the file may be loaded with `numpy.load`
+    or `load_fills` once the sink has been flushed.
+
+    """
+
+    cdef object _fh, _thread
+    cdef np.ndarray _buffer
+    cdef np.int64_t[:] _timestamp, _aggressor_order_number, \
+        _passive_order_number, _volume
+    cdef np.float64_t[:] _price
+    cdef np.uint8_t[:] _aggressor_side, _passive_hidden
+    cdef Py_ssize_t _n
+    cdef bint _closed
+    cdef readonly Py_ssize_t buffer_size
+    cdef readonly Py_ssize_t count
+
+    def __init__(self, file_name, Py_ssize_t buffer_size=65536, append=False,
+                 thread=None):
+        self.buffer_size = buffer_size
+        self.count = 0
+        if append and os.path.exists(file_name) and \
+           os.path.getsize(file_name) > 0:
+            self._fh = open(file_name, 'r+b')
+            self.count = _open_npy(self._fh, file_name, fill_dtype, 'FillSink')
+        else:
+            self._fh = open(file_name, 'wb')
+        _write_npy_header(self._fh, fill_dtype, self.count)
+        self._fh.seek(0, 2)
+        self._thread = thread
+        self._closed = False
+        self._new_buffer()
+
+    cdef _new_buffer(self):
+        self._n = 0
+        self._buffer = np.zeros(self.buffer_size, fill_dtype)
+        self._timestamp = self._buffer['timestamp']
+        self._aggressor_order_number = self._buffer['aggressor_order_number']
+        self._passive_order_number = self._buffer['passive_order_number']
+        self._price = self._buffer['price']
+        self._volume = self._buffer['volume']
+        self._aggressor_side = self._buffer['aggressor_side'].view(np.uint8)
+        self._passive_hidden = self._buffer['passive_hidden'].view(np.uint8)
+
+    cdef write(self, long long timestamp, long long aggressor_order_number,
+               char aggressor_side, long long passive_order_number,
+               bint passive_hidden, double price, long volume):
+        """
+        Write a single fill.
+        """
+
+        cdef Py_ssize_t i = self._n
+        self._timestamp[i] = timestamp
+        self._aggressor_order_number[i] = aggressor_order_number
+        self._passive_order_number[i] = passive_order_number
+        self._price[i] = price
+        self._volume[i] = volume
+        self._aggressor_side[i] = aggressor_side
+        self._passive_hidden[i] = c'Y' if passive_hidden else c'N'
+        self._n += 1
+        if self._n == self.buffer_size:
+            self.flush()
+
+    def _write_block(self, np.ndarray records):
+        self._fh.write(records.tostring())
+        self.count += records.shape[0]
+
+        # Update the number of fills in the header:
+        self._fh.seek(0)
+        _write_npy_header(self._fh, fill_dtype, self.count)
+        self._fh.seek(0, 2)
+        self._fh.flush()
+
+    cpdef write_records(self, np.ndarray records):
+        """
+        Write an array of fills of type `fill_dtype`, e.g., loaded from another
+        file written by a FillSink.
+        """
+
+        self.flush()
+        records = np.ascontiguousarray(records, fill_dtype)
+        if self._thread is not None:
+            self._thread.put(self._write_block, records)
+        else:
+            self._write_block(records)
+
+    cpdef flush(self):
+        """
+        Write the buffered fills to the file (or submit them to the output
+        thread).
+        """
+
+        if self._n == 0 or self._closed:
+            return
+        if self._thread is not None:
+            self._thread.put(self._write_block, self._buffer[:self._n])
+            self._new_buffer()
+        else:
+            self._write_block(self._buffer[:self._n])
+            self._n = 0
+
+    cpdef close(self):
+        """
+        Flush buffered fills and close the file.
+        """
+
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        if self._thread is not None:
+            self._thread.put(self._fh.close)
+        else:
+            self._fh.close()
+
+def print_daily_stats(d):
+    """
+    Display daily stats.
+
+    Parameters
+    ----------
+    d : dict
+        Daily stats, e.g., as returned by `LimitOrderBook.daily_stats`.
+
+    """
+
+    print '--------------------------------------------'
+    print 'Number of orders:             ', d['num_orders']
+    print 'Number of trades:             ', d['num_trades']
+    print 'Total trade volume:           ', d['trade_volume_total']
+    print 'Mean trade price:             ', d['trade_price_mean']
+    print 'Trade price STD:              ', d['trade_price_std']
+    print 'Mean order interarrival time: ', d['mean_order_interarrival_time']
+
+# Version of the checkpoint format and record types of the price levels and
+# resting orders stored in checkpoint files:
+CHECKPOINT_VERSION = 2
+checkpoint_level_dtype = np.dtype([('indicator', 'S1'),
+                                   ('tick', np.int64),
+                                   ('count', np.int64)])
+checkpoint_order_dtype = np.dtype([('order_number', np.int64),
+                                   ('volume_original', np.int64),
+                                   ('volume_disclosed', np.int64),
+                                   ('mapped', np.bool_)])
+checkpoint_stop_dtype = np.dtype([('seq', np.int64),
+                                  ('order_number', np.int64),
+                                  ('indicator', 'S1'),
+                                  ('tick', np.int64),
+                                  ('volume_original', np.int64),
+                                  ('volume_disclosed', np.int64),
+                                  ('mkt_flag', 'S1'),
+                                  ('io_flag', 'S1'),
+                                  ('trigger', np.int64)])
+
+def read_checkpoint(file_name):
+    """
+    Read a checkpoint file written by `LimitOrderBook.save_checkpoint`.
+
+    Parameters
+    ----------
+    file_name : str
+        Name of checkpoint file.
+
+    Returns
+    -------
+    header : dict
+        Counters, day, expiry date, and stats of the book; the additional data
+        saved with the checkpoint are stored in header['info'].
+    levels : numpy.ndarray
+        Price levels of type `checkpoint_level_dtype`.
+    orders : numpy.ndarray
+        Resting orders of type `checkpoint_order_dtype`.
+    stops : numpy.ndarray
+        Pending stop loss orders of type `checkpoint_stop_dtype`; empty for
+        checkpoints written before stop loss orders were supported.
+
+    """
+
+    data = np.load(file_name)
+    try:
+        header = json.loads(data['header'][()])
+        if header['version'] not in (1, CHECKPOINT_VERSION):
+            raise ValueError('unsupported checkpoint version: %s' % \
+                             header['version'])
+        levels = data['levels']
+        orders = data['orders']
+        if header['version'] >= 2:
+            stops = data['stops']
+        else:
+            stops = np.empty(0, checkpoint_stop_dtype)
+    finally:
+        data.close()
+    return header, levels, orders, stops
+
+cdef inline double monotonic_time():
+    cdef timespec ts
+    clock_gettime(CLOCK_MONOTONIC, &ts)
+    return ts.tv_sec+ts.tv_nsec*1e-9
+
+def monotonic():
+    """
+    Return the time of a monotonic clock in seconds.
+    """
+
+    return monotonic_time()
+
+# Fields of the counters accumulated by BookCounters:
+counter_names = ['num_adds', 'num_cancels', 'num_modifies', 'num_market_orders',
+                 'num_skipped', 'num_matches', 'num_matching_orders',
+                 'max_matches', 'num_levels_swept', 'max_levels_swept',
+                 'levels_created', 'levels_deleted', 'peak_orders',
+                 'peak_levels', 'events_recorded', 'events_suppressed',
+                 'ingest_time', 'order_time', 'record_time', 'event_write_time',
+                 'stats_write_time']
+
+cdef class BookCounters:
+    """
+    Counters and per-phase timers of the processing done by a limit order book.
+
+    Notes
+    -----
+    Orders are counted by activity type; market orders are also counted
+    separately, and orders skipped because of their expiry date are only
+    counted as skipped. A match is a trade between an arriving order and an
+    order resting in the book, and the levels swept by an order are the
+    distinct price levels of the resting orders it trades with. Levels removed
+    when the book is cleared are not counted as deleted, so that the counters
+    of days replayed by separate books add up to those of a serial replay.
+
+    The phase times are cumulative monotonic clock times in seconds:
+    `ingest` is the time spent reading and parsing orders (which must be
+    accumulated by the caller when orders are read outside of the book),
+    `record` the time spent recording events and accumulating stats, `write`
+    the time spent passing events and running stats to the logs, and `match`
+    the remainder of the time spent processing orders. When output is
+    asynchronous, the formatting and compression of the logs by the output
+    thread are not included.
+
+    """
+
+    cdef public long num_adds, num_cancels, num_modifies, num_market_orders
+    cdef public long num_skipped
+    cdef public long num_matches, num_matching_orders, max_matches
+    cdef public long num_levels_swept, max_levels_swept
+    cdef public long levels_created, levels_deleted, peak_orders, peak_levels
+    cdef public long events_recorded, events_suppressed
+    cdef public double ingest_time, order_time, record_time
+    cdef public double event_write_time, stats_write_time
+
+    # Matches and levels swept by the order being processed:
+    cdef long order_matches, order_levels, last_match_tick
+
+    def __reduce__(self):
+        return (BookCounters, (), [getattr(self, k) for k in counter_names])
+
+    def __setstate__(self, state):
+        for k, v in zip(counter_names, state):
+            setattr(self, k, v)
+
+    def reset(self):
+        """
+        Reset all counters and timers.
+        """
+
+        self.__setstate__([0]*len(counter_names))
+
+    def merge(self, BookCounters other):
+        """
+        Accumulate the counters and timers of another instance.
+        """
+
+        for k in counter_names:
+            if k.startswith('max_') or k.startswith('peak_'):
+                setattr(self, k, max(getattr(self, k), getattr(other, k)))
+            else:
+                setattr(self, k, getattr(self, k)+getattr(other, k))
+
+    cdef inline void begin_order(self, long act, char mkt):
+        if act == 1:
+            self.num_adds += 1
+        elif act == 3:
+            self.num_cancels += 1
+        elif act == 4:
+            self.num_modifies += 1
+        if mkt == c'Y':
+            self.num_market_orders += 1
+        self.order_matches = self.order_levels = 0
+
+    cdef inline void end_order(self, Py_ssize_t num_orders,
+                               Py_ssize_t num_levels):
+        if self.order_matches > 0:
+            self.num_matching_orders += 1
+            if self.order_matches > self.max_matches:
+                self.max_matches = self.order_matches
+            self.num_levels_swept += self.order_levels
+            if self.order_levels > self.max_levels_swept:
+                self.max_levels_swept = self.order_levels
+        if num_orders > self.peak_orders:
+            self.peak_orders = num_orders
+        if num_levels > self.peak_levels:
+            self.peak_levels = num_levels
+
+    cdef inline void match(self, long tick):
+        if self.order_matches == 0 or tick != self.last_match_tick:
+            self.order_levels += 1
+            self.last_match_tick = tick
+        self.order_matches += 1
+        self.num_matches += 1
+
+    def as_dict(self):
+        """
+        Return the counters, the rates derived from them, and the time spent
+        in each phase.
+        """
+
+        cdef long num_events = self.events_recorded+self.events_suppressed
+        d = dict((k, getattr(self, k)) for k in counter_names \
+                 if not k.endswith('_time'))
+        d['num_orders'] = self.num_adds+self.num_cancels+self.num_modifies
+        d['mean_matches'] = \
+            float(self.num_matches)/self.num_matching_orders \
+            if self.num_matching_orders else 0.0
+        d['mean_levels_swept'] = \
+            float(self.num_levels_swept)/self.num_matching_orders \
+            if self.num_matching_orders else 0.0
+        d['suppression_rate'] = \
+            float(self.events_suppressed)/num_events if num_events else 0.0
+        d['ingest_time'] = self.ingest_time
+        d['match_time'] = \
+            self.order_time-self.record_time-self.stats_write_time
+        d['record_time'] = self.record_time-self.event_write_time
+        d['write_time'] = self.event_write_time+self.stats_write_time
+        return d
+
+cdef class LimitOrderBook:
     """
     Limit order book for Indian exchange.
 
@@ -61,69 +3211,137 @@ class LimitOrderBook(object):
     sparse_events : bool
         If set to True, only events in which the price or total volume
         of the best bid or ask changes.
-    events_log_file : str
-        File in which to log events. If set to None, no events are logged.
+    events_log_file : str or EventSink
+        File in which to log events. If set to None, no events are logged. If
+        the file name ends with the string '.npy', the events are written in
+        binary form by a `BinaryEventSink`; otherwise, they are written to a
+        CSV file by a `CSVEventSink`. An existing sink may also be specified.
     stats_log_file : bool
         File in which to log running stats. If set to None, no running stats are logged.
     daily_stats_file : bool
         File in which to log accumulated daily stats. If set to None, no daily stats are logged.
+    tick_size : float
+        Minimum price increment. Prices are stored internally as integer
+        numbers of ticks.
+    trace : bool
+        If set to True, log a detailed trace of the processing of every order
+        to the 'lob' logger at the INFO level. If set to False, the trace
+        messages are neither constructed nor emitted.
+    async_output : bool
+        If set to True, the events and stats are passed in batches to a
+        separate thread that formats, compresses and writes them.
+    append : bool
+        If set to True, output is appended to existing log files rather than
+        overwriting them (e.g., when resuming from a checkpoint).
+    depth_log_file : str or DepthRecorder
+        File in which to store periodic snapshots of the top levels of the
+        book. If set to a file name, a `DepthRecorder` with default parameters
+        is used. If set to None, no snapshots are taken.
+    instrument : bool
+        If set to True, the processing of orders is tallied in a
+        `BookCounters` instance stored in the `counters` attribute. If set to
+        False, `counters` is None and no counters or timers are updated.
+    shared_book : str or SharedBook
+        File in which to publish the top levels and daily stats of the book
+        for other processes. If set to a file name, a `SharedBook` with
+        default parameters is used. If set to None, the book is not published.
+    fills_log_file : str or FillSink
+        File in which to store a record of every match between an arriving
+        order and a resting order (see `fill_dtype`). If set to a file name, a
+        `FillSink` that uses the output thread of the book (if any) is
+        created. If set to None, no fills are recorded.
 
     Notes
     -----
     If the file names specified for storing events or stats end with the string '.gz', the log is automatically
-    compressed.
+    compressed. The `close` method should be called once processing is
+    complete to make sure that all output is written.
     
     """
+
+    cdef readonly object logger
+    cdef readonly bint trace
+    cdef bint _show_output
+    cdef dict _book_data
+    cdef PriceLadder _bids, _asks
+    cdef OrderPool _pool
+    cdef readonly double tick_size
+    cdef double _ticks_per_unit
+    cdef long _last_best_bid_tick, _last_best_bid_volume_original
+    cdef long _last_best_ask_tick, _last_best_ask_volume_original
+    cdef OrderIndex _order_index
+    cdef public long _event_counter
+    cdef bint _sparse_events
+    cdef public long _original_event_counter
+    cdef object _events_log_file
+    cdef EventSink _events_sink
+    cdef object _stats_log_file, _stats_log_fh, _stats_log_writer
+    cdef object _daily_stats_log_file, _daily_stats_log_fh, _daily_stats_log_writer
+    cdef object _output_thread
+    cdef bint _closed
+    cdef DepthRecorder _depth
+    cdef readonly BookCounters counters
+    cdef long long _next_depth_time
+    cdef long _depth_countdown
+    cdef SharedBook _shared
+    cdef long _shared_countdown
+    cdef FillSink _fills
+    cdef TriggerBook _buy_stops, _sell_stops
+    cdef long _last_trade_tick
+    cdef long long _stop_seq
+    cdef bint _traded
+    cdef dict _init_daily_stats
+    cdef dict _curr_daily_stats
+    cdef long long _last_order_time
+    cdef long long _day_index
+    cdef public object day
+    cdef public object expiry_date
+    cdef dict _order_interarrival_time
+    cdef object _curr_order_interarrival_time
     
     def __init__(self, show_output=True, sparse_events=True, events_log_file='events.log.gz',
-                 stats_log_file='stats.log.gz', daily_stats_log_file='daily_stats.log.gz'):
+                 stats_log_file='stats.log.gz', daily_stats_log_file='daily_stats.log.gz',
+                 tick_size=0.05, trace=False, async_output=False,
+                 append=False, depth_log_file=None, instrument=False,
+                 shared_book=None, fills_log_file=None):
         self.logger = logging.getLogger('lob')
+        self.trace = trace
 
         self._show_output = show_output
+
+        # Prices are converted to integer numbers of ticks when orders are
+        # ingested and converted back when events are recorded:
+        self.tick_size = tick_size
+        self._ticks_per_unit = ticks_per_unit(tick_size)
         
-        # The order data in the book is stored in two dictionaries of ordered
-        # dicts; the keys of each dictionary correspond to the price levels of
-        # each ordered dict. The ordered dicts are used as
-        # queues; adding a new entry with a key corresponding to the order
-        # number is equivalent to pushing it into the queue, and the ordered
-        # dict permits one to "pop" its first entry:
+        # The orders in the book are stored in a pool of slots; the slots of
+        # the orders at each price level are linked into a FIFO queue:
+        self._pool = OrderPool()
+
+        # The price level queues of the buy and sell portions of the book are
+        # stored in ladders indexed by tick that keep track of the best bid
+        # and ask without having to compute the maximum/minimum prices. Each
+        # queue also accumulates the total volume of the orders it contains:
+        self._bids = PriceLadder(BID)
+        self._asks = PriceLadder(ASK)
         self._book_data = {}
-        self._book_data[BID] = {}
-        self._book_data[ASK] = {}
-
-        # Use Cython-based rbtrees classes to keep track of the best bid and
-        # ask without having to compute the maximum/minimum prices of the buy
-        # and sell portions of the book:
-        # XXX Theoretically, the bintrees package could also be used for this
-        # purpose; however, it causes Python to eventually segfault when used
-        # in this LOB implementation. Saving only the prices in one of
-        # the bintrees classes also doesn't appear to prevent this problem from
-        # occurring.
-        self._book_prices = {}
-        self._book_prices[BID] = rbtree.rbtree()
-        self._book_prices[ASK] = rbtree.rbtree()
-
-        # This dictionary maps price levels to dictionaries that contain several
-        # running stats for each level
-        self._init_price_level_stats = {
-            'volume_original_total': 0,
-            'volume_disclosed_total': 0}        
-        self._price_level_stats = {}
-        self._price_level_stats[BID] = {}
-        self._price_level_stats[ASK] = {}
+        self._book_data[BID] = self._bids
+        self._book_data[ASK] = self._asks
 
         # Needed to determine when the best bid or ask prices or volumes change:
-        self._init_last_book_best_values = \
-            {'best_bid_price': 0.0,
-             'best_bid_volume_original': 0,
-             'best_ask_price': 0.0,
-             'best_ask_volume_original': 0}
-        self._last_book_best_values = \
-            copy.copy(self._init_last_book_best_values)
+        self._reset_last_best_values()
         
-        # This dictionary maps the IDs of orders that are in the book to their
-        # price level:
-        self._book_orders_to_price = {}
+        # This index maps the numbers of orders that are in the book to their
+        # slots in the order pool:
+        self._order_index = OrderIndex()
+
+        # Stop loss orders are held out of the book until the last traded
+        # price crosses their trigger prices:
+        self._buy_stops = TriggerBook(BUY)
+        self._sell_stops = TriggerBook(SELL)
+        self._last_trade_tick = NO_TICK
+        self._stop_seq = 0
+        self._traded = False
                 
         # Generated events counter:
         self._event_counter = 1
@@ -136,32 +3354,79 @@ class LimitOrderBook(object):
         # LOB:
         self._original_event_counter = 1
         
-        # Events are written to this file:
+        # If requested, output is written by a separate thread:
+        self._closed = False
+        if async_output:
+            self._output_thread = OutputThread()
+        else:
+            self._output_thread = None
+
+        # Events are written to this sink:
         self._events_log_file = events_log_file
-        if events_log_file:
-            if os.path.splitext(events_log_file)[1] == '.gz':
-                self._events_log_fh = gzip.open(events_log_file, 'w')
+        if isinstance(events_log_file, EventSink):
+            self._events_sink = events_log_file
+        elif events_log_file:
+            if os.path.splitext(events_log_file)[1] == '.npy':
+                self._events_sink = BinaryEventSink(events_log_file,
+                                                    append=append)
             else:
-                self._events_log_fh = open(events_log_file, 'w')
-            self._events_log_writer = csv.writer(self._events_log_fh)
+                self._events_sink = CSVEventSink(events_log_file, append)
+        if self._events_sink is not None and async_output:
+            self._events_sink = \
+                ThreadedEventSink(self._events_sink, self._output_thread)
 
         # Stats are written to this file:
+        mode = 'a' if append else 'w'
         self._stats_log_file = stats_log_file
         if stats_log_file:
             if os.path.splitext(stats_log_file)[1] == '.gz':
-                self._stats_log_fh = gzip.open(stats_log_file, 'w')                
+                self._stats_log_fh = gzip.open(stats_log_file, mode)
             else:
-                self._stats_log_fh = open(stats_log_file, 'w')
+                self._stats_log_fh = open(stats_log_file, mode)
             self._stats_log_writer = csv.writer(self._stats_log_fh)
+            if async_output:
+                self._stats_log_writer = \
+                    ThreadedRowWriter(self._stats_log_writer, self._output_thread)
 
         # Daily stats are written to this file:
         self._daily_stats_log_file = daily_stats_log_file
         if daily_stats_log_file:
             if os.path.splitext(daily_stats_log_file)[1] == '.gz':
-                self._daily_stats_log_fh = gzip.open(daily_stats_log_file, 'w')
+                self._daily_stats_log_fh = gzip.open(daily_stats_log_file, mode)
             else:
-                self._daily_stats_log_fh = open(daily_stats_log_file, 'w')
+                self._daily_stats_log_fh = open(daily_stats_log_file, mode)
             self._daily_stats_log_writer = csv.writer(self._daily_stats_log_fh)
+            if async_output:
+                self._daily_stats_log_writer = \
+                    ThreadedRowWriter(self._daily_stats_log_writer,
+                                      self._output_thread)
+
+        # Fills are written to this sink:
+        if isinstance(fills_log_file, FillSink):
+            self._fills = fills_log_file
+        elif fills_log_file:
+            self._fills = FillSink(fills_log_file, append=append,
+                                   thread=self._output_thread)
+
+        # Snapshots of the top levels of the book are taken by this recorder:
+        if isinstance(depth_log_file, DepthRecorder):
+            self._depth = depth_log_file
+        elif depth_log_file:
+            self._depth = DepthRecorder(depth_log_file)
+        if self._depth is not None:
+            self._depth_countdown = self._depth.every
+
+        # The top of the book is published for other processes here:
+        if isinstance(shared_book, SharedBook):
+            self._shared = shared_book
+        elif shared_book:
+            self._shared = SharedBook(shared_book)
+        if self._shared is not None:
+            self._shared_countdown = self._shared.every
+
+        # Processing is tallied by these counters:
+        if instrument:
+            self.counters = BookCounters()
 
         # Values with which to initialize daily stats:
         self._init_daily_stats = {
@@ -174,10 +3439,14 @@ class LimitOrderBook(object):
 
         # Daily stats are accumulated in this dictionary:
         self._curr_daily_stats = copy.copy(self._init_daily_stats)
-        self._last_order_time = 0.0
 
-        # Current day:
+        # Times are stored as integer numbers of microseconds since the epoch:
+        self._last_order_time = 0
+
+        # Current day of the month and number of days since the epoch; the
+        # latter is used to detect the start of a new day:
         self.day = None
+        self._day_index = -1
 
         # Expiration date of securities; we use this to only consider securities
         # with a single expiration date (which is arbitrarily set to that of the
@@ -188,21 +3457,66 @@ class LimitOrderBook(object):
         self._order_interarrival_time = {}
         self._curr_order_interarrival_time = None
 
-    def __del__(self):
+    def __dealloc__(self):
+
+        # Close all file handles before the object instance is cleaned up. The
+        # book may be deallocated while another exception is being handled
+        # (e.g., when a traceback referring to it is released), so exceptions
+        # must not be caught here:
+        if not self._closed:
+            self._close()
+
+    def flush(self):
+        """
+        Write all buffered events and stats to the log files.
+        """
+
+        if self._events_sink is not None:
+            self._events_sink.flush()
+        if self._fills is not None:
+            self._fills.flush()
+        for writer, fh in ((self._stats_log_writer, self._stats_log_fh),
+                           (self._daily_stats_log_writer, self._daily_stats_log_fh)):
+            if fh is None:
+                continue
+            if self._output_thread is not None:
+                writer.flush()
+                self._output_thread.put(fh.flush)
+            else:
+                fh.flush()
+        if self._output_thread is not None:
+            self._output_thread.join()
+
+    def close(self):
+        """
+        Write all buffered events and stats and close the log files.
+        """
 
-        # Close all file handles before the object instance is cleaned up:
-        try:
-            self._events_log_fh.close()            
-        except:
-            pass
-        try:
-            self._stats_log_fh.close()
-        except:
-            pass
-        try:
-            self._daily_stats_log_fh.close()
-        except:
-            pass
+        self._close()
+
+    cdef _close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._events_sink is not None:
+            self._events_sink.close()
+        if self._fills is not None:
+            self._fills.close()
+        for writer, fh in ((self._stats_log_writer, self._stats_log_fh),
+                           (self._daily_stats_log_writer, self._daily_stats_log_fh)):
+            if fh is None:
+                continue
+            if self._output_thread is not None:
+                writer.flush()
+                self._output_thread.put(fh.close)
+            else:
+                fh.close()
+        if self._output_thread is not None:
+            self._output_thread.close()
+        if self._depth is not None:
+            self._depth.close()
+        if self._shared is not None:
+            self._shared.close()
         
     def clear_book(self):
         """
@@ -210,13 +3524,232 @@ class LimitOrderBook(object):
         
         """
 
-        self.logger.info('clearing outstanding limit orders')
+        if self.trace:
+            self.logger.info('clearing outstanding limit orders')
         for d in self._book_data.keys():
             self._book_data[d].clear()
-            self._book_prices[d].clear()
-            self._price_level_stats[d].clear()
             self.day = None
-        self._book_orders_to_price.clear()
+            self._day_index = -1
+        self._order_index.clear()
+        self._pool.clear()
+        self._buy_stops.clear()
+        self._sell_stops.clear()
+        self._last_trade_tick = NO_TICK
+        self._traded = False
+
+    def save_checkpoint(self, file_name, info=None):
+        """
+        Save the state of the book to a checkpoint file.
+
+        Parameters
+        ----------
+        file_name : str
+            Name of checkpoint file.
+        info : dict
+            Additional JSON-serializable data (e.g., the position of the next
+            order to process in the input files) stored with the state.
+
+        Notes
+        -----
+        The checkpoint is a NumPy .npz archive containing the resting orders
+        of each price level from oldest to newest, the ticks of the levels,
+        the pending stop loss orders, and a JSON header with the counters,
+        day, expiry date, and stats of the book. The file is written under a
+        temporary name and then renamed so that an interrupted save does not
+        destroy an existing checkpoint.
+        Buffered output is not written by this method; call `flush` first if
+        the checkpoint must be consistent with the log files.
+
+        """
+
+        cdef OrderPool pool = self._pool
+        cdef PriceLadder ladder
+        cdef PriceLevel level
+        cdef np.int32_t slot
+        cdef Py_ssize_t i = 0, j = 0
+
+        orders = np.empty(pool.count, checkpoint_order_dtype)
+        levels = np.empty(self._bids.count+self._asks.count,
+                          checkpoint_level_dtype)
+        for ladder in (self._bids, self._asks):
+            for tick in ladder.ticks():
+                level = ladder.get(tick)
+                levels[j] = (ladder.indicator, tick, level.count)
+                j += 1
+                for slot in level.slots():
+                    order_number = pool.order_number[slot]
+                    orders[i] = (order_number,
+                                 pool.volume_original[slot],
+                                 pool.volume_disclosed[slot],
+                                 self._order_index.get(order_number) == slot)
+                    i += 1
+        stops = np.array([(order[0], order[1], chr(order[2]), order[3],
+                           order[4], order[5], chr(order[6]), chr(order[7]),
+                           trigger) \
+                          for trigger, order in \
+                          self._buy_stops.orders()+self._sell_stops.orders()],
+                         checkpoint_stop_dtype)
+
+        header = dict(version=CHECKPOINT_VERSION,
+                      tick_size=self.tick_size,
+                      day=self.day,
+                      day_index=self._day_index,
+                      expiry_date=self.expiry_date,
+                      last_order_time=self._last_order_time,
+                      event_counter=self._event_counter,
+                      original_event_counter=self._original_event_counter,
+                      curr_daily_stats=self._curr_daily_stats,
+                      last_book_best_values=self._get_last_best_values(),
+                      last_trade_price=self._tick_to_price(self._last_trade_tick),
+                      stop_seq=self._stop_seq,
+                      info=info)
+        tmp_file_name = file_name+'.tmp'
+        with open(tmp_file_name, 'wb') as f:
+            np.savez(f, header=np.array(json.dumps(header)),
+                     levels=levels, orders=orders, stops=stops)
+        os.rename(tmp_file_name, file_name)
+
+    def load_checkpoint(self, file_name):
+        """
+        Restore the state of the book from a checkpoint file.
+
+        Parameters
+        ----------
+        file_name : str
+            Name of checkpoint file written by `save_checkpoint`.
+
+        Returns
+        -------
+        info : dict
+            Additional data stored with the state.
+
+        Notes
+        -----
+        The state of the book is replaced by that in the checkpoint; the log
+        files and output settings of the book are not changed. The array
+        windows of the price ladders are centered on the best bid and ask
+        prices when the levels are restored.
+
+        """
+
+        cdef OrderPool pool = self._pool
+        cdef PriceLevel level
+        cdef np.int32_t slot
+        cdef Py_ssize_t j, k
+        cdef char indicator
+
+        header, levels, orders, stops = read_checkpoint(file_name)
+        if header['tick_size'] != self.tick_size:
+            raise ValueError('checkpoint tick size %s does not match book tick '
+                             'size %s' % (header['tick_size'], self.tick_size))
+
+        self.clear_book()
+
+        # Insert the best levels first so that the ladder windows are centered
+        # on them; bid levels are stored in ascending order of price:
+        starts = np.concatenate(([0], np.cumsum(levels['count'])))
+        bids = np.flatnonzero(levels['indicator'] == BID)[::-1]
+        asks = np.flatnonzero(levels['indicator'] == ASK)
+        for j in np.concatenate((bids, asks)):
+            indicator = ord(levels['indicator'][j])
+            level = self._create_level(indicator, levels['tick'][j])
+            for k in range(starts[j], starts[j+1]):
+                order_number = orders['order_number'][k]
+                slot = pool.alloc(order_number, indicator, level.tick,
+                                  orders['volume_original'][k],
+                                  orders['volume_disclosed'][k])
+                level.append(slot)
+                if orders['mapped'][k]:
+                    self._order_index.set(order_number, slot)
+        for k in range(len(stops)):
+            self._stops(ord(stops['indicator'][k])).add(
+                stops['trigger'][k],
+                (int(stops['seq'][k]), int(stops['order_number'][k]),
+                 ord(stops['indicator'][k]), int(stops['tick'][k]),
+                 int(stops['volume_original'][k]),
+                 int(stops['volume_disclosed'][k]),
+                 ord(stops['mkt_flag'][k]), ord(stops['io_flag'][k])))
+
+        self.day = header['day']
+        self._day_index = header['day_index']
+        self.expiry_date = str(header['expiry_date'])
+        self._last_order_time = header['last_order_time']
+        self._next_depth_time = 0
+        self._event_counter = header['event_counter']
+        self._original_event_counter = header['original_event_counter']
+        self._curr_daily_stats = \
+            dict((str(k), v) for k, v in header['curr_daily_stats'].iteritems())
+        self._set_last_best_values(header['last_book_best_values'])
+        self._last_trade_tick = \
+            self._price_to_tick(header.get('last_trade_price'))
+        self._stop_seq = header.get('stop_seq', 0)
+        return header['info']
+
+    def fork(self, **kwargs):
+        """
+        Create a book with the same state as this one and its own outputs.
+
+        Parameters
+        ----------
+        kwargs : dict
+            Parameters of the new book (see `LimitOrderBook`). The display,
+            event filtering, tracing, asynchronous output, and instrumentation
+            settings default to those of this book; the log files, depth
+            recorder, shared book, and fill sink default to None. The tick
+            size is always that of this book.
+
+        Returns
+        -------
+        book : LimitOrderBook
+            New book whose subsequent processing does not affect this book
+            (and vice versa).
+
+        Notes
+        -----
+        The slots of the resting orders and the order index are copied as
+        flat arrays, so the links of the price level queues remain valid in
+        the copy and only the small price level objects and the pending stop
+        loss orders are copied individually; no orders are reinserted. The
+        counters of the new book (if any) start from zero. Buffered output of
+        this book is neither written nor copied.
+
+        """
+
+        cdef LimitOrderBook book
+
+        params = dict(show_output=self._show_output,
+                      sparse_events=self._sparse_events,
+                      events_log_file=None,
+                      stats_log_file=None,
+                      daily_stats_log_file=None,
+                      trace=self.trace,
+                      async_output=self._output_thread is not None,
+                      instrument=self.counters is not None)
+        params.update(kwargs)
+        params['tick_size'] = self.tick_size
+        book = type(self)(**params)
+
+        book._pool = self._pool.copy()
+        book._bids = self._bids.copy(book._pool)
+        book._asks = self._asks.copy(book._pool)
+        book._book_data = {BID: book._bids, ASK: book._asks}
+        book._order_index = self._order_index.copy()
+        book._buy_stops = self._buy_stops.copy()
+        book._sell_stops = self._sell_stops.copy()
+        book._last_trade_tick = self._last_trade_tick
+        book._stop_seq = self._stop_seq
+        book._last_best_bid_tick = self._last_best_bid_tick
+        book._last_best_bid_volume_original = self._last_best_bid_volume_original
+        book._last_best_ask_tick = self._last_best_ask_tick
+        book._last_best_ask_volume_original = self._last_best_ask_volume_original
+        book._event_counter = self._event_counter
+        book._original_event_counter = self._original_event_counter
+        book._curr_daily_stats = copy.copy(self._curr_daily_stats)
+        book._last_order_time = self._last_order_time
+        book._day_index = self._day_index
+        book.day = self.day
+        book.expiry_date = self.expiry_date
+        return book
 
     def process(self, df):
         """
@@ -227,16 +3760,119 @@ class LimitOrderBook(object):
         df : pandas.DataFrame
             Each row of this DataFrame instance contains a single order.
             
+        See Also
+        --------
+        process_columns
+
         """
                 
-        for row in df.iterrows():
-            order = row[1].to_dict()
-            self.logger.info('processing order: %i (%s, %s)' % (order['order_number'],
-                                                                order['trans_date'],
-                                                                order['trans_time']))
+        self.process_columns(**frame_to_columns(df, self.tick_size))
+
+    def process_columns(self,
+                        np.int64_t[:] order_number,
+                        object[:] trans_date,
+                        object[:] trans_time,
+                        np.uint8_t[:] buy_sell_indicator,
+                        np.int64_t[:] activity_type,
+                        object[:] expiry_date,
+                        np.int64_t[:] volume_disclosed,
+                        np.int64_t[:] volume_original,
+                        np.int64_t[:] limit_price,
+                        np.uint8_t[:] mkt_flag,
+                        np.uint8_t[:] io_flag,
+                        np.int64_t[:] timestamp=None,
+                        np.uint8_t[:] on_stop_flag=None,
+                        np.int64_t[:] trigger_price=None):
+        """
+        Process order data stored in typed column arrays.
+
+        Parameters
+        ----------
+        order_number : numpy.ndarray of numpy.int64
+            Order numbers.
+        trans_date : numpy.ndarray of str
+            Transaction dates (MM/DD/YYYY).
+        trans_time : numpy.ndarray of str
+            Transaction times (HH:MM:SS.XXXXXX).
+        buy_sell_indicator : numpy.ndarray of numpy.uint8
+            Character codes of the buy/sell indicators ('B' or 'S').
+        activity_type : numpy.ndarray of numpy.int64
+            Activity types (1 for add, 3 for cancel, 4 for modify).
+        expiry_date : numpy.ndarray of str
+            Expiry dates (MM/DD/YYYY).
+        volume_disclosed : numpy.ndarray of numpy.int64
+            Disclosed volumes.
+        volume_original : numpy.ndarray of numpy.int64
+            Original volumes.
+        limit_price : numpy.ndarray of numpy.int64
+            Limit prices in ticks.
+        mkt_flag : numpy.ndarray of numpy.uint8
+            Character codes of the market order flags ('Y' or 'N').
+        io_flag : numpy.ndarray of numpy.uint8
+            Character codes of the IOC flags ('Y' or 'N').
+        timestamp : numpy.ndarray of numpy.int64
+            Transaction dates and times in microseconds since the epoch. If
+            not specified, they are computed from `trans_date` and `trans_time`.
+        on_stop_flag : numpy.ndarray of numpy.uint8
+            Character codes of the stop loss flags ('Y' or 'N'). If not
+            specified, no orders are treated as stop loss orders.
+        trigger_price : numpy.ndarray of numpy.int64
+            Trigger prices of stop loss orders in ticks; must be specified
+            along with `on_stop_flag`.
+
+        Notes
+        -----
+        The arrays must all have the same length; the `frame_to_columns`,
+        `price_to_ticks` and `char_codes` functions may be used to construct
+        them. The limit and trigger prices must be expressed in ticks of the
+        size specified when the book was created; the timestamps may be
+        computed with `parse_timestamps`.
 
-            trans_date = datetime.datetime.strptime(order['trans_date'], '%m/%d/%Y')
-            if self.day != trans_date.day:
+        Stop loss orders are held in a trigger book for each side until the
+        last traded price rises to or above (buy) or falls to or below (sell)
+        their trigger prices; they are then added to the book in order of
+        arrival as orders generated by the LOB and matched as usual. Orders
+        triggered by the trades of a released order are released in turn.
+
+        """
+
+        cdef Py_ssize_t i, N = order_number.shape[0]
+        cdef long act
+        cdef char indicator, mkt, stop
+        cdef long long ts = 0, day_index
+        cdef object date
+        cdef BookCounters counters = self.counters
+        cdef double start = 0
+
+        if timestamp is None:
+            if counters is not None:
+                start = monotonic_time()
+            timestamp = parse_timestamps(np.asarray(trans_date),
+                                         np.asarray(trans_time))
+            if counters is not None:
+                counters.ingest_time += monotonic_time()-start
+        for a in (timestamp, trans_date, trans_time, buy_sell_indicator, activity_type,
+                  expiry_date, volume_disclosed, volume_original,
+                  limit_price, mkt_flag, io_flag):
+            if a.shape[0] != N:
+                raise ValueError('column lengths must be identical')
+        if on_stop_flag is not None:
+            if trigger_price is None:
+                raise ValueError('trigger prices must be specified with stop '
+                                 'loss flags')
+            if on_stop_flag.shape[0] != N or trigger_price.shape[0] != N:
+                raise ValueError('column lengths must be identical')
+
+        for i in range(N):
+            if self.trace:
+                self.logger.info('processing order: %i (%s, %s)' % (order_number[i],
+                                                                    trans_date[i],
+                                                                    trans_time[i]))
+
+            date = trans_date[i]
+            ts = timestamp[i]
+            day_index = ts//US_PER_DAY
+            if self._day_index != day_index:
 
                 # Save the daily stats:
                 if self._daily_stats_log_file and self.day is not None:
@@ -244,52 +3880,191 @@ class LimitOrderBook(object):
                    
                 # Reset the limit order book and trade volume variables when a new
                 # day of orders begins:
-                self.logger.info('new day - book reset')
+                if self.trace:
+                    self.logger.info('new day - book reset')
                 self.clear_book()
-                self.day = trans_date.day
-                self.logger.info('setting day: %s' % self.day)
+                self._day_index = day_index
+                self.day = datetime.date.fromordinal(EPOCH_ORDINAL+day_index).day
+                if self.trace:
+                    self.logger.info('setting day: %s' % self.day)
                 
                 # Initialize last order time to the time of the first
                 # order of the day:
-                self._last_order_time = \
-                  datetime.datetime.strptime(order['trans_date']+' '+\
-                                             order['trans_time'],
-                                             '%m/%d/%Y %H:%M:%S.%f')        
+                self._last_order_time = ts
         
                 # Reset variables used for accumulating daily stats:
                 self._curr_daily_stats = \
                     copy.copy(self._init_daily_stats)
 
                 # Reset variables used for saving last best book values:
-                self._last_book_best_values = \
-                    copy.copy(self._init_last_book_best_values)
+                self._reset_last_best_values()
+                    
+                # Clock snapshots of the book restart on every day:
+                self._next_depth_time = 0
+
+            # Take clock snapshots of the book as it was at the snapshot times
+            # preceding the order; the snapshots of each day (or of a book
+            # restored from a checkpoint) start at the first multiple of the
+            # snapshot interval at or after the first order processed:
+            if self._depth is not None and self._depth.interval > 0:
+                if self._next_depth_time == 0:
+                    self._next_depth_time = \
+                        -(-ts//self._depth.interval)*self._depth.interval
+                while self._next_depth_time <= ts:
+                    self._depth.record(self._next_depth_time, self._bids,
+                                       self._asks, self._ticks_per_unit)
+                    self._next_depth_time += self._depth.interval
                     
             # Restrict all orders processed to a single expiry date because
             # futures orders with different expiry dates are effectively
             # distinct securities insofar as the LOB is concerned:
             if not self.expiry_date:
-                self.logger.info('setting expiry date: %s' % self.expiry_date)
-                self.expiry_date = order['expiry_date']                
+                if self.trace:
+                    self.logger.info('setting expiry date: %s' % self.expiry_date)
+                self.expiry_date = expiry_date[i]
             else:
-                if self.expiry_date != order['expiry_date']:
-                    self.logger.info('skipping order %s with expiry date %s' % \
-                                     (order['order_number'], order['expiry_date']))
+                if self.expiry_date != expiry_date[i]:
+                    if self.trace:
+                        self.logger.info('skipping order %s with expiry date %s' % \
+                                         (order_number[i], expiry_date[i]))
+                    if counters is not None:
+                        counters.num_skipped += 1
                     continue
                     
-            if order['activity_type'] == 1:
-                self.add(order, 'Y')
-            elif order['activity_type'] == 3:
-                self.cancel(order)
-            elif order['activity_type'] == 4:
+            act = activity_type[i]
+            indicator = buy_sell_indicator[i]
+            mkt = mkt_flag[i]
+            stop = on_stop_flag[i] if on_stop_flag is not None else c'N'
+            if counters is not None:
+                counters.begin_order(act, mkt)
+                start = monotonic_time()
+            if act == 1:
+                if stop == c'Y':
+                    self._add_stop(order_number[i], indicator, limit_price[i],
+                                   volume_original[i], volume_disclosed[i],
+                                   mkt, io_flag[i], trigger_price[i],
+                                   trans_time[i], date, ts)
+                else:
+                    self._add(order_number[i], indicator, limit_price[i],
+                              volume_original[i], volume_disclosed[i], mkt,
+                              io_flag[i], trans_time[i], date, ts, c'Y')
+            elif act == 3:
+                self._cancel(order_number[i], indicator, limit_price[i],
+                             volume_original[i], volume_disclosed[i], mkt,
+                             io_flag[i], trans_time[i], date, ts)
+            elif act == 4:
+                # Modifications of pending stop loss orders (including stop
+                # loss market orders) replace the orders in the trigger book:
+                if self._stops(indicator).pending(order_number[i]):
+                    self._modify_stop(order_number[i], indicator,
+                                      limit_price[i], volume_original[i],
+                                      volume_disclosed[i], mkt, io_flag[i],
+                                      stop, trigger_price[i] if stop == c'Y' else 0,
+                                      trans_time[i], date, ts)
+
                 # XXX It seems that a few market orders are listed as modify orders;
                 # temporarily treat them as add operations XXX                  
-                if order['mkt_flag'] == 'Y':
-                    self.add(order, 'Y')
+                elif mkt == c'Y':
+                    self._add(order_number[i], indicator, limit_price[i],
+                              volume_original[i], volume_disclosed[i], mkt,
+                              io_flag[i], trans_time[i], date, ts, c'Y')
                 else:    
-                    self.modify(order)
+                    self._modify(order_number[i], indicator, limit_price[i],
+                                 volume_original[i], volume_disclosed[i], mkt,
+                                 io_flag[i], trans_time[i], date, ts)
             else:
-                raise ValueError('unrecognized activity type %i' % \
-                                 order['activity_type'])                
+                raise ValueError('unrecognized activity type %i' % act)
+
+            # Release the stop loss orders triggered by the trades of the
+            # order:
+            if self._traded:
+                self._traded = False
+                if self._buy_stops.count or self._sell_stops.count:
+                    self._release_stops(trans_time[i], date, ts)
+            if counters is not None:
+                counters.order_time += monotonic_time()-start
+                counters.end_order(self._pool.count,
+                                   self._bids.count+self._asks.count)
+
+            # Take a snapshot of the book after every specified number of
+            # orders:
+            if self._depth is not None and self._depth.every > 0:
+                self._depth_countdown -= 1
+                if self._depth_countdown == 0:
+                    self._depth.record(ts, self._bids, self._asks,
+                                       self._ticks_per_unit)
+                    self._depth_countdown = self._depth.every
+
+            # Publish the book after every specified number of orders:
+            if self._shared is not None:
+                self._shared_countdown -= 1
+                if self._shared_countdown == 0:
+                    self._shared.publish(ts, self._shared.every, self._bids,
+                                         self._asks, self._ticks_per_unit,
+                                         self._curr_daily_stats)
+                    self._shared_countdown = self._shared.every
+
+        # Publish the orders processed since the last update so that the
+        # published book is current whenever a batch has been processed:
+        if self._shared is not None and \
+           self._shared_countdown < self._shared.every:
+            self._shared.publish(ts, self._shared.every-self._shared_countdown,
+                                 self._bids, self._asks, self._ticks_per_unit,
+                                 self._curr_daily_stats)
+            self._shared_countdown = self._shared.every
+
+    cdef _reset_last_best_values(self):
+
+        # The initial values compare equal to those of a book whose best bid
+        # and ask have a price of 0 and no volume:
+        self._last_best_bid_tick = 0
+        self._last_best_bid_volume_original = 0
+        self._last_best_ask_tick = 0
+        self._last_best_ask_volume_original = 0
+
+    cdef dict _get_last_best_values(self):
+        return {'best_bid_price': self._tick_to_price(self._last_best_bid_tick),
+                'best_bid_volume_original': self._last_best_bid_volume_original,
+                'best_ask_price': self._tick_to_price(self._last_best_ask_tick),
+                'best_ask_volume_original': self._last_best_ask_volume_original}
+
+    cdef _set_last_best_values(self, dict values):
+        self._last_best_bid_tick = self._price_to_tick(values['best_bid_price'])
+        self._last_best_bid_volume_original = values['best_bid_volume_original']
+        self._last_best_ask_tick = self._price_to_tick(values['best_ask_price'])
+        self._last_best_ask_volume_original = values['best_ask_volume_original']
+
+    cdef inline object _tick_to_price(self, long tick):
+        if tick == NO_TICK:
+            return None
+        return self._to_price(tick)
+
+    cdef inline long _price_to_tick(self, object price):
+        if price is None:
+            return NO_TICK
+        return self._to_tick(price)
+
+    cdef inline long _to_tick(self, double price):
+        return <long>rint(price*self._ticks_per_unit)
+
+    cdef inline double _to_price(self, long tick):
+        return tick/self._ticks_per_unit
+
+    cdef inline PriceLadder _ladder(self, char indicator):
+        if indicator == c'B':
+            return self._bids
+        elif indicator == c'S':
+            return self._asks
+        else:
+            raise ValueError('invalid buy/sell indicator')
+
+    cdef inline TriggerBook _stops(self, char indicator):
+        if indicator == c'B':
+            return self._buy_stops
+        elif indicator == c'S':
+            return self._sell_stops
+        else:
+            raise ValueError('invalid buy/sell indicator')
 
     def create_level(self, indicator, price):
         """
@@ -305,18 +4080,23 @@ class LimitOrderBook(object):
 
         Returns
         -------
-        od : odict
+        level : PriceLevel
             New price level queue.
         
         """
 
-        od = odict.odict()
-        self._book_data[indicator][price] = od
-        self._book_prices[indicator][price] = True        
-        self._price_level_stats[indicator][price] = \
-            copy.copy(self._init_price_level_stats)
-        self.logger.info('created new price level: %s, %f' % (indicator, price))
-        return od
+        return self._create_level(ord(indicator), self._to_tick(price))
+
+    cdef PriceLevel _create_level(self, char indicator, long tick):
+        cdef PriceLevel level
+        side = side_to_str(indicator)
+        level = PriceLevel(self._pool, side, tick)
+        self._ladder(indicator).insert(level)
+        if self.counters is not None:
+            self.counters.levels_created += 1
+        if self.trace:
+            self.logger.info('created new price level: %s, %f' % (side, self._to_price(tick)))
+        return level
     
     def delete_level(self, indicator, price):
         """
@@ -331,10 +4111,15 @@ class LimitOrderBook(object):
 
         """
         
-        self._book_data[indicator].pop(price)
-        del self._book_prices[indicator][price]
-        self._price_level_stats[indicator].pop(price)
-        self.logger.info('deleted price level: %s, %f' % (indicator, price))
+        self._delete_level(ord(indicator), self._to_tick(price))
+
+    cdef _delete_level(self, char indicator, long tick):
+        self._ladder(indicator).remove(tick)
+        if self.counters is not None:
+            self.counters.levels_deleted += 1
+        if self.trace:
+            self.logger.info('deleted price level: %s, %f' % (side_to_str(indicator),
+                                                              self._to_price(tick)))
 
     def add_order(self, order):
         """
@@ -347,28 +4132,38 @@ class LimitOrderBook(object):
             
         """
 
-        order_number = order['order_number']
-        indicator = order['buy_sell_indicator']
-        price = order['limit_price']
-        od = self.price_level(indicator, price)
+        self._add_order(order['order_number'],
+                        ord(order['buy_sell_indicator']),
+                        self._to_tick(order['limit_price']),
+                        order['volume_original'],
+                        order['volume_disclosed'])
+
+    cdef _add_order(self, long long order_number, char indicator, long tick,
+                    long volume_original, long volume_disclosed):
+
+        cdef PriceLevel level
+        cdef np.int32_t slot
+
+        level = self._ladder(indicator).get(tick)
 
         # Create a new price level queue if none exists for the order's
         # limit price:
-        if od is None:
-            self.logger.info('no matching price level found')
-            od = self.create_level(indicator, price)
+        if level is None:
+            if self.trace:
+                self.logger.info('no matching price level found')
+            level = self._create_level(indicator, tick)
         
-        od[order_number] = order
-        self._book_orders_to_price[order_number] = od
-        
-        # Update price level stats:
-        self._price_level_stats[indicator][price]['volume_original_total'] += \
-            order['volume_original']
-        self._price_level_stats[indicator][price]['volume_disclosed_total'] += \
-            order['volume_disclosed']
+        # Only the fields used by the book are retained for each order; the
+        # price level queue also updates its volume totals:
+        slot = self._pool.alloc(order_number, indicator, tick,
+                                volume_original, volume_disclosed)
+        level.append(slot)
+        self._order_index.set(order_number, slot)
             
-        self.logger.info('added order: %s, %s, %s' % \
-                            (order_number, indicator, price))    
+        if self.trace:
+            self.logger.info('added order: %s, %s, %s' % \
+                                (order_number, side_to_str(indicator),
+                                 self._to_price(tick)))
             
     def delete_order(self, order):
         """
@@ -386,28 +4181,39 @@ class LimitOrderBook(object):
         
         """
 
-        order_number = order['order_number']
-        try:            
-            od = self._book_orders_to_price.pop(order_number)
-        except:
-            self.logger.info('order not found: %s' % order_number)
+        self._delete_order(order['order_number'])
+
+    cdef _delete_order(self, long long order_number):
+        cdef np.int32_t slot = self._order_index.get(order_number)
+        if slot == -1:
+            if self.trace:
+                self.logger.info('order not found: %s' % order_number)
         else:
-            order = od.pop(order_number)
-            indicator = order['buy_sell_indicator']
-            price = order['limit_price']
+            self._delete_slot(slot)
 
-            # Update price level stats:
-            self._price_level_stats[indicator][price]['volume_original_total'] -= \
-                order['volume_original']
-            self._price_level_stats[indicator][price]['volume_disclosed_total'] -= \
-                order['volume_disclosed']
+    cdef _delete_slot(self, np.int32_t slot):
+        cdef OrderPool pool = self._pool
+        cdef PriceLevel level
+        cdef long long order_number = pool.order_number[slot]
+        cdef char indicator = pool.indicator[slot]
+        cdef long tick = pool.tick[slot]
 
+        level = self._ladder(indicator).get(tick)
+            
+        # Unlinking the order also updates the volume totals of its level:
+        level.remove(slot)
+        if self._order_index.get(order_number) == slot:
+            self._order_index.remove(order_number)
+        pool.release(slot)
+
+        if self.trace:
             self.logger.info('deleted order: %s, %s, %s' % \
-                             (order_number, indicator, price))    
+                             (order_number, side_to_str(indicator),
+                              self._to_price(tick)))    
             
-            # If the price level queue contains no other orders, remove it:
-            if not od:
-                self.delete_level(indicator, price)
+        # If the price level queue contains no other orders, remove it:
+        if level.count == 0:
+            self._delete_level(indicator, tick)
             
     def best_bid_price(self):
         """
@@ -424,12 +4230,10 @@ class LimitOrderBook(object):
         
         """
 
-        try:
-            best_price = self._book_prices[BID].max()
-        except:
+        if self._bids.count == 0:
             return None
         else:
-            return best_price
+            return self._to_price(self._bids.best)
         
     def best_bid_data(self):
         """
@@ -446,12 +4250,13 @@ class LimitOrderBook(object):
        
         """
         
+        cdef PriceLevel level
+
         best_bid_price = self.best_bid_price()
         if best_bid_price is not None:
-            volume_original_total = \
-                self._price_level_stats[BID][best_bid_price]['volume_original_total']
-            volume_disclosed_total = \
-                self._price_level_stats[BID][best_bid_price]['volume_disclosed_total']
+            level = self._bids.get(self._bids.best)
+            volume_original_total = level.volume_original_total
+            volume_disclosed_total = level.volume_disclosed_total
         else:
             volume_original_total = volume_disclosed_total = 0
         return best_bid_price, volume_original_total, volume_disclosed_total
@@ -471,12 +4276,10 @@ class LimitOrderBook(object):
         
         """
 
-        try:
-            best_price = self._book_prices[ASK].min()
-        except:
+        if self._asks.count == 0:
             return None
         else:
-            return best_price
+            return self._to_price(self._asks.best)
 
     def best_ask_data(self):
         """
@@ -493,12 +4296,13 @@ class LimitOrderBook(object):
        
         """
         
+        cdef PriceLevel level
+
         best_ask_price = self.best_ask_price()
         if best_ask_price is not None:
-            volume_original_total = \
-                self._price_level_stats[ASK][best_ask_price]['volume_original_total']
-            volume_disclosed_total = \
-                self._price_level_stats[ASK][best_ask_price]['volume_disclosed_total']
+            level = self._asks.get(self._asks.best)
+            volume_original_total = level.volume_original_total
+            volume_disclosed_total = level.volume_disclosed_total
         else:
             volume_original_total = volume_disclosed_total = 0
         return best_ask_price, volume_original_total, volume_disclosed_total
@@ -516,8 +4320,8 @@ class LimitOrderBook(object):
         
         Returns
         -------
-        od : odict.odict
-            Ordered dict with matching price level.
+        level : PriceLevel
+            Queue with matching price level.
 
         """
 
@@ -528,14 +4332,59 @@ class LimitOrderBook(object):
             raise ValueError('invalid buy/sell indicator')
 
         # Look for price level queue:
-        try:
-            od = book[price]
-        except KeyError:
-            #self.logger.info('price level not found: %s, %f' % (indicator, price))
-            return None
+        return (<PriceLadder>book).get(self._to_tick(price))
+
+    cdef inline void _init_event(self, EventRecord *event, int action,
+                                 long long order_number, char indicator,
+                                 long tick, long volume_original,
+                                 long volume_disclosed, char mkt_flag,
+                                 char io_flag, long long timestamp,
+                                 char is_original):
+        cdef PriceLevel level
+
+        event.timestamp = timestamp
+        event.order_number = order_number
+        event.indicator = indicator
+        event.mkt_flag = mkt_flag
+        event.io_flag = io_flag
+        event.is_original = is_original
+        event.action = action
+        event.tick = tick
+        event.volume_original = volume_original
+        event.volume_disclosed = volume_disclosed
+        if self._bids.count == 0:
+            event.best_bid_tick = NO_TICK
+            event.best_bid_volume_original = 0
+        else:
+            level = self._bids.get(self._bids.best)
+            event.best_bid_tick = level.tick
+            event.best_bid_volume_original = level.volume_original_total
+        if self._asks.count == 0:
+            event.best_ask_tick = NO_TICK
+            event.best_ask_volume_original = 0
         else:
-            #self.logger.info('price level found: %s, %f' % (indicator, price))
-            return od
+            level = self._asks.get(self._asks.best)
+            event.best_ask_tick = level.tick
+            event.best_ask_volume_original = level.volume_original_total
+
+    cdef dict _event_to_dict(self, EventRecord *event, object trans_time,
+                             object trans_date):
+        return dict(time=trans_time,
+                    date=trans_date,
+                    timestamp=event.timestamp,
+                    order_number=event.order_number,
+                    indicator=side_to_str(event.indicator),
+                    mkt_flag=flag_to_str(event.mkt_flag),
+                    io_flag=flag_to_str(event.io_flag),
+                    action=action_names[event.action],
+                    is_original=flag_to_str(event.is_original),
+                    price=self._to_price(event.tick),
+                    volume_original=event.volume_original,
+                    volume_disclosed=event.volume_disclosed,
+                    best_bid_price=self._tick_to_price(event.best_bid_tick),
+                    best_bid_volume_original=event.best_bid_volume_original,
+                    best_ask_price=self._tick_to_price(event.best_ask_tick),
+                    best_ask_volume_original=event.best_ask_volume_original)
 
     def record_event(self, **event):
         """
@@ -545,9 +4394,34 @@ class LimitOrderBook(object):
         ----------
         event : dict
             Event data.
+
+        Notes
+        -----
+        Prices are rounded to the nearest tick.
             
         """
 
+        cdef EventRecord record
+
+        record.timestamp = event['timestamp']
+        record.order_number = event['order_number']
+        record.indicator = ord(event['indicator'])
+        record.mkt_flag = ord(event['mkt_flag'])
+        record.io_flag = ord(event.get('io_flag', 'N'))
+        record.is_original = ord(event['is_original'])
+        record.action = action_names.index(event['action'])
+        record.tick = self._to_tick(event['price'])
+        record.volume_original = event['volume_original']
+        record.volume_disclosed = event['volume_disclosed']
+        record.best_bid_tick = self._price_to_tick(event['best_bid_price'])
+        record.best_bid_volume_original = event['best_bid_volume_original']
+        record.best_ask_tick = self._price_to_tick(event['best_ask_price'])
+        record.best_ask_volume_original = event['best_ask_volume_original']
+        self._record_event(&record, event['time'], event['date'])
+
+    cdef _record_event(self, EventRecord *event, object trans_time,
+                       object trans_date):
+
         # Each entry contains:
         # time, date, order number,
         # indicator (B or S), market order status (Y or N),
@@ -559,19 +4433,23 @@ class LimitOrderBook(object):
         # best bid, best bid original volume,
         # best ask, best ask original volume,
 
+        cdef double price
+        cdef BookCounters counters = self.counters
+        cdef double start = 0, write_start = 0
+
+        if counters is not None:
+            start = monotonic_time()
+
         # Accumulate stats for arriving original orders (i.e., NOT orders
         # that are generated in response to modify requests):
-        if event['is_original'] == 'Y':
+        if event.is_original == c'Y':
             self._original_event_counter += 1
             self._curr_daily_stats['num_orders'] += 1
 
-            # Compute time since last order arrival:
-            date_time = datetime.datetime.strptime(event['date']+' '+\
-                                                   event['time'],
-                                                   '%m/%d/%Y %H:%M:%S.%f')
+            # Compute time since last order arrival in seconds:
             curr_interarrival_time = \
-                (date_time-self._last_order_time).total_seconds()
-            self._last_order_time = date_time
+                (event.timestamp-self._last_order_time)/1e6
+            self._last_order_time = event.timestamp
             if self._curr_daily_stats['num_orders'] == 1:
                 self._curr_daily_stats['mean_order_interarrival_time'] = \
                     curr_interarrival_time
@@ -583,34 +4461,40 @@ class LimitOrderBook(object):
                     curr_interarrival_time/N
                     
         # Accumulate stats for generated trades:
-        if event['action'] == 'trade':
+        if event.action == ACTION_TRADE:
+            price = self._to_price(event.tick)
+
+            # The last traded price determines which stop loss orders are
+            # triggered:
+            self._last_trade_tick = event.tick
+            self._traded = True
 
             # Number of trades:
             self._curr_daily_stats['num_trades'] += 1
 
             # Total trade volume:
             self._curr_daily_stats['trade_volume_total'] += \
-                event['volume_original']
+                event.volume_original
 
             # Average trade price:
             if self._curr_daily_stats['num_trades'] == 1:                
-                self._curr_daily_stats['trade_price_mean'] = \
-                    event['price']
+                self._curr_daily_stats['trade_price_mean'] = price
             else:
                 N = float(self._curr_daily_stats['num_trades'])
                 N_prev = N-1
                 self._curr_daily_stats['trade_price_mean'] = \
                     (self._curr_daily_stats['trade_price_mean']*N_prev+\
-                    event['price'])/N
+                    price)/N
                 self._curr_daily_stats['trade_price_std'] = \
                   np.sqrt((self._curr_daily_stats['trade_price_std']**2*N_prev+\
-                          (event['price']-self._curr_daily_stats['trade_price_mean'])**2)/N)
+                          (price-self._curr_daily_stats['trade_price_mean'])**2)/N)
 
         if self._show_output:
             print '----------------------------------------'
 
             # Print last event:
-            print self.event_to_row(event)
+            print event_to_row(self._event_to_dict(event, trans_time,
+                                                   trans_date))
             
             # Print queue states:
             print 'sell queue:'
@@ -618,29 +4502,40 @@ class LimitOrderBook(object):
             print 'buy queue:'
             self.print_book(BUY)
 
-        if self._events_log_file:
+        if self._events_sink is not None:
 
             # If sparse event logging is requested, check whether the event
             # action is a trade (which always occurs after some other action and
             # therefore never is associated with a change in the best bid or ask
             # values) or whether the best bid and ask prices or volume
-            # have changed since the last event before recording the event:            
+            # have changed since the last event before recording the event;
+            # the event is only converted into a dict if it is recorded:
             # XXX Don't pay attention to the disclosed volume:
             if self._sparse_events:
-                best_keys = ['best_bid_price', 'best_ask_price',
-                            'best_bid_volume_original',
-                            'best_ask_volume_original']
-                if event['action'] == 'trade' or \
-                    any([event[k] != self._last_book_best_values[k] for k in best_keys]):                
-                    row = self.event_to_row(event)
-                    self._events_log_writer.writerow(row)
-
-                    # Update the last best values:
-                    for k in best_keys:
-                        self._last_book_best_values[k] = event[k]
-            else:
-                row = self.event_to_row(event)
-                self._events_log_writer.writerow(row)
+                if event.action != ACTION_TRADE and \
+                   event.best_bid_tick == self._last_best_bid_tick and \
+                   event.best_ask_tick == self._last_best_ask_tick and \
+                   event.best_bid_volume_original == self._last_best_bid_volume_original and \
+                   event.best_ask_volume_original == self._last_best_ask_volume_original:
+                    if counters is not None:
+                        counters.events_suppressed += 1
+                        counters.record_time += monotonic_time()-start
+                    return
+
+                # Update the last best values:
+                self._last_best_bid_tick = event.best_bid_tick
+                self._last_best_bid_volume_original = event.best_bid_volume_original
+                self._last_best_ask_tick = event.best_ask_tick
+                self._last_best_ask_volume_original = event.best_ask_volume_original
+            if counters is not None:
+                write_start = monotonic_time()
+            self._events_sink.write(self._event_to_dict(event, trans_time,
+                                                        trans_date))
+            if counters is not None:
+                counters.events_recorded += 1
+                counters.event_write_time += monotonic_time()-write_start
+        if counters is not None:
+            counters.record_time += monotonic_time()-start
                 
     def record_stats(self, t, d):
         """
@@ -655,7 +4550,11 @@ class LimitOrderBook(object):
             
         """
         
+        cdef double start = 0
+
         if self._stats_log_file:
+            if self.counters is not None:
+                start = monotonic_time()
             row = [t, d,
                    self._curr_daily_stats['num_orders'],
                    self._curr_daily_stats['num_trades'],
@@ -664,6 +4563,8 @@ class LimitOrderBook(object):
                    self._curr_daily_stats['trade_price_std'],
                    self._curr_daily_stats['mean_order_interarrival_time']]
             self._stats_log_writer.writerow(row)
+            if self.counters is not None:
+                self.counters.stats_write_time += monotonic_time()-start
 
     def record_daily_stats(self, d):
         """
@@ -705,220 +4606,226 @@ class LimitOrderBook(object):
         
         """
 
-        best_bid_price, best_bid_volume_original, best_bid_volume_disclosed = \
-          self.best_bid_data()
-        best_ask_price, best_ask_volume_original, best_ask_volume_disclosed = \
-          self.best_ask_data()
-        event = \
-          dict(time=new_order['trans_time'],
-               date=new_order['trans_date'],
-               order_number=new_order['order_number'],
-               indicator=new_order['buy_sell_indicator'],
-               mkt_flag=new_order['mkt_flag'],
-               io_flag=new_order['io_flag'],
-               action='add',
-               is_original=is_original,               
-               price=new_order['limit_price'],               
-               volume_original=new_order['volume_original'],
-               volume_disclosed=new_order['volume_disclosed'],
-               best_bid_price=best_bid_price,
-               best_bid_volume_original=best_bid_volume_original,
-               best_ask_price=best_ask_price,
-               best_ask_volume_original=best_ask_volume_original)
-
-        # Retrieve data regarding the order to be added:
-        new_indicator = new_order['buy_sell_indicator']
-        volume_original = new_order['volume_original']
-        volume_disclosed = new_order['volume_disclosed']
-
-        self.logger.info('attempting add of order: %s, %s, %s, %f, %d, %d' % \
-                         (new_order['order_number'], new_indicator, new_order['mkt_flag'],
-                         new_order['limit_price'], volume_original,
-                         volume_disclosed))
+        self._add(new_order['order_number'],
+                  ord(new_order['buy_sell_indicator']),
+                  self._to_tick(new_order['limit_price']),
+                  new_order['volume_original'],
+                  new_order['volume_disclosed'],
+                  ord(new_order['mkt_flag']),
+                  ord(new_order['io_flag']),
+                  new_order['trans_time'],
+                  new_order['trans_date'],
+                  parse_timestamp(new_order['trans_date'],
+                                  new_order['trans_time']),
+                  ord(is_original))
+
+    cdef _record_fill(self, EventRecord *event, np.int32_t slot):
+        """
+        Record the match of the trade event of an arriving order with the
+        order in the specified slot before the latter is updated or removed.
+        """
+
+        self._fills.write(event.timestamp, event.order_number,
+                          event.indicator, self._pool.order_number[slot],
+                          self._pool.volume_disclosed[slot] > 0,
+                          self._to_price(event.tick), event.volume_original)
+
+    cdef _add(self, long long order_number, char indicator, long tick,
+              long volume_original, long volume_disclosed, char mkt_flag,
+              char io_flag, object trans_time, object trans_date,
+              long long timestamp, char is_original):
+
+        # Volume of the arriving order that remains to be matched:
+        cdef long volume = volume_original
+        cdef long curr_volume_original
+        cdef OrderPool pool = self._pool
+        cdef PriceLevel level
+        cdef np.int32_t slot
+        cdef long best_tick
+        cdef EventRecord event
+
+        self._init_event(&event, ACTION_ADD, order_number, indicator, tick,
+                         volume_original, volume_disclosed, mkt_flag, io_flag,
+                         timestamp, is_original)
+
+        if self.trace:
+            self.logger.info('attempting add of order: %s, %s, %s, %f, %d, %d' % \
+                             (order_number, side_to_str(indicator), flag_to_str(mkt_flag),
+                             self._to_price(tick), volume_original, volume_disclosed))
         
         # If the buy/sell order is a market order, check whether there is a
         # corresponding limit order in the book at the best ask/bid price:
-        if new_order['mkt_flag'] == 'Y':
-            while volume_original > 0:
+        if mkt_flag == c'Y':
+            while volume > 0:
 
                 # Find the queue corresponding to the best bid/ask
                 # price as appropriate; if no such queue exists
                 # (because the buy/sell sections of the book don't
                 # contain at least one buy/sell limit order), then
                 # stop trying to match orders and discard the market order:
-                if new_indicator == BUY:
-                    buy_order = new_order
-                    best_price = self.best_ask_price()
-                    if best_price is None:
-                        self.logger.info('no sell limit orders in book yet '
-                                         '- stopping processing of market buy order')
-                        break
-                    od = self.price_level(ASK, best_price) 
-                elif new_indicator == SELL:
-                    sell_order = new_order
-                    best_price = self.best_bid_price()
-                    if best_price is None:
-                        self.logger.info('no buy limit orders in book yet '
-                                         '- stopping processing of market sell order')
+                if indicator == c'B':
+                    if self._asks.count == 0:
+                        if self.trace:
+                            self.logger.info('no sell limit orders in book yet '
+                                             '- stopping processing of market buy order')
                         break
-                    od = self.price_level(BID, best_price)
+                    best_tick = self._asks.best
+                    level = self._asks.get(best_tick)
                 else:
-                    RuntimeError('invalid buy/sell indicator')
+                    if self._bids.count == 0:
+                        if self.trace:
+                            self.logger.info('no buy limit orders in book yet '
+                                             '- stopping processing of market sell order')
+                        break
+                    best_tick = self._bids.best
+                    level = self._bids.get(best_tick)
 
                 # If there is still residual volume but the best price is no
                 # longer compatible with that of the arriving order, stop
                 # trying to match orders:
-                if new_indicator == BUY and best_price > new_order['limit_price']:
-                    self.logger.info('best ask exceeds specified buy price')
+                if indicator == c'B' and best_tick > tick:
+                    if self.trace:
+                        self.logger.info('best ask exceeds specified buy price')
                     break
-                if new_indicator == SELL and best_price < new_order['limit_price']:
-                    self.logger.info('best bid is below specified sell price')
+                if indicator == c'S' and best_tick < tick:
+                    if self.trace:
+                        self.logger.info('best bid is below specified sell price')
                     break
 
                 # Orders in the book that have explicitly disclosed (i.e.,
                 # non-zero) volumes are assumed to actually be completely
-                # hidden; therefore, they must be processed AFTER
-                # orders with 0 disclosed volume. We therefore 
-                # need to reorder the orders in the identified price level to
-                # list all orders with 0 disclosed volumes before the others:
-                order_number_list = []
-                for order_number in od.keys():
-                    if od[order_number]['volume_disclosed'] == 0:
-                        order_number_list.append(order_number)
-                for order_number in od.keys():
-                    if od[order_number]['volume_disclosed'] > 0:
-                        order_number_list.append(order_number)
-                        
-                # Move through the limit orders in the price level queue from
+                # hidden; therefore, they must be processed AFTER orders
+                # with 0 disclosed volume. Move through the visible and
+                # then the hidden limit orders in the price level from
                 # oldest to newest:
-                for order_number in order_number_list:
-                    curr_order = od[order_number]
-                    if curr_order['buy_sell_indicator'] == BUY:
-                        buy_order = curr_order
-                    elif curr_order['buy_sell_indicator'] == SELL:
-                        sell_order = curr_order
-                    else:
-                        RuntimeError('invalid buy/sell indicator')
+                slot = level.first()
+                while slot != -1:
+                    curr_volume_original = pool.volume_original[slot]
 
                     # If a bid/ask limit order in the book has the same volume as
                     # that requested in the sell/buy market order, record a
                     # transaction and remove the limit order from the queue:
-                    if curr_order['volume_original'] == volume_original:
-                        self.logger.info('current limit order original volume '
-                                         'vs. arriving market order original volume: '
-                                         '%s = %s' % \
-                                         (curr_order['volume_original'],
-                                          volume_original))
+                    if curr_volume_original == volume:
+                        if self.trace:
+                            self.logger.info('current limit order original volume '
+                                             'vs. arriving market order original volume: '
+                                             '%s = %s' % \
+                                             (curr_volume_original, volume))
 
                         # Record the add event:
-                        self.record_event(**event)
+                        self._record_event(&event, trans_time, trans_date)
 
                         # Record the trade event:
-                        event['action'] = 'trade'
-                        event['price'] = best_price
-                        event['volume_original'] = volume_original
-                        event['volume_disclosed'] = volume_disclosed
-                        self.record_event(**event)
+                        event.action = ACTION_TRADE
+                        event.tick = best_tick
+                        event.volume_original = volume
+                        event.volume_disclosed = volume_disclosed
+                        self._record_event(&event, trans_time, trans_date)
+                        if self.counters is not None:
+                            self.counters.match(best_tick)
+                        if self._fills is not None:
+                            self._record_fill(&event, slot)
 
                         # Record running stats:
-                        self.record_stats(event['time'], event['date'])
+                        self.record_stats(trans_time, trans_date)
                         
-                        self.delete_order(curr_order) 
-                        volume_original = 0.0                 
+                        self._delete_slot(slot)
+                        volume = 0
                         break
 
                     # If a bid/ask limit order in the book has a greater volume
                     # than that requested in the sell/buy market order, record a
                     # transaction and decrement its volume accordingly:
-                    elif curr_order['volume_original'] > volume_original:
-                        self.logger.info('current limit order original volume '
-                                         'vs. arriving market order original volume: '
-                                         '%s > %s' % \
-                                         (curr_order['volume_original'],
-                                          volume_original))   
+                    elif curr_volume_original > volume:
+                        if self.trace:
+                            self.logger.info('current limit order original volume '
+                                             'vs. arriving market order original volume: '
+                                             '%s > %s' % \
+                                             (curr_volume_original, volume))
 
                         # Record the add event:
-                        self.record_event(**event)
+                        self._record_event(&event, trans_time, trans_date)
 
                         # Record the trade event:
-                        event['action'] = 'trade'
-                        event['price'] = best_price
-                        event['volume_original'] = volume_original
-                        event['volume_disclosed'] = volume_disclosed
-                        self.record_event(**event)
+                        event.action = ACTION_TRADE
+                        event.tick = best_tick
+                        event.volume_original = volume
+                        event.volume_disclosed = volume_disclosed
+                        self._record_event(&event, trans_time, trans_date)
+                        if self.counters is not None:
+                            self.counters.match(best_tick)
+                        if self._fills is not None:
+                            self._record_fill(&event, slot)
 
                         # Record running stats:
-                        self.record_stats(event['time'], event['date'])
+                        self.record_stats(trans_time, trans_date)
                         
-                        if new_order['io_flag'] == 'N':
-                            self.logger.info('Non-IOC order - residual volume preserved')
-                            curr_order['volume_original'] -= volume_original
-                            self._price_level_stats[curr_order['buy_sell_indicator']][curr_order['limit_price']]['volume_original_total'] \
-                                -= volume_original
+                        if io_flag == c'N':
+                            if self.trace:
+                                self.logger.info('Non-IOC order - residual volume preserved')
+                            pool.volume_original[slot] -= volume
+                            level.volume_original_total -= volume
                         else:
-                            self.logger.info('IOC order - residual volume discarded')
-                        volume_original = 0.0
+                            if self.trace:
+                                self.logger.info('IOC order - residual volume discarded')
+                        volume = 0
                         break
 
                     # If the bid/ask limit order in the book has a volume that is
                     # below the requested sell/buy market order volume, continue
                     # removing orders from the queue until the entire requested
                     # volume has been satisfied:
-                    elif curr_order['volume_original'] < volume_original:
-                        self.logger.info('current limit order original volume '
-                                         'vs. arriving market order original volume: '
-                                         '%s < %s' % \
-                                         (curr_order['volume_original'],
-                                          volume_original))                  
-                        trade = dict(trade_price=best_price,
-                                     trade_quantity=curr_order['volume_original'],
-                                     buy_order_number=buy_order['order_number'],
-                                     sell_order_number=sell_order['order_number'])
+                    else:
+                        if self.trace:
+                            self.logger.info('current limit order original volume '
+                                             'vs. arriving market order original volume: '
+                                             '%s < %s' % \
+                                             (curr_volume_original, volume))
 
                         # Record the add event:
-                        self.record_event(**event)
+                        self._record_event(&event, trans_time, trans_date)
 
                         # Record the trade event:
-                        event['action'] = 'trade'
-                        event['price'] = best_price
-                        event['volume_original'] = curr_order['volume_original']
-                        event['volume_disclosed'] = curr_order['volume_disclosed']
-                        self.record_event(**event)
+                        event.action = ACTION_TRADE
+                        event.tick = best_tick
+                        event.volume_original = curr_volume_original
+                        event.volume_disclosed = pool.volume_disclosed[slot]
+                        self._record_event(&event, trans_time, trans_date)
+                        if self.counters is not None:
+                            self.counters.match(best_tick)
+                        if self._fills is not None:
+                            self._record_fill(&event, slot)
 
                         # Record running stats:
-                        self.record_stats(event['time'], event['date'])
+                        self.record_stats(trans_time, trans_date)
                         
-                        volume_original -= curr_order['volume_original']
-                        self.delete_order(curr_order)
-                    else:
-
-                        # This should never be reached:
-                        pass
+                        volume -= curr_volume_original
+                        self._delete_slot(slot)
+                        slot = level.first()
 
-        elif new_order['mkt_flag'] == 'N':
+        elif mkt_flag == c'N':
 
             # Check whether the limit order is marketable:
-            price = new_order['limit_price']
             marketable = True
-            best_ask_price = self.best_ask_price()
-            best_bid_price = self.best_bid_price()
-            if new_indicator == BUY and best_ask_price is not None \
-                   and price >= best_ask_price:
-                self.logger.info('buy order is marketable')
-                best_price = best_ask_price;
-            elif new_indicator == SELL and best_bid_price is not None \
-                   and price <= best_bid_price:
-                self.logger.info('sell order is marketable')
-                best_price = best_bid_price;
+            if indicator == c'B' and self._asks.count > 0 \
+                   and tick >= self._asks.best:
+                if self.trace:
+                    self.logger.info('buy order is marketable')
+            elif indicator == c'S' and self._bids.count > 0 \
+                   and tick <= self._bids.best:
+                if self.trace:
+                    self.logger.info('sell order is marketable')
             else:
                 marketable = False
 
             # If the limit order is not marketable, add it to the appropriate
             # price level queue in the limit order book:
             if not marketable:
-                self.logger.info('order is not marketable')
-                self.record_event(**event)
-                self.add_order(new_order)
+                if self.trace:
+                    self.logger.info('order is not marketable')
+                self._record_event(&event, trans_time, trans_date)
+                self._add_order(order_number, indicator, tick,
+                                volume_original, volume_disclosed)
                 
             # Try to match marketable orders with orders that are already in the
             # book:
@@ -927,164 +4834,172 @@ class LimitOrderBook(object):
                 # If the requested volume in the order isn't completely
                 # satisfied at the best price, recompute the best price and
                 # try to satisfy the remainder:
-                while volume_original > 0.0:
+                while volume > 0:
 
                     # Find the queue corresponding to the best bid/ask
                     # price as appropriate; if no such queue exists
                     # (because the buy/sell sections of the book don't
                     # contain at least one buy/sell limit order), then
-                    # stop trying to match orders and save the limit order:                    
-                    if new_indicator == BUY:
-                        buy_order = new_order                    
-                        best_price = self.best_ask_price()
-                        if best_price is None:
-                            self.logger.info('no sell limit orders in book yet '
-                                             '- stopping processing of limit buy order')
-                            self.add_order(new_order)
+                    # stop trying to match orders and save the residue as a
+                    # new limit order:
+                    if indicator == c'B':
+                        if self._asks.count == 0:
+                            if self.trace:
+                                self.logger.info('no sell limit orders in book yet '
+                                                 '- stopping processing of limit buy order')
+                            if io_flag == c'N':
+                                self._add(order_number, indicator, tick, volume,
+                                          volume_disclosed, mkt_flag, io_flag,
+                                          trans_time, trans_date, timestamp,
+                                          c'N')
                             break
-                        od = self.price_level(ASK, best_price)
-                    elif new_indicator == SELL:
-                        sell_order = new_order
-                        best_price = self.best_bid_price()
-                        if best_price is None:
-                            self.logger.info('no buy limit orders in book yet '
-                                             '- stopping processing of limit sell order')
-                            self.add_order(new_order)
-                        od = self.price_level(BID, best_price)
+                        best_tick = self._asks.best
+                        level = self._asks.get(best_tick)
                     else:
-                        RuntimeError('invalid buy/sell indicator')
+                        if self._bids.count == 0:
+                            if self.trace:
+                                self.logger.info('no buy limit orders in book yet '
+                                                 '- stopping processing of limit sell order')
+                            if io_flag == c'N':
+                                self._add(order_number, indicator, tick, volume,
+                                          volume_disclosed, mkt_flag, io_flag,
+                                          trans_time, trans_date, timestamp,
+                                          c'N')
+                            break
+                        best_tick = self._bids.best
+                        level = self._bids.get(best_tick)
 
                     # If there is still residual volume but the best price is no
                     # longer compatible with that of the arriving order, stop
                     # trying to match orders and save the residue as a new limit
                     # order:
-                    if new_indicator == BUY and best_price > new_order['limit_price']:
-                        self.logger.info('best ask exceeds specified buy price')
-                        if new_order['io_flag'] == 'N':
-                            new_order['volume_original'] = volume_original
-                            self.add(new_order, 'N')
+                    if indicator == c'B' and best_tick > tick:
+                        if self.trace:
+                            self.logger.info('best ask exceeds specified buy price')
+                        if io_flag == c'N':
+                            self._add(order_number, indicator, tick, volume,
+                                      volume_disclosed, mkt_flag, io_flag,
+                                      trans_time, trans_date, timestamp,
+                                      c'N')
                         break
-                    if new_indicator == SELL and best_price < new_order['limit_price']:
-                        self.logger.info('best bid is below specified sell price')
-                        if new_order['io_flag'] == 'N':
-                            new_order['volume_original'] = volume_original
-                            self.add(new_order, 'N')
+                    if indicator == c'S' and best_tick < tick:
+                        if self.trace:
+                            self.logger.info('best bid is below specified sell price')
+                        if io_flag == c'N':
+                            self._add(order_number, indicator, tick, volume,
+                                      volume_disclosed, mkt_flag, io_flag,
+                                      trans_time, trans_date, timestamp,
+                                      c'N')
                         break
 
                     # Orders in the book that have explicitly disclosed (i.e.,
                     # non-zero) volumes are assumed to actually be completely
-                    # hidden; therefore, they must be processed AFTER
-                    # orders with 0 disclosed volume. We therefore 
-                    # need to reorder the orders in the identified price level to
-                    # list all orders with 0 disclosed volumes before the others:
-                    order_number_list = []
-                    if od is not None:
-                        for order_number in od.keys():
-                            if od[order_number]['volume_disclosed'] == 0:
-                                order_number_list.append(order_number)
-                        for order_number in od.keys():
-                            if od[order_number]['volume_disclosed'] > 0:
-                                order_number_list.append(order_number)
-                    
-                    # Move through the limit orders in the price level queue from
+                    # hidden; therefore, they must be processed AFTER orders
+                    # with 0 disclosed volume. Move through the visible and
+                    # then the hidden limit orders in the price level from
                     # oldest to newest:
-                    for order_number in order_number_list: 
-                        curr_order = od[order_number]
-                        if new_indicator == BUY:
-                            sell_order = curr_order
-                        elif new_indicator == SELL:
-                            buy_order = curr_order
-                        else:
-                            RuntimeError('invalid buy/sell indicator')
+                    slot = level.first()
+                    while slot != -1:
+                        curr_volume_original = pool.volume_original[slot]
 
                         # If a bid/ask limit order in the book has the same volume
                         # as that requested in the sell/buy limit order, record a
                         # transaction and remove the limit order from the queue:
-                        if curr_order['volume_original'] == volume_original:
-                            self.logger.info('current limit order original volume '
-                                             'vs. arriving limit order original volume: '
-                                             '%s = %s' % \
-                                             (curr_order['volume_original'],
-                                              volume_original))
+                        if curr_volume_original == volume:
+                            if self.trace:
+                                self.logger.info('current limit order original volume '
+                                                 'vs. arriving limit order original volume: '
+                                                 '%s = %s' % \
+                                                 (curr_volume_original, volume))
 
                             # Record the add event:
-                            self.record_event(**event)
+                            self._record_event(&event, trans_time, trans_date)
 
                             # Record the trade event:
-                            event['action'] = 'trade'
-                            event['price'] = best_price
-                            event['volume_original'] = volume_original
-                            event['volume_disclosed'] = volume_disclosed
-                            self.record_event(**event)
-
-                            self.delete_order(curr_order)
-                            volume_original = 0.0
+                            event.action = ACTION_TRADE
+                            event.tick = best_tick
+                            event.volume_original = volume
+                            event.volume_disclosed = volume_disclosed
+                            self._record_event(&event, trans_time, trans_date)
+                            if self.counters is not None:
+                                self.counters.match(best_tick)
+                            if self._fills is not None:
+                                self._record_fill(&event, slot)
+
+                            self._delete_slot(slot)
+                            volume = 0
                             break
                         
                         # If a bid/ask limit order in the book has a greater volume
                         # than that requested in the sell/buy limit order, record a
                         # transaction and decrement its volume accordingly:
-                        elif curr_order['volume_original'] > volume_original:
-                            self.logger.info('current limit order original volume '
-                                             'vs. arriving limit order original volume: '
-                                             '%s > %s' % \
-                                             (curr_order['volume_original'],
-                                              volume_original))
+                        elif curr_volume_original > volume:
+                            if self.trace:
+                                self.logger.info('current limit order original volume '
+                                                 'vs. arriving limit order original volume: '
+                                                 '%s > %s' % \
+                                                 (curr_volume_original, volume))
 
                             # Record the add event:
-                            self.record_event(**event)
+                            self._record_event(&event, trans_time, trans_date)
 
                             # Record the trade event:
-                            event['action'] = 'trade'
-                            event['price'] = best_price
-                            event['volume_original'] = volume_original
-                            event['volume_disclosed'] = volume_disclosed
-                            self.record_event(**event)
+                            event.action = ACTION_TRADE
+                            event.tick = best_tick
+                            event.volume_original = volume
+                            event.volume_disclosed = volume_disclosed
+                            self._record_event(&event, trans_time, trans_date)
+                            if self.counters is not None:
+                                self.counters.match(best_tick)
+                            if self._fills is not None:
+                                self._record_fill(&event, slot)
 
                             # Record running stats:
-                            self.record_stats(event['time'], event['date'])
+                            self.record_stats(trans_time, trans_date)
                             
-                            if new_order['io_flag'] == 'N':
-                                self.logger.info('Non-IOC order - residual volume preserved')  
-                                curr_order['volume_original'] -= volume_original
-                                self._price_level_stats[curr_order['buy_sell_indicator']][curr_order['limit_price']]['volume_original_total'] \
-                                  -= volume_original
+                            if io_flag == c'N':
+                                if self.trace:
+                                    self.logger.info('Non-IOC order - residual volume preserved')  
+                                pool.volume_original[slot] -= volume
+                                level.volume_original_total -= volume
     
                             else:
-                                self.logger.info('IOC order - residual volume discarded')
-                            volume_original = 0.0
+                                if self.trace:
+                                    self.logger.info('IOC order - residual volume discarded')
+                            volume = 0
                             break
 
                         # If the bid/ask limit order in the book has a volume
                         # that is below the requested sell/buy market order
                         # volume, continue removing orders from the queue until
                         # the entire requested volume has been satisfied:
-                        elif curr_order['volume_original'] < volume_original:
-                            self.logger.info('current limit order original volume '
-                                             'vs. arriving limit order original volume: '
-                                             '%s < %s' % \
-                                             (curr_order['volume_original'],
-                                              volume_original))
+                        else:
+                            if self.trace:
+                                self.logger.info('current limit order original volume '
+                                                 'vs. arriving limit order original volume: '
+                                                 '%s < %s' % \
+                                                 (curr_volume_original, volume))
 
                             # Record the add event:
-                            self.record_event(**event)
+                            self._record_event(&event, trans_time, trans_date)
 
                             # Record the trade event:
-                            event['action'] = 'trade'
-                            event['price'] = best_price
-                            event['volume_original'] = curr_order['volume_original']
-                            event['volume_disclosed'] = curr_order['volume_disclosed']
-                            self.record_event(**event)
+                            event.action = ACTION_TRADE
+                            event.tick = best_tick
+                            event.volume_original = curr_volume_original
+                            event.volume_disclosed = pool.volume_disclosed[slot]
+                            self._record_event(&event, trans_time, trans_date)
+                            if self.counters is not None:
+                                self.counters.match(best_tick)
+                            if self._fills is not None:
+                                self._record_fill(&event, slot)
 
                             # Record running stats:
-                            self.record_stats(event['time'], event['date'])
+                            self.record_stats(trans_time, trans_date)
                             
-                            volume_original -= curr_order['volume_original']
-                            self.delete_order(curr_order) 
-                        else:
-
-                            # This should never be reached:
-                            pass                                            
+                            volume -= curr_volume_original
+                            self._delete_slot(slot)
+                            slot = level.first()
         else:
             raise RuntimeError('invalid market order flag')
         
@@ -1093,99 +5008,106 @@ class LimitOrderBook(object):
         Modify the order with matching order number in the LOB.
         """
 
-        best_bid_price, best_bid_volume_original, best_bid_volume_disclosed = \
-          self.best_bid_data()
-        best_ask_price, best_ask_volume_original, best_ask_volume_disclosed = \
-          self.best_ask_data()
-        event = \
-          dict(time=new_order['trans_time'],
-               date=new_order['trans_date'],
-               order_number=new_order['order_number'],
-               indicator=new_order['buy_sell_indicator'],
-               mkt_flag=new_order['mkt_flag'],
-               io_flag=new_order['io_flag'],
-               is_original='Y',
-               action='modify',               
-               price=new_order['limit_price'],               
-               volume_original=new_order['volume_original'],
-               volume_disclosed=new_order['volume_disclosed'],
-               best_bid_price=best_bid_price,
-               best_bid_volume_original=best_bid_volume_original,
-               best_ask_price=best_ask_price,
-               best_ask_volume_original=best_ask_volume_original)
-
-        self.logger.info('attempting modify of order: %s, %s' % \
-                         (new_order['order_number'],
-                          new_order['buy_sell_indicator']))
+        self._modify(new_order['order_number'],
+                     ord(new_order['buy_sell_indicator']),
+                     self._to_tick(new_order['limit_price']),
+                     new_order['volume_original'],
+                     new_order['volume_disclosed'],
+                     ord(new_order['mkt_flag']),
+                     ord(new_order['io_flag']),
+                     new_order['trans_time'],
+                     new_order['trans_date'],
+                     parse_timestamp(new_order['trans_date'],
+                                     new_order['trans_time']))
+
+    cdef _modify(self, long long order_number, char indicator, long tick,
+                 long volume_original, long volume_disclosed, char mkt_flag,
+                 char io_flag, object trans_time, object trans_date,
+                 long long timestamp):
+
+        cdef OrderPool pool = self._pool
+        cdef PriceLevel level
+        cdef np.int32_t slot
+        cdef long old_volume_original, old_volume_disclosed
+        cdef long old_tick
+        cdef EventRecord event
+
+        self._init_event(&event, ACTION_MODIFY, order_number, indicator, tick,
+                         volume_original, volume_disclosed, mkt_flag, io_flag,
+                         timestamp, c'Y')
+
+        if self.trace:
+            self.logger.info('attempting modify of order: %s, %s' % \
+                             (order_number, side_to_str(indicator)))
         
         # This exception should never be thrown:
-        if new_order['mkt_flag'] == 'Y':
+        if mkt_flag == c'Y':
             raise ValueError('cannot modify market order')
 
         # A modify order contains the number of the existing order to modify and
-        # a new limit price or quantity. We use the self._book_orders_to_price
-        # dict to look up the existing order:
-        book = self._book_data[new_order['buy_sell_indicator']]
-        try:
-            od = self._book_orders_to_price[new_order['order_number']]
-        except:
-            self.logger.info('order number %s not found' % new_order['order_number'])
+        # a new limit price or quantity. We use the self._order_index
+        # index to look up the existing order:
+        slot = self._order_index.get(order_number)
+        if slot == -1:
+            if self.trace:
+                self.logger.info('order number %s not found' % order_number)
         else:
-            old_order = od[new_order['order_number']]
+            old_tick = pool.tick[slot]
+            old_volume_original = pool.volume_original[slot]
+            old_volume_disclosed = pool.volume_disclosed[slot]
             
             # If the modify changes the price of an order, remove it and
             # then add the modified order to the appropriate price level queue:
-            if new_order['limit_price'] != old_order['limit_price']:
-                self.logger.info('modified order %i price from %f to %f: ' % \
-                                 (new_order['order_number'],
-                                  old_order['limit_price'],
-                                  new_order['limit_price']))
-                self.delete_order(old_order)                                   
-                self.add(new_order, 'N')
+            if tick != old_tick:
+                if self.trace:
+                    self.logger.info('modified order %i price from %f to %f: ' % \
+                                     (order_number,
+                                      self._to_price(old_tick),
+                                      self._to_price(tick)))
+                self._delete_slot(slot)
+                self._add(order_number, indicator, tick, volume_original,
+                          volume_disclosed, mkt_flag, io_flag, trans_time,
+                          trans_date, timestamp, c'N')
 
             # If the modify reduces the original or disclosed volume of an
             # order, update it without altering where it is in the price level queue:
-            elif new_order['volume_original'] < old_order['volume_original'] or \
-                new_order['volume_disclosed'] < old_order['volume_disclosed']:
-                self.logger.info('modified order %i (original, disclosed) volume '                    
-                                 'from (%i, %i) to (%i, %i)' % \
-                                 (new_order['order_number'],
-                                  old_order['volume_original'], old_order['volume_disclosed'],
-                                  new_order['volume_original'], new_order['volume_disclosed']))
-                od[new_order['order_number']] = new_order
-
-                # Update price level stats:
-                self._price_level_stats[new_order['buy_sell_indicator']][new_order['limit_price']]['volume_original_total'] \
-                    += -old_order['volume_original']+new_order['volume_original']
-                self._price_level_stats[new_order['buy_sell_indicator']][new_order['limit_price']]['volume_disclosed_total'] \
-                    += -old_order['volume_disclosed']+new_order['volume_disclosed']                
+            elif volume_original < old_volume_original or \
+                volume_disclosed < old_volume_disclosed:
+                if self.trace:
+                    self.logger.info('modified order %i (original, disclosed) volume '                    
+                                     'from (%i, %i) to (%i, %i)' % \
+                                     (order_number,
+                                      old_volume_original, old_volume_disclosed,
+                                      volume_original, volume_disclosed))
+
+                # Updating the order also updates the price level stats and
+                # moves the order between the level's visible and hidden
+                # queues if necessary:
+                level = self._ladder(pool.indicator[slot]).get(old_tick)
+                level.update(slot, volume_original, volume_disclosed)
                 
             # If the modify increases the original or disclosed volume of an
-            # order, add a order containing the difference in volume between
-            # the original and new orders:
-            elif new_order['volume_original'] > old_order['volume_original'] or \
-                new_order['volume_disclosed'] > old_order['volume_disclosed']:
-                self.logger.info('modified order %i (original, disclosed) volume '
-                                 'from (%i, %i) to (%i, %i)' % \
-                                 (new_order['order_number'],
-                                  old_order['volume_original'], old_order['volume_disclosed'],
-                                  new_order['volume_original'], new_order['volume_disclosed']))
-                new_order_modified = new_order.copy()
-                new_order_modified['volume_original'] -= old_order['volume_original']
-                new_order_modified['volume_disclosed'] -= old_order['volume_disclosed']
-                self.add(new_order_modified, 'N')
-
-                # Update price level stats:
-                self._price_level_stats[new_order['buy_sell_indicator']][new_order['limit_price']]['volume_original_total'] \
-                    += -old_order['volume_original']+new_order['volume_original']
-                self._price_level_stats[new_order['buy_sell_indicator']][new_order['limit_price']]['volume_disclosed_total'] \
-                    += -old_order['volume_disclosed']+new_order['volume_disclosed']                
+            # order, remove it and then add the modified order to the end of
+            # the price level queue:
+            elif volume_original > old_volume_original or \
+                volume_disclosed > old_volume_disclosed:
+                if self.trace:
+                    self.logger.info('modified order %i (original, disclosed) volume '
+                                     'from (%i, %i) to (%i, %i)' % \
+                                     (order_number,
+                                      old_volume_original, old_volume_disclosed,
+                                      volume_original, volume_disclosed))
+                self._delete_slot(slot)
+                self._add(order_number, indicator, tick, volume_original,
+                          volume_disclosed, mkt_flag, io_flag, trans_time,
+                          trans_date, timestamp, c'N')
 
             else:
-                self.logger.info('undefined modify scenario')
+                if self.trace:
+                    self.logger.info('undefined modify scenario')
                             
-        self.record_event(**event)
-        self.record_stats(event['time'], event['date'])
+        self._record_event(&event, trans_time, trans_date)
+        self.record_stats(trans_time, trans_date)
         
     def cancel(self, order):
         """
@@ -1198,49 +5120,151 @@ class LimitOrderBook(object):
 
         """
                 
-        best_bid_price, best_bid_volume_original, best_bid_volume_disclosed = \
-          self.best_bid_data()
-        best_ask_price, best_ask_volume_original, best_ask_volume_disclosed = \
-          self.best_ask_data()
-        event = \
-          dict(time=order['trans_time'],
-               date=order['trans_date'],
-               order_number=order['order_number'],
-               indicator=order['buy_sell_indicator'],
-               mkt_flag=order['mkt_flag'],
-               io_flag=order['io_flag'],
-               action='cancel',               
-               is_original='Y',               
-               price=order['limit_price'],               
-               volume_original=order['volume_original'],
-               volume_disclosed=order['volume_disclosed'],
-               best_bid_price=best_bid_price,
-               best_bid_volume_original=best_bid_volume_original,
-               best_ask_price=best_ask_price,
-               best_ask_volume_original=best_ask_volume_original)
-
-        self.logger.info('attempting cancel of order %s' % order['order_number'])
+        self._cancel(order['order_number'],
+                     ord(order['buy_sell_indicator']),
+                     self._to_tick(order['limit_price']),
+                     order['volume_original'],
+                     order['volume_disclosed'],
+                     ord(order['mkt_flag']),
+                     ord(order['io_flag']),
+                     order['trans_time'],
+                     order['trans_date'],
+                     parse_timestamp(order['trans_date'],
+                                     order['trans_time']))
+
+    cdef _cancel(self, long long order_number, char indicator, long tick,
+                 long volume_original, long volume_disclosed, char mkt_flag,
+                 char io_flag, object trans_time, object trans_date,
+                 long long timestamp):
+
+        cdef EventRecord event
+
+        self._init_event(&event, ACTION_CANCEL, order_number, indicator, tick,
+                         volume_original, volume_disclosed, mkt_flag, io_flag,
+                         timestamp, c'Y')
+
+        if self.trace:
+            self.logger.info('attempting cancel of order %s' % order_number)
 
         # Filter out cancellation orders that are listed as market orders:
-        if order['mkt_flag'] == 'Y':
-            self.logger.info('cannot cancel market order %s' % order['order_number'])
+        if mkt_flag == c'Y':
+            if self.trace:
+                self.logger.info('cannot cancel market order %s' % order_number)
+
+        # Stop loss orders that have not been triggered are only removed from
+        # the trigger book:
+        elif self._stops(indicator).remove(order_number):
+            if self.trace:
+                self.logger.info('cancelled pending stop loss order %s' % \
+                                 order_number)
+        else:
+            self._delete_order(order_number)
+        self._record_event(&event, trans_time, trans_date)
+        self.record_stats(trans_time, trans_date)
+
+    cdef _add_stop(self, long long order_number, char indicator, long tick,
+                   long volume_original, long volume_disclosed, char mkt_flag,
+                   char io_flag, long trigger, object trans_time,
+                   object trans_date, long long timestamp):
+
+        # Stop loss orders whose triggers have already been crossed by the
+        # last traded price are added to the book immediately; all others are
+        # held until a trade crosses them. The arrival of a held order is
+        # recorded as an original add event so that it is accounted for in
+        # the daily stats; the add that follows its release is generated by
+        # the LOB:
+        cdef EventRecord event
+        cdef TriggerBook stops = self._stops(indicator)
+        if stops.triggered(trigger, self._last_trade_tick):
+            self._add(order_number, indicator, tick, volume_original,
+                      volume_disclosed, mkt_flag, io_flag, trans_time,
+                      trans_date, timestamp, c'Y')
         else:
-            self.delete_order(order)
-        self.record_event(**event)
-        self.record_stats(event['time'], event['date'])
+            self._init_event(&event, ACTION_ADD, order_number, indicator, tick,
+                             volume_original, volume_disclosed, mkt_flag,
+                             io_flag, timestamp, c'Y')
+            if self.trace:
+                self.logger.info('holding stop loss order %s with trigger %f' % \
+                                 (order_number, self._to_price(trigger)))
+            stops.add(trigger, (self._stop_seq, order_number, indicator, tick,
+                                volume_original, volume_disclosed, mkt_flag,
+                                io_flag))
+            self._stop_seq += 1
+            self._record_event(&event, trans_time, trans_date)
+            self.record_stats(trans_time, trans_date)
+
+    cdef _modify_stop(self, long long order_number, char indicator, long tick,
+                      long volume_original, long volume_disclosed,
+                      char mkt_flag, char io_flag, char on_stop_flag,
+                      long trigger, object trans_time, object trans_date,
+                      long long timestamp):
+
+        # A pending stop loss order is replaced by the modified order, which
+        # is held again if it is still a stop loss order whose trigger has not
+        # been crossed:
+        cdef EventRecord event
+        cdef TriggerBook stops = self._stops(indicator)
+
+        self._init_event(&event, ACTION_MODIFY, order_number, indicator, tick,
+                         volume_original, volume_disclosed, mkt_flag, io_flag,
+                         timestamp, c'Y')
+        if self.trace:
+            self.logger.info('modifying pending stop loss order %s' % \
+                             order_number)
+        stops.remove(order_number)
+        if on_stop_flag == c'Y' and \
+           not stops.triggered(trigger, self._last_trade_tick):
+            stops.add(trigger, (self._stop_seq, order_number, indicator, tick,
+                                volume_original, volume_disclosed, mkt_flag,
+                                io_flag))
+            self._stop_seq += 1
+        else:
+            self._add(order_number, indicator, tick, volume_original,
+                      volume_disclosed, mkt_flag, io_flag, trans_time,
+                      trans_date, timestamp, c'N')
+        self._record_event(&event, trans_time, trans_date)
+        self.record_stats(trans_time, trans_date)
+
+    cdef _release_stops(self, object trans_time, object trans_date,
+                        long long timestamp):
+
+        # The trades of released orders may trigger further orders, so orders
+        # are released until the last traded price no longer crosses any
+        # pending triggers:
+        cdef list released
+        cdef tuple order
+        while True:
+            released = self._buy_stops.release(self._last_trade_tick)+\
+                       self._sell_stops.release(self._last_trade_tick)
+            if not released:
+                break
+            self._traded = False
+            released.sort()
+            for order in released:
+                if self.trace:
+                    self.logger.info('triggered stop loss order %s' % order[1])
+                self._add(order[1], order[2], order[3], order[4], order[5],
+                          order[6], order[7], trans_time, trans_date,
+                          timestamp, c'N')
+            if not self._traded:
+                break
+        self._traded = False
         
     def print_book(self, indicator):
         """
         Print parts of the specified book dictionary in a neat manner.
         """
 
-        book = self._book_data[indicator]
-        prices = self._book_prices[indicator]
-        for price in prices.keys():
-            print '%06.2f: ' % price,            
-            for order_number in book[price]:
-                order = book[price][order_number]
-                print '(%s,%s)' % (order['volume_original'], order['volume_disclosed']),
+        cdef OrderPool pool = self._pool
+        cdef PriceLevel level
+        cdef np.int32_t slot
+
+        cdef PriceLadder book = self._book_data[indicator]
+        for tick in book.ticks():
+            print '%06.2f: ' % self._to_price(tick),            
+            level = book.get(tick)
+            for slot in level.slots():
+                print '(%s,%s)' % (pool.volume_original[slot], pool.volume_disclosed[slot]),
             print ''
 
     def event_to_row(self, event):
@@ -1248,32 +5272,198 @@ class LimitOrderBook(object):
         Convert a dictionary containing event data into a row for output to CSV.
         """
         
-        row = [event['time'],
-               event['date'],
-               event['order_number'],
-               event['indicator'],
-               event['mkt_flag'],
-               event['action'],
-               event['is_original'],               
-               event['price'],               
-               event['volume_original'],
-               event['volume_disclosed'],
-               event['best_bid_price'],
-               event['best_bid_volume_original'],
-               event['best_ask_price'],
-               event['best_ask_volume_original']]
-        return row
+        return event_to_row(event)
     
+    property daily_stats:
+        """
+        Copy of the stats accumulated for the current day.
+        """
+
+        def __get__(self):
+            return copy.copy(self._curr_daily_stats)
+
     def print_daily_stats(self):
         """
         Display daily stats.
         """
         
-        print '--------------------------------------------'
-        print 'Number of orders:             ', self._curr_daily_stats['num_orders']
-        print 'Number of trades:             ', self._curr_daily_stats['num_trades']
-        print 'Total trade volume:           ', self._curr_daily_stats['trade_volume_total']
-        print 'Mean trade price:             ', self._curr_daily_stats['trade_price_mean']
-        print 'Trade price STD:              ', self._curr_daily_stats['trade_price_std']
-        print 'Mean order interarrival time: ', self._curr_daily_stats['mean_order_interarrival_time']
+        print_daily_stats(self._curr_daily_stats)
         
+
+class BookManager(object):
+    """
+    Limit order books for multiple securities and expiry dates.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory in which the logs of the books are written. If set to None,
+        no logs are written.
+    binary_events : bool
+        If set to True, the events of each book are written to a NumPy .npy
+        file rather than to a CSV file.
+    symbols : sequence of str
+        Symbols whose orders are processed; the orders of all other symbols
+        are ignored. If set to None, the orders of all symbols are processed.
+    kwargs : dict
+        Additional parameters (e.g., `sparse_events`, `tick_size`, `trace`, or
+        `async_output`) passed to every `LimitOrderBook` instance.
+
+    Notes
+    -----
+    Orders are routed by symbol and expiry date to separate books that are
+    created when the first order with a new symbol and expiry date is
+    encountered; each book only processes orders with its expiry date. The
+    events and daily stats of the book for symbol S and expiry date
+    MM/DD/YYYY are written to the files events-S-YYYYMMDD.log and
+    daily_stats-S-YYYYMMDD.log in the output directory.
+
+    """
+
+    def __init__(self, output_dir, binary_events=False, symbols=None,
+                 **kwargs):
+        self.output_dir = output_dir
+        self.binary_events = binary_events
+        self.symbols = None if symbols is None else frozenset(symbols)
+        kwargs.setdefault('show_output', False)
+        kwargs.setdefault('stats_log_file', None)
+        self.tick_size = kwargs.get('tick_size', 0.05)
+        self._kwargs = kwargs
+
+        # Books indexed by (symbol, expiry date):
+        self.books = {}
+
+    def log_file_names(self, symbol, expiry_date):
+        """
+        Return the names of the events and daily stats log files of a book.
+        """
+
+        if self.output_dir is None:
+            return None, None
+        m, d, y = expiry_date.strip().split('/')
+        suffix = '%s-%s%s%s' % (symbol.strip(), y, m, d)
+        ext = '.npy' if self.binary_events else '.log'
+        return (os.path.join(self.output_dir, 'events-' + suffix + ext),
+                os.path.join(self.output_dir, 'daily_stats-' + suffix + '.log'))
+
+    def get_book(self, symbol, expiry_date):
+        """
+        Return the book for a symbol and expiry date, creating it if necessary.
+        """
+
+        key = (symbol, expiry_date)
+        try:
+            return self.books[key]
+        except KeyError:
+            events_log_file, daily_stats_log_file = \
+                self.log_file_names(symbol, expiry_date)
+            lob = LimitOrderBook(events_log_file=events_log_file,
+                                 daily_stats_log_file=daily_stats_log_file,
+                                 **self._kwargs)
+            lob.expiry_date = expiry_date
+            self.books[key] = lob
+            return lob
+
+    def process(self, df):
+        """
+        Process order data
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Each row of this DataFrame instance contains a single order.
+
+        """
+
+        columns = frame_to_columns(df, self.tick_size)
+        columns['symbol'] = np.asarray(df['symbol'].values, dtype=object)
+        self.process_columns(**columns)
+
+    def process_columns(self, symbol, expiry_date, **columns):
+        """
+        Route order data stored in column arrays to the books.
+
+        Parameters
+        ----------
+        symbol : numpy.ndarray of str
+            Symbols of the orders.
+        expiry_date : numpy.ndarray of str
+            Expiry dates of the orders.
+        columns : dict of numpy.ndarray
+            Remaining columns accepted by `LimitOrderBook.process_columns`.
+
+        Notes
+        -----
+        The orders routed to each book are processed in their original
+        order.
+
+        """
+
+        cdef Py_ssize_t i, n = len(symbol)
+        cdef object[:] s = symbol, e = expiry_date
+        cdef np.int64_t[:] c
+        cdef dict keys = {}
+        cdef object key, last_key = None
+        cdef long code = -1
+
+        if n == 0:
+            return
+
+        # Assign a code to each distinct symbol and expiry date in the batch;
+        # orders with the same key are usually adjacent:
+        codes = np.empty(n, np.int64)
+        c = codes
+        for i in range(n):
+            if last_key is None or s[i] is not last_key[0] or \
+               e[i] is not last_key[1]:
+                key = (s[i], e[i])
+                if key != last_key:
+                    code = keys.setdefault(key, len(keys))
+                last_key = key
+            c[i] = code
+
+        if len(keys) == 1:
+            if self.symbols is None or last_key[0].strip() in self.symbols:
+                self.get_book(*last_key).process_columns(
+                    expiry_date=expiry_date, **columns)
+            return
+
+        # A stable sort keeps the orders with each key in their original
+        # order:
+        expiry_date = np.asarray(expiry_date)
+        columns = dict((k, np.asarray(v)) for k, v in columns.iteritems() \
+                       if v is not None)
+        order = np.argsort(codes, kind='mergesort')
+        bounds = np.searchsorted(codes[order], np.arange(len(keys)+1))
+        for key, code in keys.iteritems():
+            if self.symbols is not None and key[0].strip() not in self.symbols:
+                continue
+            idx = order[bounds[code]:bounds[code+1]]
+            self.get_book(*key).process_columns(
+                expiry_date=expiry_date[idx],
+                **dict((k, v[idx]) for k, v in columns.iteritems()))
+
+    def record_daily_stats(self):
+        """
+        Record the daily stats of the current day of every book.
+        """
+
+        for lob in self.books.itervalues():
+            lob.record_daily_stats(lob.day)
+
+    def flush(self):
+        """
+        Write all buffered events and stats of every book to the log files.
+        """
+
+        for lob in self.books.itervalues():
+            lob.flush()
+
+    def close(self):
+        """
+        Write all buffered events and stats and close the log files of every
+        book.
+        """
+
+        for lob in self.books.itervalues():
+            lob.close()
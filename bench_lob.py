@@ -0,0 +1,636 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the limit order book simulation on synthetic or replicated order data.
+"""
+
+# Copyright (c) 2012-2014, Lev Givon
+# All rights reserved.
+# Distributed under the terms of the BSD license:
+# http://www.opensource.org/licenses/bsd-license
+
+import _lob
+
+import collections
+import ctypes
+import ctypes.util
+import datetime
+import fractions
+import gc
+import getopt
+import json
+import multiprocessing
+import numpy as np
+import os
+import pandas
+import platform
+import resource
+import subprocess
+import sys
+
+usage = \
+"""
+Usage: %s [options] [<input file name> [<number of copies>]]
+
+Options:
+  -s <scenario>    Only run the specified scenario (may be repeated).
+  -n <number>      Number of orders generated for each scenario (default %i).
+  -r <number>      Number of timed throughput runs of each scenario (default %i).
+  -t <file name>   Order file whose shape seeds the generator (default %s).
+  -S <seed>        Seed of the order flow generator (default %i).
+  -o <file name>   Results file (default %s).
+  -c <file name>   Results file of an earlier run to compare against.
+  -w <directory>   Also write the generated orders of each scenario to
+                   <directory>/<scenario>-orders.csv.
+
+The synthetic scenarios are: %s. If an input file is specified, the book is
+also benchmarked on the specified number of copies of its orders (default %i).
+"""
+
+# Number of orders generated for each scenario:
+NUM_ORDERS = 200000
+
+# Number of timed throughput runs of each scenario; the fastest run is
+# reported along with all of the run times:
+NUM_RUNS = 3
+
+# Order file whose shape seeds the order flow generator:
+TEMPLATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'EXAMPLE-orders.csv')
+
+SEED = 0
+
+RESULTS_FILE = 'bench-results.json'
+
+# Number of copies of an input file benchmarked by default:
+NUM_COPIES = 1000
+
+# Latency percentiles reported for every operation:
+PERCENTILES = [50, 90, 99, 99.9]
+
+# Parameters of the synthetic order flow of each scenario (see
+# generate_orders):
+SCENARIOS = \
+  {'add_heavy': dict(cancel_ratio=0.05, modify_ratio=0.05, depth=20,
+                     hidden_share=0.1, market_share=0.01,
+                     marketable_share=0.05),
+   'cancel_heavy': dict(cancel_ratio=0.45, modify_ratio=0.15, depth=20,
+                        hidden_share=0.1, market_share=0.01,
+                        marketable_share=0.02),
+   'deep_sweep': dict(cancel_ratio=0.1, modify_ratio=0.05, depth=50,
+                      hidden_share=0.25, market_share=0.05,
+                      marketable_share=0.15, sweep_levels=25),
+   'many_levels': dict(cancel_ratio=0.2, modify_ratio=0.1, depth=5000,
+                       hidden_share=0.1, market_share=0.01,
+                       marketable_share=0.02)}
+
+# Number of microseconds in a day:
+US_PER_DAY = 86400*10**6
+
+def read_orders(file_name):
+    """
+    Read an order file into a DataFrame.
+    """
+
+    return pandas.read_csv(file_name, names=_lob.col_names,
+                           dtype={'trans_date': str, 'trans_time': str,
+                                  'expiry_date': str})
+
+def order_flow_template(file_name, tick_size=0.05):
+    """
+    Extract the shape of the order flow in an order file.
+
+    Parameters
+    ----------
+    file_name : str
+        Order file name.
+    tick_size : float
+        Minimum price increment.
+
+    Returns
+    -------
+    template : dict
+        Fields that are constant in generated orders, the date, time, and
+        number of the first order, the mean interarrival time in
+        microseconds, the median limit price in ticks, the lot size, and the
+        number of orders of each observed volume in lots. Only the orders
+        with the most common expiry date in the file are considered.
+
+    """
+
+    df = read_orders(file_name)
+    df = df[df['expiry_date'] == df['expiry_date'].value_counts().index[0]]
+    first = df.iloc[0]
+
+    timestamp = _lob.parse_timestamps(df['trans_date'].values,
+                                      df['trans_time'].values)
+    if len(df) > 1:
+        interarrival_time = max(float(timestamp[-1]-timestamp[0])/(len(df)-1), 1.0)
+    else:
+        interarrival_time = 1000.0
+
+    limit_price = df['limit_price'].values
+    limit_price = limit_price[limit_price > 0]
+    volume = [int(v) for v in df['volume_original'].values]
+    lot_size = reduce(fractions.gcd, volume, 0) or 1
+
+    constant = dict((k, first[k]) for k in
+                    ['record_indicator', 'segment', 'symbol', 'instrument',
+                     'expiry_date', 'strike_price', 'option_type',
+                     'trigger_price', 'on_stop_flag', 'spread_comb_type',
+                     'algo_ind', 'client_id_flag'])
+    return dict(constant=dict((k, v.item() if hasattr(v, 'item') else v)
+                              for k, v in constant.iteritems()),
+                trans_date=first['trans_date'],
+                start_time=int(timestamp[0] % US_PER_DAY),
+                order_number=int(first['order_number']),
+                interarrival_time=interarrival_time,
+                tick_size=tick_size,
+                price=int(_lob.price_to_ticks(np.array([np.median(limit_price)]),
+                                              tick_size)[0]),
+                lot_size=lot_size,
+                lots=dict((str(k), n) for k, n in
+                          collections.Counter(v//lot_size for v in volume).iteritems()))
+
+def format_time(t):
+    """
+    Format a time of day in microseconds as HH:MM:SS.XXXXXX.
+    """
+
+    s, us = divmod(t, 10**6)
+    m, s = divmod(s, 60)
+    h, m = divmod(m, 60)
+    return '%02i:%02i:%02i.%06i' % (h, m, s, us)
+
+def generate_orders(template, num_orders, seed=SEED, cancel_ratio=0.1,
+                    modify_ratio=0.1, depth=20, hidden_share=0.1,
+                    market_share=0.01, marketable_share=0.05, sweep_levels=1,
+                    drift=0.01):
+    """
+    Generate synthetic order flow in the input file format.
+
+    Parameters
+    ----------
+    template : dict
+        Shape of the order flow, as returned by `order_flow_template`.
+    num_orders : int
+        Number of orders to generate.
+    seed : int
+        Seed of the random number generator.
+    cancel_ratio : float
+        Fraction of orders that cancel a previously added limit order.
+    modify_ratio : float
+        Fraction of orders that modify the price or volume of a previously
+        added limit order.
+    depth : int
+        Number of ticks on either side of the mid price across which the
+        prices of passive limit orders are spread.
+    hidden_share : float
+        Fraction of added orders with explicitly disclosed (i.e., hidden)
+        volume.
+    market_share : float
+        Fraction of added orders that are market orders.
+    marketable_share : float
+        Fraction of added orders that are limit orders priced through the
+        mid price.
+    sweep_levels : int
+        Maximum number of ticks through the mid price of marketable limit
+        orders; their volumes are scaled by the number of ticks so that they
+        sweep several levels of the opposite side of the book.
+    drift : float
+        Probability that the mid price moves by one tick after each order.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Orders with columns named as in `_lob.col_names`. Cancel and modify
+        requests refer to previously added limit orders that may already have
+        been filled.
+
+    """
+
+    rng = np.random.RandomState(seed)
+    lot_size = template['lot_size']
+    lots = np.array([int(k) for k in template['lots']])
+    counts = np.array(template['lots'].values(), dtype=float)
+    tick_size = template['tick_size']
+
+    # Keep all orders within the trading day of the template:
+    interarrival_time = min(template['interarrival_time'],
+                            float(US_PER_DAY-template['start_time'])/(num_orders+1))
+    t = template['start_time']+np.cumsum(
+        rng.exponential(interarrival_time, num_orders)).astype(np.int64)
+
+    u = rng.random_sample(num_orders)
+    kind = rng.random_sample(num_orders)
+    side = rng.random_sample(num_orders) < 0.5
+    offset = rng.randint(1, depth+1, num_orders)
+    sweep = rng.randint(1, sweep_levels+1, num_orders)
+    size = rng.choice(lots, num_orders, p=counts/counts.sum())
+    hidden = rng.random_sample(num_orders) < hidden_share
+    move = rng.random_sample(num_orders)
+    pick = rng.random_sample(num_orders)
+
+    # Limit orders that may be referred to by cancel and modify requests;
+    # removing an order swaps the last order into its place:
+    live = []
+    live_orders = {}
+
+    rows = dict((k, []) for k in ['order_number', 'trans_time',
+                                  'buy_sell_indicator', 'activity_type',
+                                  'volume_disclosed', 'volume_original',
+                                  'limit_price', 'mkt_flag'])
+    def append(order_number, indicator, activity_type, volume_disclosed,
+               volume_original, tick, mkt_flag):
+        rows['order_number'].append(order_number)
+        rows['buy_sell_indicator'].append(indicator)
+        rows['activity_type'].append(activity_type)
+        rows['volume_disclosed'].append(volume_disclosed)
+        rows['volume_original'].append(volume_original)
+        rows['limit_price'].append(round(tick*tick_size, 2))
+        rows['mkt_flag'].append(mkt_flag)
+
+    mid = template['price']
+    order_number = template['order_number']
+    for i in xrange(num_orders):
+        if live and u[i] < cancel_ratio+modify_ratio:
+            j = int(pick[i]*len(live))
+            n = live[j]
+            indicator, tick, volume_disclosed, volume_original = live_orders[n]
+            if u[i] < cancel_ratio:
+                live[j] = live[-1]
+                live.pop()
+                del live_orders[n]
+                append(n, indicator, 3, volume_disclosed, volume_original,
+                       tick, 'N')
+            else:
+
+                # Move the order by a tick or change its volume:
+                if kind[i] < 0.5:
+                    tick += 1 if side[i] else -1
+                else:
+                    volume_original = lot_size*size[i]
+                    if volume_disclosed:
+                        volume_disclosed = min(volume_disclosed, volume_original)
+                live_orders[n] = (indicator, tick, volume_disclosed,
+                                  volume_original)
+                append(n, indicator, 4, volume_disclosed, volume_original,
+                       tick, 'N')
+        else:
+            order_number += 1
+            indicator = 'B' if side[i] else 'S'
+            sign = 1 if side[i] else -1
+            volume_original = lot_size*size[i]
+            volume_disclosed = lot_size if hidden[i] else 0
+            if kind[i] < market_share:
+                append(order_number, indicator, 1, volume_disclosed,
+                       volume_original, 0, 'Y')
+            else:
+                if kind[i] < market_share+marketable_share:
+                    tick = mid+sign*sweep[i]
+                    volume_original *= sweep[i]
+                else:
+                    tick = mid-sign*offset[i]
+                live_orders[order_number] = (indicator, tick, volume_disclosed,
+                                             volume_original)
+                live.append(order_number)
+                append(order_number, indicator, 1, volume_disclosed,
+                       volume_original, tick, 'N')
+        if move[i] < drift:
+            mid += 1 if move[i] < drift/2 else -1
+
+    rows['trans_time'] = [format_time(x) for x in t]
+    df = pandas.DataFrame(rows)
+    for k, v in template['constant'].iteritems():
+        df[k] = v
+    df['trans_date'] = template['trans_date']
+    df['io_flag'] = 'N'
+    return df[_lob.col_names]
+
+def replicate(df, n):
+    """
+    Concatenate copies of order data with distinct order numbers.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Order data.
+    n : int
+        Number of copies.
+
+    Returns
+    -------
+    result : pandas.DataFrame
+        Replicated order data; the order numbers in each copy are offset so
+        that they do not collide with those in the other copies.
+
+    """
+
+    span = df['order_number'].max()-df['order_number'].min()+1
+    copies = []
+    for i in xrange(n):
+        c = df.copy()
+        c['order_number'] += i*span
+        copies.append(c)
+    return pandas.concat(copies, ignore_index=True)
+
+def create_lob(instrument=False):
+    """
+    Instantiate a book that does not write any output.
+    """
+
+    return _lob.LimitOrderBook(show_output=False, sparse_events=True,
+                               events_log_file=None,
+                               stats_log_file=None,
+                               daily_stats_log_file=None,
+                               instrument=instrument)
+
+def resident_memory():
+    """
+    Return the resident memory size of the current process in kilobytes.
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')//1024
+    except (IOError, OSError, ValueError):
+        return None
+
+def release_memory():
+    """
+    Collect garbage and return the free memory of the heap to the system if
+    the C library supports it.
+    """
+
+    gc.collect()
+    try:
+        ctypes.CDLL(ctypes.util.find_library('c')).malloc_trim(0)
+    except (OSError, AttributeError, TypeError):
+        pass
+
+def operation_names(columns):
+    """
+    Return the name of the operation performed by each order.
+    """
+
+    names = np.array(['other']*len(columns['activity_type']), dtype=object)
+    names[columns['activity_type'] == 1] = 'add'
+    names[(columns['activity_type'] == 1) & \
+          (columns['mkt_flag'] == ord('Y'))] = 'market'
+    names[columns['activity_type'] == 3] = 'cancel'
+    names[columns['activity_type'] == 4] = 'modify'
+    return names
+
+def measure_throughput(columns, num_runs=NUM_RUNS):
+    """
+    Return the times taken by new books to process a batch of orders.
+    """
+
+    times = []
+    for i in xrange(num_runs):
+        lob = create_lob()
+        start = _lob.monotonic()
+        lob.process_columns(**columns)
+        times.append(_lob.monotonic()-start)
+        lob.close()
+    return times
+
+def measure_latency(columns):
+    """
+    Return the time in microseconds taken by a book to process each order.
+
+    Notes
+    -----
+    Every order is passed to `LimitOrderBook.process_columns` on its own and
+    timed by the monotonic clock of the book's counters around the dispatch
+    of the order (including the recording of its events and the release of
+    any stop loss orders it triggers), so the latencies do not include the
+    overhead of slicing the columns or of calling that method.
+
+    """
+
+    N = len(columns['order_number'])
+    latency = np.empty(N)
+    lob = create_lob(instrument=True)
+    counters = lob.counters
+    for i in xrange(N):
+        order = dict((k, v[i:i+1]) for k, v in columns.iteritems())
+        start = counters.order_time
+        lob.process_columns(**order)
+        latency[i] = counters.order_time-start
+    lob.close()
+    return latency*1e6
+
+def latency_stats(latency):
+    """
+    Summarize latencies in microseconds.
+    """
+
+    result = dict(count=len(latency))
+    if len(latency):
+        result['mean'] = float(np.mean(latency))
+        result['max'] = float(np.max(latency))
+        for p, v in zip(PERCENTILES, np.percentile(latency, PERCENTILES)):
+            result['p%s' % p] = float(v)
+    return result
+
+def run_scenario(args):
+    """
+    Benchmark a book on a single scenario.
+
+    Parameters
+    ----------
+    args : tuple
+        Scenario name, generator parameters (or the name of an input file and
+        a number of copies), template, number of orders, seed, number of
+        throughput runs, and directory in which to write the generated orders
+        (or None).
+
+    Returns
+    -------
+    result : dict
+        Scenario parameters, number of orders, best throughput in orders/s,
+        run times, latency stats of each operation, and memory usage in
+        kilobytes.
+
+    Notes
+    -----
+    This function should be run in a separate process so that the peak
+    memory usage it reports only pertains to the scenario.
+
+    """
+
+    name, params, template, num_orders, seed, num_runs, orders_dir = args
+    if 'file_name' in params:
+        df = replicate(read_orders(params['file_name']), params['copies'])
+    else:
+        df = generate_orders(template, num_orders, seed, **params)
+    if orders_dir:
+        df.to_csv(os.path.join(orders_dir, name+'-orders.csv'),
+                  header=False, index=False, float_format='%.2f')
+    columns = _lob.frame_to_columns(df, template['tick_size'])
+    del df
+
+    # Memory retained by a book after processing all orders; this is measured
+    # before any other book is created and after the memory freed by the
+    # generator is returned to the system, so that the book cannot reuse
+    # memory that is already resident:
+    release_memory()
+    rss = resident_memory()
+    lob = create_lob()
+    lob.process_columns(**columns)
+    book_rss = resident_memory()
+    lob.close()
+    del lob
+
+    times = measure_throughput(columns, num_runs)
+
+    # Peak memory usage of the process:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latency = measure_latency(columns)
+    names = operation_names(columns)
+    N = len(latency)
+    return dict(params=params,
+                num_orders=N,
+                orders_per_sec=N/min(times),
+                run_times=times,
+                latency_us=dict([('all', latency_stats(latency))]+
+                                [(op, latency_stats(latency[names == op]))
+                                 for op in np.unique(names)]),
+                memory_kb=dict(book=None if rss is None else book_rss-rss,
+                               peak=peak_rss))
+
+def version_info():
+    """
+    Return information identifying the benchmarked code and platform.
+    """
+
+    try:
+        rev = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)),
+                                      stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    return dict(git_revision=rev,
+                python=platform.python_version(),
+                numpy=np.__version__,
+                platform=platform.platform(),
+                processor=platform.processor())
+
+def run(scenarios, template, num_orders=NUM_ORDERS, seed=SEED,
+        num_runs=NUM_RUNS, orders_dir=None):
+    """
+    Benchmark a book on several scenarios.
+
+    Parameters
+    ----------
+    scenarios : dict
+        Maps scenario names to generator parameters; the parameters of a
+        replicated input file comprise its name and number of copies.
+    template : dict
+        Shape of the generated order flow.
+    num_orders : int
+        Number of orders generated for each scenario.
+    seed : int
+        Seed of the order flow generator.
+    num_runs : int
+        Number of timed throughput runs of each scenario.
+    orders_dir : str
+        Directory in which to write the generated orders of each scenario.
+        If set to None, the orders are not written.
+
+    Returns
+    -------
+    results : dict
+        Version information, run parameters, and results of each scenario.
+
+    """
+
+    results = dict(version=version_info(),
+                   created=datetime.datetime.now().isoformat(),
+                   num_orders=num_orders,
+                   seed=seed,
+                   num_runs=num_runs,
+                   template=template,
+                   scenarios={})
+    for name in sorted(scenarios):
+
+        # Each scenario is run in a new process:
+        pool = multiprocessing.Pool(1)
+        try:
+            results['scenarios'][name] = \
+                pool.apply(run_scenario, ((name, scenarios[name], template,
+                                           num_orders, seed, num_runs,
+                                           orders_dir),))
+        finally:
+            pool.terminate()
+        print_result(name, results['scenarios'][name])
+    return results
+
+def print_result(name, result):
+    """
+    Display the results of a scenario.
+    """
+
+    print '--------------------------------------------'
+    print 'Scenario:                     ', name
+    print 'Number of orders:             ', result['num_orders']
+    print 'Throughput (orders/s):        ', '%.0f' % result['orders_per_sec']
+    for op in sorted(result['latency_us']):
+        s = result['latency_us'][op]
+        if s['count']:
+            print '%-30s' % ('Latency of %s (us):' % op), \
+                ' '.join('p%s=%.2f' % (p, s['p%s' % p]) for p in PERCENTILES), \
+                'max=%.2f' % s['max']
+    print 'Book memory (kB):             ', result['memory_kb']['book']
+    print 'Peak memory (kB):             ', result['memory_kb']['peak']
+
+def compare(old, new):
+    """
+    Display the relative change in throughput and median and tail latency of
+    the scenarios in two sets of results.
+    """
+
+    print '--------------------------------------------'
+    print 'Comparison with revision %s:' % old['version']['git_revision']
+    for name in sorted(set(old['scenarios']) & set(new['scenarios'])):
+        o = old['scenarios'][name]
+        n = new['scenarios'][name]
+        print '%-30s' % (name+':'), \
+            'throughput x%.2f,' % (n['orders_per_sec']/o['orders_per_sec']), \
+            'p50 latency x%.2f,' % (n['latency_us']['all']['p50']/o['latency_us']['all']['p50']), \
+            'p99 latency x%.2f' % (n['latency_us']['all']['p99']/o['latency_us']['all']['p99'])
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 's:n:r:t:S:o:c:w:h')
+    except getopt.GetoptError:
+        opts, args = [('-h', '')], []
+    opts = dict((k, [v for o, v in opts if o == k]) for k, _ in opts)
+    if '-h' in opts or len(args) > 2:
+        print usage % (sys.argv[0], NUM_ORDERS, NUM_RUNS, TEMPLATE_FILE, SEED,
+                       RESULTS_FILE, ', '.join(sorted(SCENARIOS)), NUM_COPIES)
+        sys.exit(0)
+
+    scenarios = dict(SCENARIOS)
+    if '-s' in opts:
+        scenarios = dict((k, scenarios[k]) for k in opts['-s'])
+    if args:
+        scenarios['replicated'] = \
+            dict(file_name=args[0],
+                 copies=int(args[1]) if len(args) > 1 else NUM_COPIES)
+    template = order_flow_template(opts.get('-t', [TEMPLATE_FILE])[-1])
+    results = run(scenarios, template,
+                  num_orders=int(opts.get('-n', [NUM_ORDERS])[-1]),
+                  seed=int(opts.get('-S', [SEED])[-1]),
+                  num_runs=int(opts.get('-r', [NUM_RUNS])[-1]),
+                  orders_dir=opts.get('-w', [None])[-1])
+
+    results_file = opts.get('-o', [RESULTS_FILE])[-1]
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    print 'Results written to %s' % results_file
+    if '-c' in opts:
+        with open(opts['-c'][-1]) as f:
+            compare(json.load(f), results)
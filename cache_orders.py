@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+
+"""
+Convert order files into binary cache files for faster replay.
+"""
+
+# Copyright (c) 2012-2014, Lev Givon
+# All rights reserved.
+# Distributed under the terms of the BSD license:
+# http://www.opensource.org/licenses/bsd-license
+
+import _lob
+
+import sys
+import time
+
+usage = \
+"""
+Usage: %s <input file names>
+""" % sys.argv[0]
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print usage
+        sys.exit(0)
+
+    for file_name in sys.argv[1:]:
+        start = time.time()
+        reader = _lob.CachedOrderReader(file_name)
+        index = reader.update()
+        print '%s: %i orders (%.2f s)' % (reader.cache_file_name,
+                                          index['count'], time.time()-start)
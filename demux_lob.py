@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+Limit order book simulation of all securities and expiry dates in combined
+order files for Indian security exchange.
+"""
+
+# Copyright (c) 2012-2014, Lev Givon
+# All rights reserved.
+# Distributed under the terms of the BSD license:
+# http://www.opensource.org/licenses/bsd-license
+
+import _lob
+
+import logging
+import resource
+import sys
+import time
+
+usage = \
+"""
+Usage: %s <output directory> <input file names> [-s <firm name> ...]
+
+Orders with different symbols and expiry dates are processed by separate
+books; if firm names are specified, only their orders are processed.
+""" % sys.argv[0]
+
+# Number of orders read from the input files and processed at a time:
+BATCH_SIZE = 65536
+
+# Write events in binary form as NumPy .npy files rather than in CSV form:
+BINARY_EVENTS = False
+
+def raise_file_limit():
+    """
+    Raise the maximum number of open files to the hard limit.
+
+    Notes
+    -----
+    Every book keeps its log files open, so processing many securities may
+    exceed the default limit.
+    """
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    symbols = None
+    if '-s' in args:
+        symbols = args[args.index('-s')+1:]
+        args = args[:args.index('-s')]
+    if len(args) < 2:
+        print usage
+        sys.exit(0)
+    output_dir = args[0]
+    file_name_list = sorted(args[1:])
+
+    start = time.time()
+
+    format = '%(asctime)s %(name)s %(levelname)s [%(funcName)s] %(message)s'
+    logging.basicConfig(level=logging.WARNING, format=format)
+    raise_file_limit()
+
+    manager = _lob.BookManager(output_dir, binary_events=BINARY_EVENTS,
+                               symbols=symbols, sparse_events=True)
+
+    # Each input file is read once; its orders are routed to the books of
+    # their respective symbols and expiry dates:
+    num_orders = 0
+    for file_name in file_name_list:
+        for columns in _lob.OrderReader(file_name, BATCH_SIZE,
+                                        manager.tick_size, symbols=True):
+            num_orders += len(columns['timestamp'])
+            manager.process_columns(**columns)
+    manager.record_daily_stats()
+    manager.close()
+
+    for symbol, expiry_date in sorted(manager.books):
+        print '%-12s %s' % (symbol.strip(), expiry_date)
+    print 'Number of books:              ', len(manager.books)
+    print 'Number of orders:             ', num_orders
+    print 'Processing time:              ', (time.time()-start)
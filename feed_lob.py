@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+
+"""
+Limit order book simulation driven by a live order feed.
+"""
+
+# Copyright (c) 2012-2014, Lev Givon
+# All rights reserved.
+# Distributed under the terms of the BSD license:
+# http://www.opensource.org/licenses/bsd-license
+
+import _lob
+import lob
+
+import getopt
+import logging
+import os
+import Queue
+import socket
+import struct
+import sys
+import threading
+import time
+
+usage = \
+"""
+Usage: %s [-f line|length] [-p <publish address>] [-m <shared book file>] <firm name> <output directory> <feed address>
+
+Orders in the input file format are read from the feed (either HOST:PORT or
+the path of a Unix socket) as newline-terminated lines or as messages preceded
+by their 4-byte big-endian lengths and are processed in micro-batches. If a
+publish address is specified, the top of the book is sent after every batch
+to all clients connected to it. If a shared book file is specified (e.g., a
+file in /dev/shm), the top levels and daily stats of the book are published in
+it for local readers (see _lob.SharedBookReader).
+""" % sys.argv[0]
+
+# Framing of the messages in the feed ('line' or 'length'):
+FRAMING = 'line'
+
+# Maximum number of orders processed at a time; all messages received while
+# the previous batch was processed are processed together up to this limit:
+MAX_BATCH_SIZE = 4096
+
+# Number of bytes read from the feed at a time:
+RECV_SIZE = 65536
+
+# Number of levels on each side of the book published in the shared book file:
+SHARED_BOOK_LEVELS = 10
+
+def parse_address(address):
+    """
+    Return the socket family and address of a HOST:PORT or Unix socket address.
+    """
+
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and os.sep not in address:
+        return socket.AF_INET, (host or 'localhost', int(port))
+    return socket.AF_UNIX, address
+
+def connect(address):
+    """
+    Connect to a HOST:PORT or Unix socket address.
+    """
+
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(addr)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def listen(address):
+    """
+    Listen on a HOST:PORT or Unix socket address.
+    """
+
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    elif os.path.exists(addr):
+        os.remove(addr)
+    sock.bind(addr)
+    sock.listen(5)
+    return sock
+
+def accept(sock):
+    """
+    Accept a connection on a listening socket.
+    """
+
+    conn = sock.accept()[0]
+    if conn.family == socket.AF_INET:
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return conn
+
+def frame(message, framing=FRAMING):
+    """
+    Frame a single order message (a line without its newline) for sending.
+    """
+
+    if framing == 'length':
+        return struct.pack('>I', len(message))+message
+    return message+'\n'
+
+class MessageBuffer(object):
+    """
+    Split a stream of received data into order messages.
+
+    Parameters
+    ----------
+    framing : str
+        'line' if the messages are terminated by newlines, 'length' if each
+        message is preceded by its length as a 4-byte big-endian integer.
+
+    """
+
+    def __init__(self, framing=FRAMING):
+        if framing not in ('line', 'length'):
+            raise ValueError('unrecognized framing: %s' % framing)
+        self.framing = framing
+        self._rest = ''
+
+    def feed(self, data):
+        """
+        Append received data to the buffer.
+
+        Returns
+        -------
+        block : str
+            Newline-terminated lines containing all of the complete messages
+            in the buffer.
+        count : int
+            Number of messages in the block.
+
+        """
+
+        data = self._rest+data
+        if self.framing == 'line':
+            end = data.rfind('\n')+1
+            self._rest = data[end:]
+            return data[:end], data.count('\n', 0, end)
+        messages = []
+        pos = 0
+        while len(data)-pos >= 4:
+            n, = struct.unpack_from('>I', data, pos)
+            if len(data)-pos-4 < n:
+                break
+            messages.append(data[pos+4:pos+4+n].rstrip('\r\n'))
+            pos += 4+n
+        self._rest = data[pos:]
+        if not messages:
+            return '', 0
+        return '\n'.join(messages)+'\n', len(messages)
+
+class Publisher(object):
+    """
+    Send lines of text to all clients connected to a listening socket.
+
+    Parameters
+    ----------
+    address : str
+        HOST:PORT or Unix socket address on which to listen.
+
+    Notes
+    -----
+    Clients are accepted and lines are sent by separate threads so that
+    publishing never blocks the caller; clients whose connections fail are
+    dropped.
+
+    """
+
+    def __init__(self, address):
+        self._sock = listen(address)
+        self._clients = []
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._closed = False
+        self._accept_thread = threading.Thread(target=self._accept,
+                                               name='lob-accept')
+        self._accept_thread.daemon = True
+        self._accept_thread.start()
+        self._send_thread = threading.Thread(target=self._send,
+                                             name='lob-publish')
+        self._send_thread.daemon = True
+        self._send_thread.start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn = accept(self._sock)
+            except socket.error:
+                break
+            with self._lock:
+                self._clients.append(conn)
+
+    def _send(self):
+        while True:
+            lines = [self._queue.get()]
+
+            # Send all pending lines at once:
+            while lines[-1] is not None:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except Queue.Empty:
+                    break
+            done = lines[-1] is None
+            data = ''.join(l for l in lines if l is not None)
+            with self._lock:
+                clients = list(self._clients)
+            for conn in clients:
+                try:
+                    conn.sendall(data)
+                except socket.error:
+                    with self._lock:
+                        self._clients.remove(conn)
+                    conn.close()
+            if done:
+                break
+
+    def publish(self, line):
+        """
+        Send a line to all connected clients.
+        """
+
+        self._queue.put(line)
+
+    def close(self):
+        """
+        Send all published lines and close the connections.
+        """
+
+        self._queue.put(None)
+        self._send_thread.join()
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self._sock.close()
+        with self._lock:
+            for conn in self._clients:
+                conn.close()
+            self._clients = []
+
+def format_update(num_messages, book):
+    """
+    Format the top of a book after processing a number of messages.
+
+    Returns
+    -------
+    line : str
+        Comma-separated number of messages processed, best bid price and
+        total original volume, and best ask price and total original volume;
+        the price of an empty side of the book is left blank.
+
+    """
+
+    bid_price, bid_volume = book.best_bid_data()[:2]
+    ask_price, ask_volume = book.best_ask_data()[:2]
+    return '%i,%s,%i,%s,%i\n' % (num_messages,
+                                 '' if bid_price is None else bid_price,
+                                 bid_volume,
+                                 '' if ask_price is None else ask_price,
+                                 ask_volume)
+
+def receive(sock, queue, framing=FRAMING):
+    """
+    Read messages from a socket and put blocks of them on a queue; None is put
+    on the queue when the connection is closed.
+    """
+
+    buf = MessageBuffer(framing)
+    try:
+        while True:
+            data = sock.recv(RECV_SIZE)
+            if not data:
+                break
+            block, n = buf.feed(data)
+            if n:
+                queue.put((block, n))
+    finally:
+        queue.put(None)
+
+def run(book, sock, framing=FRAMING, publisher=None,
+        max_batch_size=MAX_BATCH_SIZE):
+    """
+    Process the orders received from a feed until the feed is closed.
+
+    Parameters
+    ----------
+    book : _lob.LimitOrderBook
+        Limit order book.
+    sock : socket.socket
+        Connected feed socket.
+    framing : str
+        Framing of the messages in the feed (see `MessageBuffer`).
+    publisher : Publisher
+        Used to publish the top of the book after every batch.
+    max_batch_size : int
+        Maximum number of orders processed at a time.
+
+    Returns
+    -------
+    num_messages : int
+        Number of messages received.
+
+    Notes
+    -----
+    The feed is read by a separate thread. Whenever the book is ready for
+    more orders, all messages received since the last batch (up to
+    `max_batch_size`) are processed together, so that batches only grow when
+    the book falls behind the feed.
+
+    """
+
+    queue = Queue.Queue()
+    thread = threading.Thread(target=receive, args=(sock, queue, framing),
+                              name='lob-feed')
+    thread.daemon = True
+    thread.start()
+
+    reader = _lob.OrderReader('<feed>', max_batch_size, book.tick_size)
+    num_messages = 0
+    done = False
+    while not done:
+        item = queue.get()
+        if item is None:
+            break
+        blocks = [item[0]]
+        n = item[1]
+
+        # Take the messages that have already been received as well:
+        while n < max_batch_size:
+            try:
+                item = queue.get_nowait()
+            except Queue.Empty:
+                break
+            if item is None:
+                done = True
+                break
+            blocks.append(item[0])
+            n += item[1]
+        for columns in reader.parse(''.join(blocks)):
+            book.process_columns(**columns)
+        num_messages += n
+        if publisher is not None:
+            publisher.publish(format_update(num_messages, book))
+    thread.join()
+    return num_messages
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'f:p:m:')
+    except getopt.GetoptError as e:
+        print e
+        print usage
+        sys.exit(1)
+    opts = dict(opts)
+    if len(args) < 3:
+        print usage
+        sys.exit(0)
+    firm_name, output_dir, feed_address = args[:3]
+    framing = opts.get('-f', FRAMING)
+
+    format = '%(asctime)s %(name)s %(levelname)s [%(funcName)s] %(message)s'
+    logging.basicConfig(level=logging.WARNING, format=format)
+
+    if lob.BINARY_EVENTS:
+        events_log_file = os.path.join(output_dir, 'events-' + firm_name + '.npy')
+    else:
+        events_log_file = os.path.join(output_dir, 'events-' + firm_name + '.log')
+    daily_stats_log_file = os.path.join(output_dir, 'daily_stats-' + firm_name + '.log')
+    shared_book = None
+    if '-m' in opts:
+        shared_book = _lob.SharedBook(opts['-m'], SHARED_BOOK_LEVELS)
+    book = lob.create_lob(events_log_file, daily_stats_log_file,
+                          shared_book=shared_book)
+
+    # Start publishing before connecting so that clients may subscribe as soon
+    # as the feed starts:
+    publisher = None
+    if '-p' in opts:
+        publisher = Publisher(opts['-p'])
+    sock = connect(feed_address)
+    start = time.time()
+    try:
+        num_messages = run(book, sock, framing, publisher)
+    finally:
+        sock.close()
+        if publisher is not None:
+            publisher.close()
+    book.record_daily_stats(book.day)
+    book.close()
+
+    _lob.print_daily_stats(book.daily_stats)
+    print 'Number of messages:           ', num_messages
+    print 'Processing time:              ', (time.time()-start)
@@ -0,0 +1,56 @@
+"""
+Securities whose orders are processed by the cluster and local batch runners.
+"""
+
+# List of the 50 firms with the highest average daily volume of trade:
+firm_name_list = ['TATAPOWER',
+                  'IFCI',
+                  'SUZLON',
+                  'RCOM',
+                  'JPASSOCIAT',
+                  'UNITECH',
+                  'HDIL',
+                  'GVKPIL',
+                  'LITL',
+                  'RENUKA',
+                  'TATAMOTORS',
+                  'DLF',
+                  'GMRINFRA',
+                  'ALOKTEXT',
+                  'HINDALCO',
+                  'IVRCLINFRA',
+                  'STER',
+                  'IDFC',
+                  'BHEL',
+                  'NIFTY',
+                  'MTNL',
+                  'RPOWER',
+                  'NHPC',
+                  'PANTALOONR',
+                  'IBREALEST',
+                  'APOLLOTYRE',
+                  'TATASTEEL',
+                  'PUNJLLOYD',
+                  'BHARTIARTL',
+                  'SAIL',
+                  'DENABANK',
+                  'JISLJALEQS',
+                  'ITC',
+                  'SINTEX',
+                  'ASHOKLEY',
+                  'DISHTV',
+                  'PFC',
+                  'JSWENERGY',
+                  'CAIRN',
+                  'SESAGOA',
+                  'KTKBANK',
+                  'RELCAPITAL',
+                  'IRB',
+                  'N',
+                  'RELIANCE',
+                  'ICICIBANK',
+                  'JINDALSTEL',
+                  'IDBI',
+                  'YESBANK',
+                  'AUROPHARMA',
+                  'TATAPOWER']
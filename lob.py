@@ -11,30 +11,714 @@ Limit order book simulation for Indian security exchange.
 
 import _lob
 
-import gzip
+import getopt
+import glob
+import json
 import logging
+import multiprocessing
+import numpy as np
 import os
-import pandas
+import shutil
 import sys
+import tempfile
 import time
 
 usage = \
 """
-Usage: %s <firm name> <output directory> <input file names>
+Usage: %s [--start <time>] [--end <time>] <firm name> <output directory> <input file names>
+
+If a start or end time (either HH:MM:SS[.XXXXXX] on the first day of the input
+files or 'MM/DD/YYYY HH:MM:SS[.XXXXXX]') is specified, only the events in the
+specified time window are written.
 """ % sys.argv[0]
 
+# Number of orders read from the input files and processed at a time:
+BATCH_SIZE = 65536
+
+# Replay the input files from binary cache files (which are created or
+# updated as needed) rather than parsing them on every run:
+USE_CACHE = True
+
+# Write events in binary form as a NumPy .npy file rather than in CSV form:
+BINARY_EVENTS = False
+
+# Write a record of every match between an arriving and a resting order to
+# fills-<firm>.npy in the output directory (except when replaying time windows):
+FILLS = False
+
+# Number of processes used to replay input files containing different
+# trading days in parallel; if set to 1, all files are replayed serially:
+NUM_PROCESSES = multiprocessing.cpu_count()
+
+# Save a checkpoint of the book in the output directory after every
+# CHECKPOINT_INTERVAL orders (if nonzero) and before the first order at or
+# after CHECKPOINT_TIME (a time of day such as '12:00:00', if set) of every day;
+# the input files are replayed serially when checkpoints are saved:
+CHECKPOINT_INTERVAL = 0
+CHECKPOINT_TIME = None
+
+# Resume processing from the checkpoint in the output directory if one exists:
+RESUME = False
+
+# Number of seconds of trading time between the book snapshots saved in the
+# output directory when all orders are replayed; replays of time windows start
+# from the latest snapshot preceding the window. If zero, no snapshots are
+# saved:
+SNAPSHOT_INTERVAL = 0
+
+# Number of levels on each side of the book recorded in the depth snapshots
+# saved in the output directory every DEPTH_INTERVAL seconds; if zero, no depth
+# snapshots are saved. The input files are replayed serially when depth
+# snapshots are saved:
+DEPTH_LEVELS = 0
+DEPTH_INTERVAL = 0.1
+
+# Count the orders, matches, levels, and events processed by the book and time
+# the phases of processing; the counters are written to counters-<firm>.json in
+# the output directory:
+INSTRUMENT = False
+
+# Suppress log generation when not in debug mode:
+DEBUG = False
+
+# Number of microseconds in a day:
+US_PER_DAY = 86400*10**6
+
+def create_lob(events_log_file, daily_stats_log_file, append=False,
+               depth_log_file=None, shared_book=None, fills_log_file=None):
+    """
+    Instantiate the simulation.
+    """
+
+    if depth_log_file is not None:
+        depth_log_file = _lob.DepthRecorder(depth_log_file, DEPTH_LEVELS,
+                                            DEPTH_INTERVAL)
+    return _lob.LimitOrderBook(show_output=False, sparse_events=True,
+                               events_log_file=events_log_file,
+                               stats_log_file=None,
+                               daily_stats_log_file=daily_stats_log_file,
+                               trace=DEBUG,
+                               async_output=True,
+                               append=append,
+                               depth_log_file=depth_log_file,
+                               instrument=INSTRUMENT,
+                               shared_book=shared_book,
+                               fills_log_file=fills_log_file)
+
+def slice_columns(columns, start, stop):
+    """
+    Return the specified range of rows of a batch of order columns.
+    """
+
+    return dict((k, v[start:stop]) for k, v in columns.iteritems())
+
+def timed_batches(reader, counters):
+    """
+    Iterate over the batches of orders read by a reader and accumulate the time
+    spent reading them in the ingest timer of a book's counters.
+    """
+
+    batches = iter(reader)
+    while True:
+        start = _lob.monotonic()
+        try:
+            columns = next(batches)
+        except StopIteration:
+            return
+        counters.ingest_time += _lob.monotonic()-start
+        yield columns
+
+class Checkpointer(object):
+    """
+    Save checkpoints of a limit order book during a replay.
+
+    Parameters
+    ----------
+    lob : _lob.LimitOrderBook
+        Limit order book.
+    file_name : str
+        Name of checkpoint file; each checkpoint replaces the previous one.
+    file_name_list : list of str
+        Input file names.
+    log_file_names : list of str
+        Names of the log files written by the book; their sizes are stored
+        with each checkpoint so that they may be truncated when resuming.
+    interval : int
+        Number of orders between checkpoints. If zero, checkpoints are not
+        saved periodically.
+    time_of_day : str
+        Time of day (HH:MM:SS) before the first order at or after which a
+        checkpoint is saved every day. If set to None, checkpoints are not
+        saved at a fixed time of day.
+
+    """
+
+    def __init__(self, lob, file_name, file_name_list, log_file_names,
+                 interval=0, time_of_day=None):
+        self.lob = lob
+        self.file_name = file_name
+        self.file_name_list = file_name_list
+        self.log_file_names = log_file_names
+        self.interval = interval
+        if time_of_day is None:
+            self.time_of_day = None
+        else:
+            self.time_of_day = \
+                _lob.parse_timestamp('01/01/1970', time_of_day)
+        self.num_orders = 0
+        self.last_day = None
+
+    def split_points(self, timestamp):
+        """
+        Return the indices of the orders in a batch before which checkpoints
+        should be saved; an index equal to the size of the batch denotes a
+        checkpoint after the last order.
+        """
+
+        n = len(timestamp)
+        points = set()
+        if self.interval:
+            first = -self.num_orders % self.interval or self.interval
+            points.update(xrange(first, n+1, self.interval))
+        if self.time_of_day is not None and n:
+            day = timestamp//US_PER_DAY
+            i = np.flatnonzero(timestamp-day*US_PER_DAY >= self.time_of_day)
+            for d in np.unique(day[i]):
+                if d != self.last_day:
+                    points.add(i[np.searchsorted(day[i], d)])
+                    self.last_day = d
+        self.num_orders += n
+        return sorted(points)
+
+    def save(self, position, timestamp=None):
+        """
+        Save a checkpoint.
+
+        Parameters
+        ----------
+        position : tuple
+            Index of the input file and number of orders in that file that
+            have been processed.
+        timestamp : int
+            Timestamp of the next order to process, or None if it is not in
+            the current batch.
+
+        """
+
+        # Make sure that the logs contain all events processed so far:
+        self.lob.flush()
+        logs = [(f, os.path.getsize(f)) for f in self.log_file_names]
+        self.lob.save_checkpoint(self.file_name,
+                                 dict(position=position, logs=logs,
+                                      file_name_list=self.file_name_list))
+
+class SnapshotIndex(Checkpointer):
+    """
+    Snapshots of a limit order book saved at regular intervals of trading time.
+
+    Parameters
+    ----------
+    lob : _lob.LimitOrderBook
+        Limit order book; may be None if the index is only searched.
+    dir_name : str
+        Directory in which the snapshots are stored.
+    file_name_list : list of str
+        Input file names.
+    period : float
+        Number of seconds between snapshots.
+
+    Notes
+    -----
+    A snapshot is saved before the first order of every day and before the
+    first order at or after every multiple of `period` seconds since midnight.
+    Each snapshot is named after the timestamp of the next order to process and
+    records the position of that order in the input files, so a replay may
+    start at any time by restoring the latest preceding snapshot and only
+    processing the orders after it.
+
+    """
+
+    def __init__(self, lob, dir_name, file_name_list, period=0):
+        Checkpointer.__init__(self, lob, None, file_name_list, [])
+        self.dir_name = dir_name
+        self.period = int(period*1e6)
+        self.last_bucket = None
+
+    def clear(self):
+        """
+        Remove all snapshots.
+        """
+
+        if os.path.isdir(self.dir_name):
+            shutil.rmtree(self.dir_name)
+        os.makedirs(self.dir_name)
+
+    def split_points(self, timestamp):
+        n = len(timestamp)
+        if n == 0:
+            return []
+
+        # Number the periods of each day consecutively:
+        day = timestamp//US_PER_DAY
+        bucket = day*(US_PER_DAY//self.period+1)+ \
+                 (timestamp-day*US_PER_DAY)//self.period
+        points = list(np.flatnonzero(np.diff(bucket))+1)
+        if bucket[0] != self.last_bucket:
+            points.insert(0, 0)
+        self.last_bucket = bucket[-1]
+        return points
+
+    def save(self, position, timestamp=None):
+        self.lob.save_checkpoint(os.path.join(self.dir_name,
+                                              'snapshot-%i.npz' % timestamp),
+                                 dict(position=position,
+                                      file_name_list=self.file_name_list))
+
+    def find(self, timestamp):
+        """
+        Return the name of the latest snapshot saved at or before the specified
+        time, or None if there is no such snapshot or the snapshots were saved
+        for different input files.
+        """
+
+        snapshots = []
+        for file_name in glob.glob(os.path.join(self.dir_name, 'snapshot-*.npz')):
+            t = int(os.path.basename(file_name)[9:-4])
+            if t <= timestamp:
+                snapshots.append((t, file_name))
+        if not snapshots:
+            return None
+        file_name = max(snapshots)[1]
+        info = _lob.read_checkpoint(file_name)[0]['info']
+        if info['file_name_list'] != self.file_name_list:
+            return None
+        return file_name
+
+def truncate_logs(logs):
+    """
+    Truncate log files to the sizes they had when a checkpoint was saved.
+
+    Parameters
+    ----------
+    logs : list of tuple
+        Names and sizes of the log files.
+
+    Notes
+    -----
+    The logs must be truncated before a book that appends to them is created
+    so that the events processed after the checkpoint was saved are not
+    repeated.
+
+    """
+
+    for log_file_name, size in logs:
+        if os.path.getsize(log_file_name) < size:
+            raise ValueError('%s is shorter than when the checkpoint was saved' % \
+                             log_file_name)
+        with open(log_file_name, 'r+b') as f:
+            f.truncate(size)
+
+def replay(lob, file_name_list, checkpointers=(), position=(0, 0), end=None):
+    """
+    Process the orders in the specified files.
+
+    Parameters
+    ----------
+    lob : _lob.LimitOrderBook
+        Limit order book.
+    file_name_list : list of str
+        Input file names in chronological order.
+    checkpointers : list of Checkpointer
+        Used to save checkpoints or snapshots during processing.
+    position : tuple
+        Index of the input file and number of orders in that file at which
+        processing starts.
+    end : int
+        If specified, processing stops at the first order whose timestamp is
+        at or after this time.
+
+    Returns
+    -------
+    first_day, last_day : int
+        Numbers of days since the epoch of the first and last orders in the
+        files, or None if the files contain no orders.
+    num_orders : int
+        Number of orders read from the files.
+    position : tuple
+        Index of the input file and number of orders in that file at which
+        processing stopped; the orders from this position onwards have not
+        been processed.
+
+    """
+
+    first_day = last_day = None
+    num_orders = 0
+    start_index, skip = position
+    for index in xrange(start_index, len(file_name_list)):
+        file_name = file_name_list[index]
+        offset = skip if index == start_index else 0
+
+        # The readers detect compressed input files automatically and only
+        # parse the columns used by the simulation:
+        if USE_CACHE:
+            reader = _lob.CachedOrderReader(file_name, BATCH_SIZE, lob.tick_size,
+                                            start=offset)
+        else:
+            reader = _lob.OrderReader(file_name, BATCH_SIZE, lob.tick_size,
+                                      start=offset)
+        if lob.counters is not None:
+            reader = timed_batches(reader, lob.counters)
+        for columns in reader:
+            timestamp = columns['timestamp']
+            n = len(timestamp)
+            done = False
+            if end is not None:
+                i = np.flatnonzero(timestamp >= end)
+                if len(i):
+                    n = i[0]
+                    columns = slice_columns(columns, 0, n)
+                    timestamp = columns['timestamp']
+                    done = True
+
+            num_orders += n
+            if n:
+                if first_day is None:
+                    first_day = int(timestamp[0])//US_PER_DAY
+                last_day = int(timestamp[-1])//US_PER_DAY
+
+            # Split the batch where checkpoints must be saved:
+            points = {}
+            for c in checkpointers:
+                for i in c.split_points(timestamp):
+                    points.setdefault(i, []).append(c)
+            start = 0
+            for i in sorted(points):
+                if i > start:
+                    lob.process_columns(**slice_columns(columns, start, i))
+                    start = i
+                for c in points[i]:
+                    c.save((index, offset+i), timestamp[i] if i < n else None)
+            if start == 0:
+                lob.process_columns(**columns)
+            elif start < n:
+                lob.process_columns(**slice_columns(columns, start, n))
+            offset += n
+            if done:
+                return first_day, last_day, num_orders, (index, offset)
+    return first_day, last_day, num_orders, (len(file_name_list), 0)
+
+def replay_group(args):
+    """
+    Replay a group of input files with a new limit order book.
+
+    Parameters
+    ----------
+    args : tuple
+        Input file names, expiry date to which processing is restricted, and
+        names of the events, daily stats, and fills log files (the latter may
+        be None).
+
+    Returns
+    -------
+    first_day, last_day : int
+        Numbers of days since the epoch of the first and last orders in the
+        files, or None if the files contain no orders.
+    daily_stats : dict
+        Stats accumulated for the last day.
+    counters : _lob.BookCounters
+        Counters of the book, or None if instrumentation is disabled.
+
+    """
+
+    file_name_list, expiry_date, events_log_file, daily_stats_log_file, \
+        fills_log_file = args
+    lob = create_lob(events_log_file, daily_stats_log_file,
+                     fills_log_file=fills_log_file)
+    lob.expiry_date = expiry_date
+    first_day, last_day = replay(lob, file_name_list)[:2]
+    lob.record_daily_stats(lob.day)
+    lob.close()
+    return first_day, last_day, lob.daily_stats, lob.counters
+
+# Book from which the branches replayed by replay_branches() are forked; worker
+# processes created after it is set inherit it without copying or pickling:
+_branch_base = None
+
+def replay_branch(args):
+    """
+    Fork the base book, process injected orders, and continue the replay.
+
+    Parameters
+    ----------
+    args : tuple
+        List of column dicts containing the orders to inject, input file
+        names, position in the input files at which the replay continues,
+        end time (or None), and names of the events, daily stats, and fills
+        log files (the latter may be None).
+
+    Returns
+    -------
+    daily_stats : dict
+        Stats accumulated for the last day.
+    counters : _lob.BookCounters
+        Counters of the branch, or None if instrumentation is disabled.
+
+    """
+
+    columns_list, file_name_list, position, end, events_log_file, \
+        daily_stats_log_file, fills_log_file = args
+    lob = _branch_base.fork(events_log_file=events_log_file,
+                            daily_stats_log_file=daily_stats_log_file,
+                            fills_log_file=fills_log_file)
+    for columns in columns_list:
+        lob.process_columns(**columns)
+    replay(lob, file_name_list, position=position, end=end)
+    lob.record_daily_stats(lob.day)
+    lob.close()
+    return lob.daily_stats, lob.counters
+
+def replay_branches(lob, branches, file_name_list, position, output_dir,
+                    num_processes, end=None):
+    """
+    Continue a replay in several hypothetical branches in parallel.
+
+    Parameters
+    ----------
+    lob : _lob.LimitOrderBook
+        Base book whose state is shared by all branches (e.g., a book that
+        has been replayed up to a specific time with `replay`).
+    branches : dict
+        Maps the name of every branch to a list of column dicts containing
+        the orders injected into the branch before the replay continues
+        (e.g., as returned by `_lob.OrderReader.parse`); an empty list
+        continues the replay without changes.
+    file_name_list : list of str
+        Input file names in chronological order.
+    position : tuple
+        Index of the input file and number of orders in that file at which
+        the replay of every branch continues (e.g., as returned by `replay`).
+    output_dir : str
+        Directory in which the events, daily stats, and fills (if `FILLS` is
+        set) of branch B are written to events-B.log (or events-B.npy if
+        `BINARY_EVENTS` is set), daily_stats-B.log, and fills-B.npy.
+    num_processes : int
+        Number of worker processes.
+    end : int
+        If specified, the replay of every branch stops at the first order
+        whose timestamp is at or after this time.
+
+    Returns
+    -------
+    results : dict
+        Maps the name of every branch to its daily stats and counters.
+
+    Notes
+    -----
+    The worker processes are forked after the base book is set, so that they
+    share its memory with the calling process (copy-on-write) rather than
+    receiving a copy of it; each branch forks its own book from the base in
+    its worker (see `_lob.LimitOrderBook.fork`). The output of the base book
+    is flushed first and is not affected by the branches.
+
+    """
+
+    global _branch_base
+
+    lob.flush()
+    names = sorted(branches)
+    args = []
+    for name in names:
+        if BINARY_EVENTS:
+            events_log_file = os.path.join(output_dir, 'events-' + name + '.npy')
+        else:
+            events_log_file = os.path.join(output_dir, 'events-' + name + '.log')
+        if FILLS:
+            fills_log_file = os.path.join(output_dir, 'fills-' + name + '.npy')
+        else:
+            fills_log_file = None
+        args.append((branches[name], file_name_list, position, end,
+                     events_log_file,
+                     os.path.join(output_dir, 'daily_stats-' + name + '.log'),
+                     fills_log_file))
+    _branch_base = lob
+    try:
+        pool = multiprocessing.Pool(num_processes)
+        try:
+            results = pool.map(replay_branch, args)
+        finally:
+            pool.terminate()
+    finally:
+        _branch_base = None
+    return dict(zip(names, results))
+
+def first_order(file_name_list):
+    """
+    Return the columns of the first order in the specified files, or None if
+    the files contain no orders.
+    """
+
+    for file_name in file_name_list:
+        for columns in _lob.OrderReader(file_name, 1):
+            return columns
+    return None
+
+def parse_time(s, file_name_list):
+    """
+    Convert a time specified on the command line to a timestamp.
+
+    Parameters
+    ----------
+    s : str
+        Either 'MM/DD/YYYY HH:MM:SS[.XXXXXX]' or 'HH:MM:SS[.XXXXXX]'; in the
+        latter case, the date of the first order in the input files is used.
+    file_name_list : list of str
+        Input file names in chronological order.
+
+    Returns
+    -------
+    timestamp : int
+        Number of microseconds since the epoch.
+
+    """
+
+    fields = s.split()
+    if len(fields) == 2:
+        return _lob.parse_timestamp(*fields)
+    columns = first_order(file_name_list)
+    if columns is None:
+        return 0
+    return _lob.parse_timestamp(columns['trans_date'][0], s)
+
+def concatenate(file_name_list, out_file_name, sink_class=_lob.BinaryEventSink):
+    """
+    Concatenate the contents of several log files; .npy files are concatenated
+    with a sink of the specified class.
+    """
+
+    if os.path.splitext(out_file_name)[1] == '.npy':
+        sink = sink_class(out_file_name)
+        for file_name in file_name_list:
+            sink.write_records(np.load(file_name, mmap_mode='r'))
+        sink.close()
+    else:
+        with open(out_file_name, 'wb') as out:
+            for file_name in file_name_list:
+                with open(file_name, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+
+def replay_days(file_name_list, events_log_file, daily_stats_log_file,
+                num_processes, fills_log_file=None):
+    """
+    Replay input files containing different trading days in parallel.
+
+    Parameters
+    ----------
+    file_name_list : list of str
+        Input file names in chronological order.
+    events_log_file, daily_stats_log_file : str
+        Names of the events and daily stats log files.
+    num_processes : int
+        Number of worker processes.
+    fills_log_file : str
+        Name of the fills log file; if set to None, no fills are recorded.
+
+    Returns
+    -------
+    daily_stats : dict
+        Stats accumulated for the last day.
+    counters : _lob.BookCounters
+        Counters accumulated by the books of the final groups, or None if
+        instrumentation is disabled.
+
+    Notes
+    -----
+    Because the book and daily stats are reset whenever a new day begins, the
+    files may be replayed independently as long as each one begins a new day.
+    Each file is initially replayed by a separate book that writes its own
+    logs; adjacent groups of files are merged and replayed again until the
+    first order of each group falls on a different day than the last order of
+    the preceding group. The logs of the groups are then concatenated, which
+    produces the same output as a serial replay of all files.
+
+    """
+
+    # Processing is restricted to the expiry date of the first order:
+    columns = first_order(file_name_list)
+    expiry_date = '' if columns is None else columns['expiry_date'][0]
+
+    output_dir = os.path.dirname(os.path.abspath(events_log_file))
+    tmp_dir = tempfile.mkdtemp(dir=output_dir)
+    events_ext = os.path.splitext(events_log_file)[1]
+    def log_file_names(i, n):
+        return (os.path.join(tmp_dir, 'events-%i-%i%s' % (i, n, events_ext)),
+                os.path.join(tmp_dir, 'daily_stats-%i-%i.log' % (i, n)),
+                None if fills_log_file is None else \
+                os.path.join(tmp_dir, 'fills-%i-%i.npy' % (i, n)))
+
+    # Groups are represented by the indices of their first files and their
+    # numbers of files:
+    groups = [(i, 1) for i in xrange(len(file_name_list))]
+    results = {}
+    pool = multiprocessing.Pool(num_processes)
+    try:
+        while True:
+            pending = [g for g in groups if g not in results]
+            args = [(file_name_list[i:i+n], expiry_date)+log_file_names(i, n) \
+                    for i, n in pending]
+            results.update(zip(pending, pool.map(replay_group, args)))
+
+            # Merge groups that are empty or that continue the last day of
+            # the preceding group:
+            merged = []
+            for g in groups:
+                first_day, last_day = results[g][:2]
+                if merged and (prev_last_day is None or first_day is None or \
+                               first_day == prev_last_day):
+                    merged[-1] = (merged[-1][0], merged[-1][1]+g[1])
+                    if last_day is not None:
+                        prev_last_day = last_day
+                else:
+                    merged.append(g)
+                    prev_last_day = last_day
+            if merged == groups:
+                break
+            groups = merged
+
+        concatenate([log_file_names(i, n)[0] for i, n in groups],
+                    events_log_file)
+        concatenate([log_file_names(i, n)[1] for i, n in groups],
+                    daily_stats_log_file)
+        if fills_log_file is not None:
+            concatenate([log_file_names(i, n)[2] for i, n in groups],
+                        fills_log_file, _lob.FillSink)
+    finally:
+        pool.terminate()
+        shutil.rmtree(tmp_dir)
+    counters = None
+    for g in groups:
+        if results[g][3] is not None:
+            if counters is None:
+                counters = _lob.BookCounters()
+            counters.merge(results[g][3])
+    return results[groups[-1]][2], counters
+
 if __name__ == '__main__':
-    if len(sys.argv) < 4:
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], '', ['start=', 'end='])
+    except getopt.GetoptError as e:
+        print e
+        print usage
+        sys.exit(1)
+    opts = dict(opts)
+    if len(args) < 3:
         print usage
         sys.exit(0)
     else:
-        firm_name, output_dir = sys.argv[1:3]
-        file_name_list = sys.argv[3:]
-        
+        firm_name, output_dir = args[:2]
+        file_name_list = args[2:]
+
     start = time.time()
 
-    # Suppress log generation when not in debug mode:
-    DEBUG = False
     if DEBUG:
         level = logging.DEBUG
     else:
@@ -47,51 +731,108 @@ if __name__ == '__main__':
         logging.root.removeHandler(h)
 
     # Set up output files:
-    events_log_file = os.path.join(output_dir, 'events-' + firm_name + '.log')
+    if BINARY_EVENTS:
+        events_log_file = os.path.join(output_dir, 'events-' + firm_name + '.npy')
+    else:
+        events_log_file = os.path.join(output_dir, 'events-' + firm_name + '.log')
     daily_stats_log_file = os.path.join(output_dir, 'daily_stats-' + firm_name + '.log')
-    
-    # Instantiate simulation:
-    lob = _lob.LimitOrderBook(show_output=False, sparse_events=True,
-                              events_log_file=events_log_file,
-                              stats_log_file=None,
-                              daily_stats_log_file=daily_stats_log_file)
-
-    # Only create log file when in debug mode:
-    if DEBUG:
-        log_file = os.path.join(output_dir, 'lob-' + firm_name + '.log')
-        fh = logging.FileHandler(log_file, 'w')
-        fh.setFormatter(logging.Formatter(format))
-        lob.logger.addHandler(fh)
+    if FILLS:
+        fills_log_file = os.path.join(output_dir, 'fills-' + firm_name + '.npy')
+    else:
+        fills_log_file = None
 
     # Process all available files; assumes that the files are named in
     # a way such that their sort order corresponds to the
-    # chronological order of their respective contents:    
-    for file_name in sorted(file_name_list):
-
-        # Check whether input file is compressed:
-        with gzip.open(file_name, 'rb') as f:
-            try:
-                f.read(1)
-            except IOError:
-                compression = None
-            else:
-                compression = 'gzip'
-
-        tp = pandas.read_csv(file_name,
-                             names=_lob.col_names,
-                             iterator=True,
-                             compression=compression)
-        while True:
-            try:
-                data = tp.get_chunk(500)
-            except StopIteration:
-                break
-            else:
-                # Process orders that occurred before a certain cutoff time:
-                #if data.irow(0)['trans_time'] > '09:25:00.000000':
-                #    break        
-                lob.process(data)
+    # chronological order of their respective contents:
+    file_name_list = sorted(file_name_list)
 
-    lob.record_daily_stats(lob.day)
-    lob.print_daily_stats()
+    checkpoint_file = os.path.join(output_dir, 'checkpoint-' + firm_name + '.npz')
+    checkpointing = CHECKPOINT_INTERVAL or CHECKPOINT_TIME is not None
+    resuming = RESUME and os.path.exists(checkpoint_file)
+    snapshot_dir = os.path.join(output_dir, 'snapshots-' + firm_name)
+    windowed = '--start' in opts or '--end' in opts
+
+    # The detailed trace of a debug run is written to a single log file, so
+    # the files are replayed serially:
+    if NUM_PROCESSES > 1 and len(file_name_list) > 1 and not DEBUG and \
+       not checkpointing and not resuming and not SNAPSHOT_INTERVAL and \
+       not windowed and not DEPTH_LEVELS:
+        daily_stats, counters = replay_days(file_name_list, events_log_file,
+                                            daily_stats_log_file, NUM_PROCESSES,
+                                            fills_log_file)
+    elif windowed:
+
+        # Only the events within the window are written; the replay starts
+        # from the latest snapshot preceding the window if there is one:
+        window_start = window_end = None
+        if '--start' in opts:
+            window_start = parse_time(opts['--start'], file_name_list)
+        if '--end' in opts:
+            window_end = parse_time(opts['--end'], file_name_list)
+        if BINARY_EVENTS:
+            sink = _lob.BinaryEventSink(events_log_file)
+        else:
+            sink = _lob.CSVEventSink(events_log_file)
+        lob = create_lob(_lob.TimeWindowEventSink(sink, window_start,
+                                                  window_end), None)
+        position = (0, 0)
+        if window_start is not None:
+            snapshot = SnapshotIndex(None, snapshot_dir,
+                                     file_name_list).find(window_start)
+            if snapshot is not None:
+                position = tuple(lob.load_checkpoint(snapshot)['position'])
+                print 'Starting from snapshot %s' % snapshot
+        replay(lob, file_name_list, position=position, end=window_end)
+        lob.close()
+        daily_stats = lob.daily_stats
+        counters = lob.counters
+    else:
+        position = (0, 0)
+        if resuming:
+            info = _lob.read_checkpoint(checkpoint_file)[0]['info']
+            if info['file_name_list'] != file_name_list:
+                raise ValueError('input files differ from those of checkpoint')
+            truncate_logs(info['logs'])
+            position = tuple(info['position'])
+            print 'Resuming from file %i, order %i' % position
+        if DEPTH_LEVELS:
+            depth_log_file = os.path.join(output_dir, 'depth-' + firm_name + '.npz')
+        else:
+            depth_log_file = None
+        lob = create_lob(events_log_file, daily_stats_log_file, resuming,
+                         depth_log_file, fills_log_file=fills_log_file)
+        if resuming:
+            lob.load_checkpoint(checkpoint_file)
+        checkpointers = []
+        if checkpointing:
+            log_file_names = [events_log_file, daily_stats_log_file]
+            if fills_log_file is not None:
+                log_file_names.append(fills_log_file)
+            checkpointers.append(Checkpointer(lob, checkpoint_file, file_name_list,
+                                              log_file_names,
+                                              CHECKPOINT_INTERVAL, CHECKPOINT_TIME))
+        if SNAPSHOT_INTERVAL:
+            snapshot_index = SnapshotIndex(lob, snapshot_dir, file_name_list,
+                                           SNAPSHOT_INTERVAL)
+            if not resuming:
+                snapshot_index.clear()
+            checkpointers.append(snapshot_index)
+
+        # Only create log file when in debug mode:
+        if DEBUG:
+            log_file = os.path.join(output_dir, 'lob-' + firm_name + '.log')
+            fh = logging.FileHandler(log_file, 'w')
+            fh.setFormatter(logging.Formatter(format))
+            lob.logger.addHandler(fh)
+
+        replay(lob, file_name_list, checkpointers, position)
+        lob.record_daily_stats(lob.day)
+        lob.close()
+        daily_stats = lob.daily_stats
+        counters = lob.counters
+
+    _lob.print_daily_stats(daily_stats)
+    if counters is not None:
+        with open(os.path.join(output_dir, 'counters-' + firm_name + '.json'), 'w') as f:
+            json.dump(counters.as_dict(), f, indent=1, sort_keys=True)
     print 'Processing time:              ', (time.time()-start)
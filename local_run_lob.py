@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+Script to run LOB implementation for multiple securities on a single machine
+using a pool of worker processes.
+"""
+
+# Copyright (c) 2012-2014, Lev Givon
+# All rights reserved.
+# Distributed under the terms of the BSD license:
+# http://www.opensource.org/licenses/bsd-license
+
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+
+import lob
+from firms import firm_name_list
+
+usage = \
+"""
+Usage: %s <base directory> <output directory> [<firm name> ...]
+
+The order files of each firm are found in the orders_* subdirectories of the
+base directory; if no firm names are given, all firms in firms.py are processed.
+""" % sys.argv[0]
+
+# Name of the order files of each firm in the orders_* subdirectories:
+ORDER_FILE_PATTERN = '%s-orders.csv.gz'
+
+# Maximum number of worker processes:
+NUM_PROCESSES = multiprocessing.cpu_count()
+
+# Maximum virtual memory size of each worker process in bytes; fewer workers
+# than NUM_PROCESSES are started if the physical memory of the machine cannot
+# accommodate this much memory per worker:
+MEMORY_LIMIT = 2000000000
+
+# Number of times that the processing of a firm is retried after failing:
+MAX_RETRIES = 2
+
+# Name of the run manifest written to the output directory:
+MANIFEST_FILE = 'manifest.json'
+
+def find_order_files(base_dir, firm_name):
+    """
+    Return the chronologically sorted names of the order files of a firm.
+    """
+
+    return sorted(glob.glob(os.path.join(base_dir, 'orders_*',
+                                         ORDER_FILE_PATTERN % firm_name)))
+
+def physical_memory():
+    """
+    Return the size of the physical memory of the machine in bytes.
+    """
+
+    try:
+        return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def num_workers(num_jobs, num_processes=NUM_PROCESSES,
+                memory_limit=MEMORY_LIMIT):
+    """
+    Return the number of worker processes that fit into physical memory.
+    """
+
+    n = min(num_jobs, num_processes)
+    mem = physical_memory()
+    if memory_limit and mem:
+        n = min(n, mem//memory_limit)
+    return max(n, 1)
+
+def init_worker(memory_limit):
+    """
+    Restrict the virtual memory size of a worker process.
+    """
+
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+def run_firm(args):
+    """
+    Process the orders of a single firm.
+
+    Parameters
+    ----------
+    args : tuple
+        Firm name, output directory, and input file names.
+
+    Returns
+    -------
+    result : dict
+        Firm name, status (either 'done' or 'failed'), number of orders
+        processed, processing time in seconds, and error traceback (if the
+        processing failed).
+
+    """
+
+    firm_name, output_dir, file_name_list = args
+    if lob.BINARY_EVENTS:
+        events_log_file = os.path.join(output_dir, 'events-' + firm_name + '.npy')
+    else:
+        events_log_file = os.path.join(output_dir, 'events-' + firm_name + '.log')
+    daily_stats_log_file = os.path.join(output_dir, 'daily_stats-' + firm_name + '.log')
+    if lob.FILLS:
+        fills_log_file = os.path.join(output_dir, 'fills-' + firm_name + '.npy')
+    else:
+        fills_log_file = None
+
+    result = dict(firm_name=firm_name, status='failed', num_orders=0,
+                  time=0.0, error=None)
+    start = time.time()
+    try:
+        book = lob.create_lob(events_log_file, daily_stats_log_file,
+                              fills_log_file=fills_log_file)
+        try:
+            result['num_orders'] = lob.replay(book, file_name_list)[2]
+            book.record_daily_stats(book.day)
+        finally:
+            book.close()
+    except Exception:
+        result['error'] = traceback.format_exc()
+    else:
+        result['status'] = 'done'
+    result['time'] = time.time()-start
+    return result
+
+def run(base_dir, output_dir, firm_names, num_processes=NUM_PROCESSES,
+        memory_limit=MEMORY_LIMIT, max_retries=MAX_RETRIES):
+    """
+    Process the orders of several firms in parallel.
+
+    Parameters
+    ----------
+    base_dir : str
+        Directory containing orders_* subdirectories with order files.
+    output_dir : str
+        Directory in which the logs and run manifest are written.
+    firm_names : list of str
+        Names of firms to process.
+    num_processes : int
+        Maximum number of worker processes.
+    memory_limit : int
+        Maximum virtual memory size of each worker process in bytes; a firm
+        whose processing exceeds the limit fails with a MemoryError.
+    max_retries : int
+        Number of times that the processing of a failed firm is retried.
+
+    Returns
+    -------
+    manifest : dict
+        Run manifest; the entry of each firm in manifest['firms'] contains its
+        input files and their total size, number of orders processed,
+        processing time, throughput, number of attempts, and status.
+
+    Notes
+    -----
+    Firms are submitted in order of decreasing total input size so that the
+    longest jobs do not end up running by themselves at the end of the run.
+    Each firm is processed in a new worker process so that the memory used by
+    one firm is released before the next one is started.
+
+    """
+
+    jobs = {}
+    for firm_name in firm_names:
+        if firm_name in jobs:
+            continue
+        file_name_list = find_order_files(base_dir, firm_name)
+        jobs[firm_name] = dict(firm_name=firm_name,
+                               files=file_name_list,
+                               input_size=sum(map(os.path.getsize,
+                                                  file_name_list)),
+                               num_orders=0, time=0.0, orders_per_sec=None,
+                               attempts=0, status='pending', error=None)
+        if not file_name_list:
+            jobs[firm_name]['status'] = 'missing'
+
+    manifest = dict(base_dir=os.path.abspath(base_dir),
+                    output_dir=os.path.abspath(output_dir),
+                    memory_limit=memory_limit,
+                    start_time=time.strftime('%Y-%m-%d %H:%M:%S'))
+    start = time.time()
+    for attempt in xrange(max_retries+1):
+        pending = sorted([j for j in jobs.itervalues() \
+                          if j['status'] in ('pending', 'failed')],
+                         key=lambda j: j['input_size'], reverse=True)
+        if not pending:
+            break
+        n = num_workers(len(pending), num_processes, memory_limit)
+        manifest['num_processes'] = max(manifest.get('num_processes', 0), n)
+        pool = multiprocessing.Pool(n, init_worker, (memory_limit,),
+                                    maxtasksperchild=1)
+        try:
+            args = [(j['firm_name'], output_dir, j['files']) for j in pending]
+            for result in pool.imap_unordered(run_firm, args):
+                j = jobs[result['firm_name']]
+                j['attempts'] += 1
+                j['status'] = result['status']
+                j['error'] = result['error']
+                j['num_orders'] = result['num_orders']
+                j['time'] = result['time']
+                if result['time'] > 0:
+                    j['orders_per_sec'] = result['num_orders']/result['time']
+                print '%-12s %-7s %10i orders %8.2f s' % \
+                    (j['firm_name'], j['status'], j['num_orders'], j['time'])
+                sys.stdout.flush()
+        finally:
+            pool.terminate()
+
+    manifest['end_time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    manifest['time'] = time.time()-start
+    manifest['num_orders'] = sum(j['num_orders'] for j in jobs.itervalues() \
+                                 if j['status'] == 'done')
+    manifest['orders_per_sec'] = manifest['num_orders']/manifest['time']
+    manifest['firms'] = sorted(jobs.itervalues(),
+                               key=lambda j: firm_names.index(j['firm_name']))
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    return manifest
+
+def main():
+    if len(sys.argv) < 3:
+        print usage
+        sys.exit(0)
+    base_dir, output_dir = sys.argv[1:3]
+    firm_names = sys.argv[3:] or firm_name_list
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s %(name)s %(levelname)s %(message)s')
+
+    manifest = run(base_dir, output_dir, firm_names)
+    failed = [j['firm_name'] for j in manifest['firms'] \
+              if j['status'] != 'done']
+    print 'Number of orders:             ', manifest['num_orders']
+    print 'Processing time:              ', manifest['time']
+    if failed:
+        print 'Failed firms:                 ', ' '.join(failed)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+"""
+Order feed server that replays order files for testing the live simulation.
+"""
+
+# Copyright (c) 2012-2014, Lev Givon
+# All rights reserved.
+# Distributed under the terms of the BSD license:
+# http://www.opensource.org/licenses/bsd-license
+
+import _lob
+import feed_lob
+
+import getopt
+import json
+import numpy as np
+import socket
+import sys
+import threading
+import time
+
+usage = \
+"""
+Usage: %s [-s <speed>] [-f line|length] [-u <update address>] [-o <results file>] <listen address> <input file names>
+
+Waits for a connection on the listen address (either HOST:PORT or the path of
+a Unix socket) and sends the orders in the input files at their original pace
+multiplied by the speed (default 1); a speed of 0 sends the orders as fast as
+possible. If the publish address of the simulation is specified as the update
+address, the latency between sending each order and receiving the first top
+of book update that reflects it is measured and summarized.
+""" % sys.argv[0]
+
+# Latency percentiles reported:
+PERCENTILES = [50, 90, 99, 99.9]
+
+# Number of seconds to wait for the updates reflecting the last orders:
+UPDATE_TIMEOUT = 10.0
+
+def read_lines(file_name_list):
+    """
+    Return the nonblank lines of several possibly compressed order files.
+    """
+
+    for file_name in file_name_list:
+        rest = ''
+        for block in _lob.read_blocks(file_name):
+            lines = (rest+block).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                line = line.rstrip('\r')
+                if line:
+                    yield line
+        if rest.strip():
+            yield rest.rstrip('\r')
+
+def send_orders(sock, file_name_list, speed=1.0, framing=feed_lob.FRAMING,
+                send_times=None):
+    """
+    Send the orders in the specified files over a socket.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Connected socket.
+    file_name_list : list of str
+        Input file names in chronological order.
+    speed : float
+        Factor by which the original pace of the orders is multiplied; if
+        zero, the orders are sent as fast as possible.
+    framing : str
+        Framing of the messages (see `feed_lob.MessageBuffer`).
+    send_times : list
+        If specified, the monotonic clock time at which each order is sent is
+        appended to this list.
+
+    Returns
+    -------
+    num_messages : int
+        Number of orders sent.
+
+    """
+
+    num_messages = 0
+    first = None
+    for line in read_lines(file_name_list):
+        if speed > 0:
+            fields = line.split(',', 5)
+            t = _lob.parse_timestamp(fields[3], fields[4])
+            if first is None:
+                first = t, _lob.monotonic()
+            delay = first[1]+(t-first[0])/(1e6*speed)-_lob.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if send_times is not None:
+            send_times.append(_lob.monotonic())
+        sock.sendall(feed_lob.frame(line, framing))
+        num_messages += 1
+    return num_messages
+
+def receive_updates(sock, send_times, latency):
+    """
+    Read top of book updates and compute the latency of every order.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Socket connected to the publish address of the simulation.
+    send_times : list
+        Times at which the orders were sent.
+    latency : list
+        The latency of each order in seconds is appended to this list when
+        the first update following the processing of the order arrives.
+
+    """
+
+    buf = feed_lob.MessageBuffer('line')
+    while True:
+        data = sock.recv(feed_lob.RECV_SIZE)
+        if not data:
+            break
+        now = _lob.monotonic()
+        block, n = buf.feed(data)
+        for line in block.splitlines():
+            num_messages = int(line.split(',', 1)[0])
+            for i in xrange(len(latency), num_messages):
+                latency.append(now-send_times[i])
+
+def latency_stats(latency):
+    """
+    Summarize latencies in seconds as percentiles in microseconds.
+    """
+
+    result = dict(count=len(latency))
+    if len(latency):
+        latency = np.asarray(latency)*1e6
+        result['mean'] = float(np.mean(latency))
+        result['max'] = float(np.max(latency))
+        for p, v in zip(PERCENTILES, np.percentile(latency, PERCENTILES)):
+            result['p%s' % p] = float(v)
+    return result
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 's:f:u:o:')
+    except getopt.GetoptError as e:
+        print e
+        print usage
+        sys.exit(1)
+    opts = dict(opts)
+    if len(args) < 2:
+        print usage
+        sys.exit(0)
+    address = args[0]
+    file_name_list = args[1:]
+    speed = float(opts.get('-s', 1.0))
+    framing = opts.get('-f', feed_lob.FRAMING)
+
+    server = feed_lob.listen(address)
+    sock = feed_lob.accept(server)
+    server.close()
+
+    # The simulation listens on its publish address before it connects to
+    # the feed:
+    send_times = []
+    latency = []
+    updates = None
+    if '-u' in opts:
+        updates = feed_lob.connect(opts['-u'])
+        thread = threading.Thread(target=receive_updates,
+                                  args=(updates, send_times, latency))
+        thread.daemon = True
+        thread.start()
+
+    start = time.time()
+    num_messages = send_orders(sock, file_name_list, speed, framing,
+                               send_times)
+    sock.shutdown(socket.SHUT_WR)
+    if updates is not None:
+        thread.join(UPDATE_TIMEOUT)
+        updates.close()
+    sock.close()
+    print 'Number of messages:           ', num_messages
+    print 'Sending time:                 ', (time.time()-start)
+
+    if updates is not None:
+        stats = latency_stats(latency[:num_messages])
+        print 'Latency (us):                 ', \
+            ' '.join('p%s=%.1f' % (p, stats['p%s' % p]) for p in PERCENTILES \
+                     if 'p%s' % p in stats)
+        if '-o' in opts:
+            with open(opts['-o'], 'w') as f:
+                json.dump(dict(num_messages=num_messages, speed=speed,
+                               framing=framing, latency_us=stats),
+                          f, indent=1, sort_keys=True)
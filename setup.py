@@ -8,6 +8,7 @@ except ImportError:
 
 from setuptools import setup, Extension
 from Cython.Distutils import build_ext
+import numpy
 
 NAME =                 'nseindia_lob'
 VERSION =              '0.01'
@@ -26,7 +27,8 @@ CLASSIFIERS = [
     'Operating System :: OS Independent',
     'Programming Language :: Python']
 
-ext_modules = [Extension('_lob', ['_lob.pyx'])]
+ext_modules = [Extension('_lob', ['_lob.pyx'],
+                         include_dirs=[numpy.get_include()])]
 
 if __name__ == '__main__':
     if os.path.exists('MANIFEST'):
@@ -43,7 +45,6 @@ if __name__ == '__main__':
           license = LICENSE,
           classifiers = CLASSIFIERS,
           install_requires = ['numpy >= 1.7.0',
-                              'odict >= 1.5.0',
                               'pandas >= 0.10',
                               'rbtree >= 0.9.0'],
           ext_modules = ext_modules,
@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+
+"""
+Tests of the limit order book and of the replays done by lob.py.
+"""
+
+# Copyright (c) 2012-2014, Lev Givon
+# All rights reserved.
+# Distributed under the terms of the BSD license:
+# http://www.opensource.org/licenses/bsd-license
+
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+import pandas
+
+# The extension is built in place in the parent directory:
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+import _lob
+import lob as lob_script
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+ORDERS_FILE = os.path.join(ROOT_DIR, 'EXAMPLE-orders.csv')
+
+# The golden events logs were generated by the implementation that preceded
+# the separate visible and hidden price level queues:
+GOLDEN_FILES = {False: os.path.join(DATA_DIR, 'EXAMPLE-events-dense.log'),
+                True: os.path.join(DATA_DIR, 'EXAMPLE-events-sparse.log')}
+
+class TestExampleEvents(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def replay(self, sparse_events, from_frame):
+        """
+        Replay the example orders and return the contents of the events log.
+        """
+
+        events_log_file = os.path.join(self.tmp_dir, 'events.log')
+        lob = _lob.LimitOrderBook(show_output=False,
+                                  sparse_events=sparse_events,
+                                  events_log_file=events_log_file,
+                                  stats_log_file=None,
+                                  daily_stats_log_file=None)
+        if from_frame:
+            lob.process(pandas.read_csv(ORDERS_FILE, names=_lob.col_names))
+        else:
+            for columns in _lob.OrderReader(ORDERS_FILE, 16, lob.tick_size):
+                lob.process_columns(**columns)
+        lob.close()
+        with open(events_log_file, 'rb') as f:
+            return f.read()
+
+    def golden(self, sparse_events):
+        with open(GOLDEN_FILES[sparse_events], 'rb') as f:
+            return f.read()
+
+    def test_dense_events(self):
+        self.assertEqual(self.replay(False, True), self.golden(False))
+
+    def test_sparse_events(self):
+        self.assertEqual(self.replay(True, True), self.golden(True))
+
+    def test_dense_events_reader(self):
+        self.assertEqual(self.replay(False, False), self.golden(False))
+
+    def test_sparse_events_reader(self):
+        self.assertEqual(self.replay(True, False), self.golden(True))
+
+def order_line(n, indicator, activity_type, volume, price, trigger=0.0,
+               mkt_flag='N', on_stop_flag='N', volume_disclosed=0, seq=None,
+               date='03/02/2010'):
+    """
+    Return a line of an order file containing the specified order; the
+    number of the order is determined by its date and sequence number `n` and
+    its time by `seq`, which defaults to `n`.
+    """
+
+    number = '%s%s%s750%05i' % (date[6:], date[:2], date[3:5], n)
+    return ','.join(['RM', 'FAOb', number, date,
+                     '09:15:00.%06i' % (n if seq is None else seq), indicator,
+                     str(activity_type), 'EXAMPLE', 'FUTSTK', '04/22/2010',
+                     '0', 'FF', str(volume_disclosed), str(volume),
+                     '%.2f' % price, '%.2f' % trigger, mkt_flag, on_stop_flag,
+                     'N', '*', '0', '2'])+'\n'
+
+def random_order_lines(count, seed=0, date='03/02/2010'):
+    """
+    Return the order file lines of a random mix of limit and market orders,
+    hidden orders, stop loss orders, cancels, and modifies on the specified
+    date.
+    """
+
+    r = random.Random(seed)
+    lines = []
+    orders = []
+    for seq in xrange(1, count+1):
+        x = r.random()
+        if orders and x < 0.3:
+            n, indicator, price = r.choice(orders)
+            if x < 0.15:
+                args = (n, indicator, 3, 0, price)
+            else:
+                args = (n, indicator, 4, r.randint(1, 10)*10,
+                        round(price+0.05*r.randint(-5, 5), 2))
+            lines.append(order_line(seq=seq, date=date, *args))
+            continue
+        indicator = r.choice('BS')
+        price = round(100+0.05*r.randint(-20, 20), 2)
+        volume = r.randint(1, 10)*10
+        if x < 0.4:
+            trigger = round(price+0.05*r.randint(-10, 10), 2)
+            lines.append(order_line(seq, indicator, 1, volume, price, trigger,
+                                    on_stop_flag='Y', date=date))
+        elif x < 0.55:
+            lines.append(order_line(seq, indicator, 1, volume, price,
+                                    volume_disclosed=volume//2, date=date))
+        else:
+            lines.append(order_line(seq, indicator, 1, volume, price,
+                                    mkt_flag='Y' if x > 0.95 else 'N',
+                                    date=date))
+        orders.append((seq, indicator, price))
+    return lines
+
+class TestStopLossOrders(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.events_log_file = os.path.join(self.tmp_dir, 'events.log')
+        self.lob = _lob.LimitOrderBook(show_output=False,
+                                       sparse_events=False,
+                                       events_log_file=self.events_log_file,
+                                       stats_log_file=None,
+                                       daily_stats_log_file=None)
+        self.num_files = 0
+        self.num_events = 0
+
+    def tearDown(self):
+        self.lob.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def process(self, *lines):
+        """
+        Process the specified order file lines and return the sequence number,
+        action, original flag, price, and volume of each event recorded while
+        processing them.
+        """
+
+        self.num_files += 1
+        file_name = os.path.join(self.tmp_dir,
+                                 'orders-%i.csv' % self.num_files)
+        with open(file_name, 'wb') as f:
+            f.writelines(lines)
+        for columns in _lob.OrderReader(file_name, 16, self.lob.tick_size):
+            self.lob.process_columns(**columns)
+        self.lob.flush()
+        with open(self.events_log_file, 'rb') as f:
+            events = [(int(row[2]) % 100000, row[5], row[6], float(row[7]),
+                       int(row[8])) for row in csv.reader(f)]
+        self.num_events, events = len(events), events[self.num_events:]
+        return events
+
+    def state(self):
+        """
+        Return the sequence numbers of the resting orders and the sequence
+        numbers and trigger prices of the pending stop loss orders.
+        """
+
+        file_name = os.path.join(self.tmp_dir, 'checkpoint.npz')
+        self.lob.save_checkpoint(file_name)
+        header, levels, orders, stops = _lob.read_checkpoint(file_name)
+        return sorted(orders['order_number'] % 100000), \
+            [(n % 100000, round(trigger*self.lob.tick_size, 2)) \
+             for n, trigger in zip(stops['order_number'], stops['trigger'])]
+
+    def setup_book(self):
+        """
+        Add resting asks at 101 and 102, a resting bid at 99, and a buy stop
+        loss order triggered at 100.5 with a limit price of 102.
+        """
+
+        return self.process(order_line(1, 'S', 1, 100, 101.0),
+                            order_line(2, 'S', 1, 50, 102.0),
+                            order_line(3, 'B', 1, 100, 99.0),
+                            order_line(4, 'B', 1, 50, 102.0, 100.5,
+                                       on_stop_flag='Y'))
+
+    def test_held_until_triggered(self):
+        events = self.setup_book()
+        self.assertEqual(events[-1], (4, 'add', 'Y', 102.0, 50))
+        self.assertEqual(self.state(), ([1, 2, 3], [(4, 100.5)]))
+
+        # Trades that do not reach the trigger price don't release the order:
+        events = self.process(order_line(5, 'S', 1, 10, 99.0))
+        self.assertEqual([e[1] for e in events], ['add', 'trade'])
+        self.assertEqual(self.state(), ([1, 2, 3], [(4, 100.5)]))
+
+        # The order is released by the trade at 101 and then trades with the
+        # ask at 102 as an order generated by the LOB:
+        events = self.process(order_line(6, 'B', 1, 100, 101.0))
+        self.assertEqual(events,
+                         [(6, 'add', 'Y', 101.0, 100),
+                          (6, 'trade', 'Y', 101.0, 100),
+                          (4, 'add', 'N', 102.0, 50),
+                          (4, 'trade', 'N', 102.0, 50)])
+        self.assertEqual(self.state(), ([3], []))
+
+    def test_triggered_stop_added_immediately(self):
+        self.process(order_line(1, 'S', 1, 100, 101.0),
+                     order_line(2, 'S', 1, 50, 102.0),
+                     order_line(3, 'B', 1, 10, 101.0))
+        events = self.process(order_line(4, 'B', 1, 50, 102.0, 100.5,
+                                         on_stop_flag='Y'))
+        self.assertEqual(events,
+                         [(4, 'add', 'Y', 102.0, 50),
+                          (4, 'trade', 'Y', 101.0, 50)])
+        self.assertEqual(self.state(), ([1, 2], []))
+
+    def test_cancel_pending_stop(self):
+        self.setup_book()
+        events = self.process(order_line(4, 'B', 3, 50, 102.0, 100.5,
+                                          on_stop_flag='Y'))
+        self.assertEqual(events, [(4, 'cancel', 'Y', 102.0, 50)])
+        self.assertEqual(self.state(), ([1, 2, 3], []))
+
+        # The cancelled order is not released by a trade at its trigger:
+        events = self.process(order_line(5, 'B', 1, 100, 101.0))
+        self.assertEqual([e[0] for e in events], [5, 5])
+        self.assertEqual(self.state(), ([2, 3], []))
+
+    def test_modify_pending_stop(self):
+        self.setup_book()
+        events = self.process(order_line(4, 'B', 4, 50, 102.0, 101.5,
+                                          on_stop_flag='Y'))
+        self.assertEqual(events, [(4, 'modify', 'Y', 102.0, 50)])
+        self.assertEqual(self.state(), ([1, 2, 3], [(4, 101.5)]))
+
+        # The trade at 101 no longer reaches the trigger price:
+        self.process(order_line(5, 'B', 1, 100, 101.0))
+        self.assertEqual(self.state(), ([2, 3], [(4, 101.5)]))
+
+        # An order that is modified so that it is no longer a stop loss
+        # order is added to the book immediately:
+        events = self.process(order_line(4, 'B', 4, 50, 101.0))
+        self.assertEqual(events,
+                         [(4, 'add', 'N', 101.0, 50),
+                          (4, 'modify', 'Y', 101.0, 50)])
+        self.assertEqual(self.state(), ([2, 3, 4], []))
+
+    def test_market_modify_pending_stop(self):
+        self.setup_book()
+
+        # A market modify of a pending stop loss order replaces the held
+        # order rather than being added to the book:
+        events = self.process(order_line(4, 'B', 4, 50, 102.0, 101.5,
+                                          mkt_flag='Y', on_stop_flag='Y'))
+        self.assertEqual([e[1] for e in events], ['modify'])
+        self.assertEqual(self.state(), ([1, 2, 3], [(4, 101.5)]))
+
+        # The trade at 101 no longer reaches the trigger price:
+        self.process(order_line(5, 'B', 1, 100, 101.0))
+        self.assertEqual(self.state(), ([2, 3], [(4, 101.5)]))
+
+        # The held market order takes the ask at 102 once it is released by
+        # the trade at 101.5:
+        events = self.process(order_line(6, 'S', 1, 10, 101.5),
+                              order_line(7, 'B', 1, 10, 101.5))
+        self.assertEqual([e[:3] for e in events[-4:]],
+                         [(7, 'add', 'Y'),
+                          (7, 'trade', 'Y'),
+                          (4, 'add', 'N'),
+                          (4, 'trade', 'N')])
+        self.assertEqual(events[-1][3:], (102.0, 50))
+        self.assertEqual(self.state(), ([3], []))
+
+    def test_stats_on_arrival_and_release(self):
+        self.process(order_line(1, 'S', 1, 100, 101.0),
+                     order_line(2, 'S', 1, 50, 102.0))
+        stats = self.lob.daily_stats
+
+        # The arrival of a held order is counted as an original order:
+        events = self.process(order_line(3, 'B', 1, 50, 102.0, 100.5,
+                                         on_stop_flag='Y'))
+        self.assertEqual(events, [(3, 'add', 'Y', 102.0, 50)])
+        self.assertEqual(self.lob.daily_stats['num_orders'],
+                         stats['num_orders']+1)
+        self.assertEqual(self.lob.daily_stats['num_trades'], 0)
+
+        # The events of the released order are generated by the LOB, so they
+        # are not counted as orders, but its trades are counted:
+        stats = self.lob.daily_stats
+        events = self.process(order_line(4, 'B', 1, 100, 101.0))
+        self.assertEqual([e[2] for e in events], ['Y', 'Y', 'N', 'N'])
+        self.assertEqual(self.lob.daily_stats['num_orders'],
+                         stats['num_orders']+2)
+        self.assertEqual(self.lob.daily_stats['num_trades'], 2)
+        self.assertEqual(self.lob.daily_stats['trade_volume_total'], 150)
+        self.assertEqual(self.lob.daily_stats['trade_price_mean'], 101.5)
+
+class TestBookState(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        lines = random_order_lines(2000)
+        self.orders_files = []
+        for i, part in enumerate((lines[:1000], lines[1000:])):
+            file_name = os.path.join(self.tmp_dir, 'orders-%i.csv' % i)
+            with open(file_name, 'wb') as f:
+                f.writelines(part)
+            self.orders_files.append(file_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_lob(self, name):
+        events_log_file = os.path.join(self.tmp_dir, 'events-%s.log' % name)
+        return _lob.LimitOrderBook(show_output=False, sparse_events=False,
+                                   events_log_file=events_log_file,
+                                   stats_log_file=None,
+                                   daily_stats_log_file=None)
+
+    def process(self, lob, file_name):
+        for columns in _lob.OrderReader(file_name, 64, lob.tick_size):
+            lob.process_columns(**columns)
+
+    def read_events(self, *names):
+        result = ''
+        for name in names:
+            with open(os.path.join(self.tmp_dir,
+                                   'events-%s.log' % name), 'rb') as f:
+                result += f.read()
+        return result
+
+    def replay(self):
+        """
+        Replay both halves of the input with a single book and return the
+        daily stats of the book.
+        """
+
+        lob = self.create_lob('full')
+        for file_name in self.orders_files:
+            self.process(lob, file_name)
+        lob.close()
+        return lob.daily_stats
+
+    def save(self, lob, name):
+        """
+        Save a checkpoint of a book and return its contents.
+        """
+
+        file_name = os.path.join(self.tmp_dir, '%s.npz' % name)
+        lob.save_checkpoint(file_name)
+        header, levels, orders, stops = _lob.read_checkpoint(file_name)
+        return header, levels.tolist(), orders.tolist(), stops.tolist()
+
+    def test_checkpoint(self):
+        daily_stats = self.replay()
+
+        file_name = os.path.join(self.tmp_dir, 'checkpoint.npz')
+        lob = self.create_lob('first')
+        self.process(lob, self.orders_files[0])
+        lob.save_checkpoint(file_name, dict(position=1000))
+        lob.close()
+
+        # The state saved must include hidden orders and pending stop loss
+        # orders for the test to be meaningful:
+        header, levels, orders, stops = _lob.read_checkpoint(file_name)
+        self.assertTrue((orders['volume_disclosed'] > 0).any())
+        self.assertTrue(len(stops) > 0)
+
+        lob = self.create_lob('second')
+        self.assertEqual(lob.load_checkpoint(file_name), dict(position=1000))
+        self.process(lob, self.orders_files[1])
+        lob.close()
+        self.assertEqual(self.read_events('first', 'second'),
+                         self.read_events('full'))
+        self.assertEqual(lob.daily_stats, daily_stats)
+
+    def test_fork(self):
+        daily_stats = self.replay()
+
+        lob = self.create_lob('first')
+        self.process(lob, self.orders_files[0])
+        lob.flush()
+        state = self.save(lob, 'parent')
+        self.assertTrue(len(state[3]) > 0)
+
+        # Processing orders in the fork produces the same output as an
+        # unforked book and doesn't change the state of the parent:
+        fork = lob.fork(events_log_file=os.path.join(self.tmp_dir,
+                                                     'events-fork.log'))
+        self.assertEqual(self.save(fork, 'fork'), state)
+        self.process(fork, self.orders_files[1])
+        fork.close()
+        self.assertEqual(self.read_events('first', 'fork'),
+                         self.read_events('full'))
+        self.assertEqual(fork.daily_stats, daily_stats)
+        self.assertEqual(self.save(lob, 'parent'), state)
+
+        # Processing orders in the parent doesn't change the fork either:
+        fork = lob.fork()
+        self.process(lob, self.orders_files[1])
+        lob.close()
+        self.assertEqual(self.read_events('first'), self.read_events('full'))
+        self.assertEqual(lob.daily_stats, daily_stats)
+        self.assertEqual(self.save(fork, 'fork'), state)
+
+class TestReplayDays(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.orders_files = []
+        for i, date in enumerate(('03/02/2010', '03/03/2010', '03/04/2010')):
+            file_name = os.path.join(self.tmp_dir, 'orders-%i.csv' % i)
+            with open(file_name, 'wb') as f:
+                f.writelines(random_order_lines(1000, i, date))
+            self.orders_files.append(file_name)
+        self.settings = lob_script.INSTRUMENT, lob_script.USE_CACHE
+        lob_script.INSTRUMENT = True
+        lob_script.USE_CACHE = False
+
+    def tearDown(self):
+        lob_script.INSTRUMENT, lob_script.USE_CACHE = self.settings
+        shutil.rmtree(self.tmp_dir)
+
+    def log_file_names(self, name):
+        return [os.path.join(self.tmp_dir, '%s-%s.log' % (log, name)) \
+                for log in ('events', 'daily_stats')]
+
+    def read_logs(self, name):
+        result = []
+        for file_name in self.log_file_names(name):
+            with open(file_name, 'rb') as f:
+                result.append(f.read())
+        return result
+
+    def test_counters(self):
+        lob = lob_script.create_lob(*self.log_file_names('serial'))
+        lob_script.replay(lob, self.orders_files)
+        lob.record_daily_stats(lob.day)
+        lob.close()
+        events_log_file, daily_stats_log_file = \
+            self.log_file_names('parallel')
+        daily_stats, counters = \
+            lob_script.replay_days(self.orders_files, events_log_file,
+                                   daily_stats_log_file, 3)
+        self.assertEqual(self.read_logs('parallel'), self.read_logs('serial'))
+        self.assertEqual(daily_stats, lob.daily_stats)
+
+        # The timers differ between runs:
+        serial = lob.counters.as_dict()
+        parallel = counters.as_dict()
+        for k in serial.keys():
+            if k.endswith('_time'):
+                del serial[k], parallel[k]
+        self.assertEqual(parallel, serial)
+
+if __name__ == '__main__':
+    unittest.main()